@@ -0,0 +1,195 @@
+import threading
+import time
+from collections import deque
+
+"""
+Admission control:
+A dealer plays at most max_sessions sessions at once. A session that comes in while all the slots are taken waits
+in a bounded backlog for one to free up; when the backlog is full too (or the wait runs out) it is turned away at
+once, so an overloaded dealer sheds the extra players instead of slowing every session down.
+Pre-fork workers can share their slots through one session count: a session waiting in one worker then looks at the
+count every ADMISSION_POLL seconds, and takes a slot freed by any of the workers.
+"""
+
+ADMISSION_POLL = 0.05  # Seconds between two looks at the shared session count while a session waits
+
+
+class AdmissionController:
+    """
+        Counts the sessions being played and decides whether a new one may start.
+    """
+
+    def __init__(self, max_sessions=0, backlog=0, queue_timeout=10.0, shared=None, shared_capacity=0):
+        """
+                Args:
+                    max_sessions (int): Sessions played at once (0 = no limit).
+                    backlog (int): Sessions that may wait for a free slot. Beyond that they are turned away.
+                    queue_timeout (float): Seconds a session waits in the backlog before it is turned away.
+                    shared (multiprocessing.Value): An active session count shared by several processes (pre-fork
+                                                    workers) that this controller keeps up to date and announces.
+                    shared_capacity (int): The slots of all the processes sharing the count. If set, a session takes
+                                           any of them, not only one of this controller's max_sessions.
+        """
+        self.max_sessions = max_sessions
+        self.backlog = backlog
+        self.queue_timeout = queue_timeout
+        self.shared = shared
+        self.shared_capacity = shared_capacity if shared is not None else 0
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.parked = deque()  # (deadline, job) of the sessions waiting without a thread, see `park`
+        self.changed = threading.Condition()
+
+    def __reduce__(self):
+        # Only the settings travel to another process, the counts start from zero there
+        return type(self), (self.max_sessions, self.backlog, self.queue_timeout, self.shared, self.shared_capacity)
+
+    def has_slot(self):
+        if not self.max_sessions:
+            return True
+        if self.shared_capacity:
+            return self.shared.value < self.shared_capacity
+        return self.active < self.max_sessions
+
+    def take_slot(self):
+        """
+                Takes a slot if one is free - checked and taken at once, also against the other processes.
+
+                Returns:
+                    bool: False if every slot is taken.
+        """
+        if self.shared is None:
+            if not self.has_slot():
+                return False
+            self.active += 1
+            return True
+        with self.shared.get_lock():
+            if not self.has_slot():
+                return False
+            self.active += 1
+            self.shared.value += 1
+        return True
+
+    def free_slot(self):
+        self.active -= 1
+        if self.shared is not None:
+            with self.shared.get_lock():
+                self.shared.value -= 1
+
+    def wait_step(self, remaining):
+        """
+                Returns:
+                    float: Seconds to wait for a `leave` before looking at the slots again - a slot freed in another
+                           process wakes nobody here, so with a shared count they are looked at every ADMISSION_POLL.
+        """
+        return min(remaining, ADMISSION_POLL) if self.shared_capacity else remaining
+
+    def can_wait(self):
+        """
+                Returns True if a session without a slot may join the backlog (counts it as turned away if not).
+        """
+        if self.waiting < self.backlog:
+            return True
+        self.rejected += 1
+        return False
+
+    def enter(self):
+        """
+                Takes a slot for a new session, waiting in the backlog if they are all taken.
+
+                Returns:
+                    bool: True if the session may start (call `leave` when it ends), False if it is turned away.
+        """
+        with self.changed:
+            if self.take_slot():
+                return True
+            if not self.can_wait():
+                return False
+            self.waiting += 1
+            deadline = time.monotonic() + self.queue_timeout
+            try:
+                while not self.take_slot():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.rejected += 1
+                        return False
+                    self.changed.wait(self.wait_step(remaining))
+            finally:
+                self.waiting -= 1
+            return True
+
+    def try_enter(self):
+        """
+                Takes a slot for a new session if one is free, without waiting.
+
+                Returns:
+                    bool: True if the session may start (call `leave` when it ends).
+        """
+        with self.changed:
+            return self.take_slot()
+
+    def park(self, job):
+        """
+                Puts a session that found every slot taken in the backlog, without a thread waiting for it:
+                `unpark` hands it a slot later, or turns it away.
+
+                Args:
+                    job: What the caller needs to start the session.
+
+                Returns:
+                    bool: False if the backlog is full (the session is turned away).
+        """
+        with self.changed:
+            if not self.can_wait():
+                return False
+            self.waiting += 1
+            self.parked.append((time.monotonic() + self.queue_timeout, job))
+            return True
+
+    def unpark(self):
+        """
+                Hands the free slots to the parked sessions, oldest first, and turns away the ones that waited
+                longer than queue_timeout.
+
+                Returns:
+                    tuple: (list of the jobs admitted - a slot is taken for each, list of the jobs turned away).
+        """
+        admitted, expired = [], []
+        with self.changed:
+            now = time.monotonic()
+            while self.parked:
+                deadline, job = self.parked[0]
+                if deadline <= now:
+                    self.rejected += 1
+                    expired.append(job)
+                elif self.take_slot():
+                    admitted.append(job)
+                else:
+                    break
+                self.parked.popleft()
+                self.waiting -= 1
+        return admitted, expired
+
+    def leave(self):
+        """
+                Frees the slot of a session that ended.
+        """
+        with self.changed:
+            self.free_slot()
+            self.changed.notify()
+
+    def saturated(self):
+        """
+                Returns True if every slot is taken.
+        """
+        active, capacity = self.load()
+        return bool(capacity) and active >= capacity
+
+    def load(self):
+        """
+                Returns:
+                    tuple: (active sessions, max sessions - 0 = no limit), over all the processes if shared.
+        """
+        active = self.shared.value if self.shared is not None else self.active
+        return max(0, active), self.max_sessions
@@ -0,0 +1,719 @@
+import argparse
+import asyncio
+import socket
+import threading
+import time
+
+from Admission import AdmissionController
+from Capture import CaptureWriter
+from Cards import RNG_KINDS
+from Dealer import Dealer, REQUEST_BODY_SIZE, STEP_DECIDE, STEP_SEND
+from EventLog import EventLog
+from History import HistoryWriter
+from Mux import MUX_REFUSED_TYPES, body_size
+from Pacing import Pacing
+from Protocol import (DECISION_SIZE, FrameBuffer, HEADER_STRUCT, MAGIC_COOKIE, MSG_TYPE_MUX,
+                      MSG_TYPE_RESUMABLE_REQUEST, MSG_TYPE_RESUME, MSG_TYPE_SESSION, MUX_HEADER_STRUCT, PAYLOAD_STRUCT,
+                      SESSION_BODY_STRUCT, set_nodelay)
+from Resume import session_message
+from Timers import Deadlines
+
+"""
+The asyncio Dealer:
+Runs the same offer / request / payload protocol as Dealer, but every player session is a coroutine on a single
+event loop instead of a dedicated thread. A waiting player costs a few KB (stream buffers + coroutine frame)
+instead of a whole thread stack, so one dealer process can hold many thousands of sessions at once.
+The dealer's Deadlines are kept by the event loop's own timer heap (asyncio.wait_for), with the same rules as the
+threaded dealer.
+"""
+
+
+class MuxStreamWriter:
+    """
+        The writer of one session on a multiplexed connection: payloads written to it go out as mux messages
+        on the shared writer.
+    """
+
+    def __init__(self, writer, session_id, sessions, reader):
+        """
+                Args:
+                    writer (asyncio.StreamWriter): The shared connection's writer.
+                    session_id (int): The session's id.
+                    sessions (dict): The connection's session id -> StreamReader map (the session leaves it on close).
+                    reader (asyncio.StreamReader): The session's reader in that map.
+        """
+        self.writer = writer
+        self.session_id = session_id
+        self.sessions = sessions
+        self.reader = reader
+        self.prefix = MUX_HEADER_STRUCT.pack(MAGIC_COOKIE, MSG_TYPE_MUX, session_id)
+
+    def write(self, data):
+        frames = bytearray()
+        for start in range(0, len(data), PAYLOAD_STRUCT.size):
+            frames += self.prefix
+            frames += data[start + 4:start + PAYLOAD_STRUCT.size]  # Drop the cookie (4 bytes)
+        self.writer.write(frames)
+
+    async def drain(self):
+        await self.writer.drain()
+
+    def get_extra_info(self, name, default=None):
+        return self.writer.get_extra_info(name, default)
+
+    def close(self):
+        # Like MuxDemultiplexer.forget: the id may already belong to a newer session
+        if self.sessions.get(self.session_id) is self.reader:
+            del self.sessions[self.session_id]
+
+    async def wait_closed(self):
+        pass
+
+
+class AsyncResumableSession:
+    """
+        The asyncio version of Resume.ResumableSession: a reader and writer in one whose connection can be
+        replaced when the player resumes.
+    """
+
+    def __init__(self, registry, reader, writer, team):
+        """
+                Args:
+                    registry (SessionRegistry): The dealer's resumable sessions (gives the token).
+                    reader (asyncio.StreamReader): The first connection's incoming stream.
+                    writer (asyncio.StreamWriter): The first connection's outgoing stream.
+                    team (str): The team name.
+        """
+        self.registry = registry
+        self.reader = reader
+        self.writer = writer
+        self.team = team
+        self.token = registry.register(self)
+        self.generation = 0  # Bumped every time the connection is replaced
+        self.sent = bytearray()
+        self.received = 0
+        self.closed = False
+        self.resumes = 0
+        self.changed = asyncio.Event()  # Set (and replaced) when the connection is replaced or the session closed
+
+    async def readexactly(self, n):
+        """
+                Reads like StreamReader.readexactly. A dropped connection waits for the player to resume.
+
+                Raises:
+                    asyncio.IncompleteReadError: If the player did not come back within the grace window.
+        """
+        while True:
+            reader, generation = self.reader, self.generation
+            try:
+                data = await reader.readexactly(n)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                if not await self.wait_for_resume(generation):
+                    raise asyncio.IncompleteReadError(b"", n)
+                continue
+            if self.generation == generation:
+                self.received += n
+                return data
+            # Read from a replaced connection after the resume counted - the player sends it again
+
+    def write(self, data):
+        self.sent += data
+        if not self.writer.is_closing():
+            self.writer.write(data)
+
+    async def drain(self):
+        """
+                Drains like StreamWriter.drain. If the connection dropped, waits for the resume (which sends the data).
+
+                Raises:
+                    ConnectionResetError: If the player did not come back within the grace window.
+        """
+        generation = self.generation
+        try:
+            await self.writer.drain()
+        except ConnectionError:
+            if not await self.wait_for_resume(generation):
+                raise ConnectionResetError("The player did not resume the session")
+
+    async def wait_for_resume(self, generation):
+        """
+                Waits up to the grace window for the connection to be replaced.
+
+                Args:
+                    generation (int): The generation of the connection that failed.
+
+                Returns:
+                    bool: True if a new connection is in place.
+        """
+        if self.generation == generation and not self.closed:
+            try:
+                await asyncio.wait_for(self.changed.wait(), self.registry.grace)
+            except asyncio.TimeoutError:
+                pass
+        return self.generation != generation and not self.closed
+
+    def resume(self, reader, writer, received):
+        """
+                Replaces the connection: answers the resume with the bytes received so far and sends the player
+                everything after the `received` bytes it already has. A finished session sends that and closes.
+
+                Returns:
+                    bool: True if the session moved to the new connection.
+        """
+        if received > len(self.sent):
+            return False
+        old = self.writer
+        writer.write(session_message(MSG_TYPE_SESSION, self.token, self.received) + self.sent[received:])
+        if self.closed:
+            writer.close()
+            return True
+        self.reader, self.writer = reader, writer
+        self.generation += 1
+        self.resumes += 1
+        self.wake()
+        old.close()  # Ends a read still waiting on the old connection
+        return True
+
+    def wake(self):
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    def get_extra_info(self, name, default=None):
+        return self.writer.get_extra_info(name, default)
+
+    def close(self):
+        """
+                Ends the session: from now on a resume only gets the bytes the player missed.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self.wake()
+        self.registry.finish(self.token)
+        self.writer.close()
+
+    async def wait_closed(self):
+        try:
+            await self.writer.wait_closed()
+        except Exception:
+            pass
+
+
+class AsyncAdmissionController(AdmissionController):
+    """
+        The asyncio version of AdmissionController: sessions wait in the backlog without blocking the event loop.
+        Only used from the loop's thread.
+    """
+
+    def __init__(self, max_sessions=0, backlog=0, queue_timeout=10.0, shared=None, shared_capacity=0):
+        super().__init__(max_sessions, backlog, queue_timeout, shared, shared_capacity)
+        self.freed = None  # asyncio.Condition, made on the loop that uses it
+        self.wakeups = set()  # The loop only keeps weak references to its tasks
+
+    async def enter(self):
+        """
+                Takes a slot for a new session, waiting in the backlog if they are all taken.
+
+                Returns:
+                    bool: True if the session may start (call `leave` when it ends), False if it is turned away.
+        """
+        if self.take_slot():
+            return True
+        if not self.can_wait():
+            return False
+        if self.freed is None:
+            self.freed = asyncio.Condition()
+        self.waiting += 1
+        deadline = time.monotonic() + self.queue_timeout
+        try:
+            async with self.freed:
+                while not self.take_slot():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.rejected += 1
+                        return False
+                    try:
+                        await asyncio.wait_for(self.freed.wait(), self.wait_step(remaining))
+                    except asyncio.TimeoutError:
+                        pass  # Look again: the slot may have been freed by another process
+        finally:
+            self.waiting -= 1
+        return True
+
+    def leave(self):
+        self.free_slot()
+        if self.freed is not None and self.waiting:
+            wakeup = asyncio.create_task(self.wake_one())
+            self.wakeups.add(wakeup)
+            wakeup.add_done_callback(self.wakeups.discard)
+
+    async def wake_one(self):
+        async with self.freed:
+            self.freed.notify()
+
+
+class AsyncDealer(Dealer):
+    """
+        A Dealer whose sessions run as coroutines on one asyncio (selectors based) event loop.
+    """
+
+    def __init__(self, pacing=None, stats_queue=None, decks=1, penetration=0.75, tcp_nodelay=True, log=None,
+                 metrics=None, history=None, resume_grace=30.0, admission=None, hit_soft_17=False, seed=None,
+                 rng_kind="mt", deadlines=None, capture=None):
+        """
+             Initializes the AsyncDealer instance.
+             It has no worker pool and no tables: every session is a coroutine, played alone.
+
+             Args:
+                 pacing (Pacing): How long to pause between rounds. Defaults to FixedPacing(1.0).
+                 stats_queue (multiprocessing.Queue): Where finished sessions are reported (see Dealer).
+                 decks (int): Number of decks in every session's shoe (1-8).
+                 penetration (float): Part of the shoe dealt before it is reshuffled.
+                 tcp_nodelay (bool): Turn Nagle's algorithm off on player connections.
+                 log (EventLog): Where the game events go (see Dealer).
+                 metrics (DealerMetrics): The counters and histograms the dealer updates (see Dealer).
+                 history (HistoryWriter): If set, every round played is appended to this history log.
+                 resume_grace (float): Seconds a resumable session waits for its player to reconnect.
+                 admission (AsyncAdmissionController): Limits the sessions played at once. Defaults to no limit.
+                 hit_soft_17 (bool): The dealer hits a soft 17 instead of standing on it.
+                 seed (int): Derive every shoe's seed from this one (see Dealer).
+                 rng_kind (str): The shoes' random generator, one of Cards.RNG_KINDS.
+                 deadlines (Deadlines): How long to wait for the players (see Dealer).
+                 capture (CaptureWriter): If set, the traffic of every connection and the offers are recorded
+                                          (see Dealer).
+        """
+        super().__init__(pacing, stats_queue, decks, penetration, tcp_nodelay, log, metrics, history, resume_grace,
+                         admission if admission is not None else AsyncAdmissionController(), hit_soft_17=hit_soft_17,
+                         seed=seed, rng_kind=rng_kind, capture=capture, deadlines=deadlines)
+        self.server = None
+
+    async def all_recv(self, reader, n, deadline=None):
+        """
+                Reads exactly n bytes from the stream.
+
+                Args:
+                    reader (asyncio.StreamReader): The player's stream.
+                    n (int): Number of bytes to read.
+                    deadline (float): Give up at this time.monotonic() (None = wait as long as it takes).
+
+                Returns:
+                    bytes: The data, or None if the connection was closed.
+
+                Raises:
+                    asyncio.TimeoutError: If the deadline passed first.
+        """
+        try:
+            if deadline is None:
+                data = await reader.readexactly(n)
+            else:
+                data = await asyncio.wait_for(reader.readexactly(n), max(0.0, deadline - time.monotonic()))
+            self.metrics.bytes_received.inc(n)
+            return data
+        except asyncio.IncompleteReadError:
+            self.log.debug("recv_closed", "Connection closed before receiving full data")
+            return None
+        except (ConnectionResetError, ConnectionAbortedError):
+            return None
+
+    async def send_payload_card(self, writer, result, card):
+        """
+        result: 0x0 / 0x1 / 0x2 / 0x3
+        card: Card object
+        """
+        writer.write(self.pack_payload_card(result, card))
+        await writer.drain()
+
+    async def send_frames(self, writer, out):
+        """
+                Writes everything collected in a FrameBuffer with a single write.
+
+                Args:
+                    writer (asyncio.StreamWriter): The player's outgoing stream.
+                    out (FrameBuffer): The collected payloads.
+
+                Returns:
+                    int: Number of bytes written.
+        """
+        data = out.take()
+        writer.write(data)
+        await writer.drain()
+        return len(data)
+
+    async def handle_player(self, reader, writer):  # payload, request
+        """
+            Handles the communication session with a single connected player.
+            Same semantics as Dealer.handle_player.
+
+            Args:
+                reader (asyncio.StreamReader): The player's incoming stream.
+                writer (asyncio.StreamWriter): The player's outgoing stream.
+        """
+        team_name = "Unknown"
+        handed_over = False  # The connection now belongs to a resumed session
+        addr = writer.get_extra_info('peername')
+        set_nodelay(writer.get_extra_info('socket'), self.tcp_nodelay)
+        if self.capture is not None:
+            reader, writer = self.capture.wrap_streams(reader, writer, addr)
+        request_end = time.monotonic() + self.deadlines.request
+        try:
+            # header = magic cookie 4 + type 1 = 5
+            header_data = await self.all_recv(reader, HEADER_STRUCT.size, request_end)
+            if header_data is None:
+                self.log.info("connection_lost", "Connection lost while waiting for header.", addr=addr)
+                return
+
+            cookie, msg_type = HEADER_STRUCT.unpack(header_data)
+
+            # Check the Magic Cookie:
+            if cookie != MAGIC_COOKIE:
+                self.log.warning("invalid_cookie", "Invalid Cookie: {cookie}. Kicking player out!", cookie=hex(cookie),
+                                 addr=addr)
+                self.metrics.protocol_violations.inc()
+                return
+
+            # check the type:
+            if msg_type in REQUEST_BODY_SIZE:
+                remaining_data = await self.all_recv(reader, REQUEST_BODY_SIZE[msg_type], request_end)
+                if remaining_data is None:
+                    self.log.warning("incomplete_request", "Incomplete request packet", addr=addr)
+                    self.metrics.protocol_violations.inc()
+                    return
+
+                rounds, team_name, requested_ms = self.unpack_request(msg_type, remaining_data)
+
+                if not await self.admit(team_name, addr):
+                    return
+
+                self.log.info("session_start", "{team} connected requesting {rounds} rounds.\nWelcome to the Game {team}!",
+                              team=team_name, rounds=rounds, pacing_ms=requested_ms)
+
+                # step 4
+                session = None
+                self.metrics.sessions.inc()
+                self.metrics.sessions_active.inc()
+                try:
+                    if msg_type == MSG_TYPE_RESUMABLE_REQUEST:
+                        # Played on a session that outlives this connection
+                        session = AsyncResumableSession(self.resumable_sessions, reader, writer, team_name)
+                        writer.write(session_message(MSG_TYPE_SESSION, session.token, 0))
+                        reader = writer = session
+                    statistics = await self.play(reader, writer, rounds, team_name,
+                                                 self.pacing.session_delay(requested_ms))
+                finally:
+                    self.metrics.sessions_active.dec()
+                    self.admission.leave()
+                    if session is not None:
+                        session.close()
+                self.report_session(team_name, statistics)
+
+            elif msg_type == MSG_TYPE_RESUME:
+                team_name, handed_over = await self.resume_session(reader, writer, addr)
+
+            elif msg_type == MSG_TYPE_MUX:
+                team_name = f"multiplexed players {addr}"
+                await self.handle_mux(reader, writer, addr)
+
+            else:
+                self.log.warning("unknown_type", "Unknown message type: {msg_type}", msg_type=msg_type, addr=addr)
+                self.metrics.protocol_violations.inc()
+
+        except asyncio.TimeoutError:
+            self.request_timed_out(addr)  # Only the request is read with a deadline here
+
+        except Exception as e:
+            self.log.error("session_error", "Error handling player {addr}: {error}", addr=addr, error=str(e))
+
+        finally:
+            if not handed_over:
+                writer.close()
+                try:
+                    await writer.wait_closed()
+                except Exception:
+                    pass
+
+        self.log.info("connection_closed", "Connection with {team} closed.", team=team_name)
+
+    async def admit(self, team, addr):
+        """
+                Asks the admission controller for a slot for a new session (see Dealer.admit).
+
+                Returns:
+                    bool: True if the session may start (call `self.admission.leave()` when it ends).
+        """
+        self.metrics.sessions_waiting.inc()
+        try:
+            admitted = await self.admission.enter()
+        finally:
+            self.metrics.sessions_waiting.dec()
+        if not admitted:
+            self.metrics.sessions_rejected.inc()
+            self.log.warning("session_rejected", "Dealer is full, turning {team} away.", team=team, addr=addr)
+        return admitted
+
+    async def resume_session(self, reader, writer, addr):
+        """
+            Moves a resumable session to the player's new connection. The session's own task goes on playing
+            on it; this one returns right away.
+            Same semantics as Dealer.resume_session.
+
+            Args:
+                reader (asyncio.StreamReader): The new connection's incoming stream, its header already read.
+                writer (asyncio.StreamWriter): The new connection's outgoing stream.
+                addr (tuple): The client's (IP, Port).
+
+            Returns:
+                tuple: (the session's team name, True if the connection was handed over to the session).
+        """
+        body = await self.all_recv(reader, SESSION_BODY_STRUCT.size, time.monotonic() + self.deadlines.request)
+        if body is None:
+            self.log.warning("incomplete_request", "Incomplete resume packet", addr=addr)
+            self.metrics.protocol_violations.inc()
+            return "Unknown", False
+        token, received = SESSION_BODY_STRUCT.unpack(body)
+        session = self.resumable_sessions.get(token)
+        if session is None:
+            self.log.info("resume_rejected", "Unknown or expired session from {addr}, closing.", addr=addr)
+            return "Unknown", False
+        if not session.resume(reader, writer, received):
+            self.log.info("resume_rejected", "Session of {team} cannot be resumed, closing.", team=session.team)
+            return "Unknown", False
+        self.metrics.sessions_resumed.inc()
+        self.log.info("session_resumed", "{team} reconnected from {addr}, resuming the session.", team=session.team,
+                      addr=addr)
+        return session.team, True
+
+    async def handle_mux(self, reader, writer, addr):
+        """
+            Serves a multiplexed connection: every session on it gets its own StreamReader (fed with its plain
+            messages) and MuxStreamWriter, and is handled by a `handle_player` task.
+
+            Args:
+                reader (asyncio.StreamReader): The shared connection's incoming stream, the first mux header read.
+                writer (asyncio.StreamWriter): The shared connection's outgoing stream.
+                addr (tuple): The client's (IP, Port).
+        """
+        sessions = {}  # session id -> StreamReader
+        tasks = set()
+        header_read = True
+        try:
+            while True:
+                try:
+                    if not header_read:
+                        header = await self.read_mux(reader, HEADER_STRUCT.size, sessions)
+                        cookie, msg_type = HEADER_STRUCT.unpack(header)
+                        if cookie != MAGIC_COOKIE or msg_type != MSG_TYPE_MUX:
+                            self.log.warning("mux_error", "Invalid mux message from {addr}. Closing the multiplexed "
+                                                          "connection.", addr=addr)
+                            self.metrics.protocol_violations.inc()
+                            return
+                    header_read = False
+
+                    # Session Id (2) + inner Type (1)
+                    tail = await self.read_mux(reader, 3, sessions)
+                    size = body_size(tail[2], False)
+                    if size is None:
+                        self.log.warning("mux_error", "Unknown message type {msg_type} from {addr}. Closing the "
+                                                      "multiplexed connection.", msg_type=hex(tail[2]), addr=addr)
+                        self.metrics.protocol_violations.inc()
+                        return
+                    body = await self.read_mux(reader, size, sessions)
+                except asyncio.IncompleteReadError:
+                    return
+                except asyncio.TimeoutError:
+                    self.log.warning("mux_idle", "{addr} sent nothing on its multiplexed connection without a "
+                                                 "session for {seconds}s. Closing.", addr=addr,
+                                     seconds=self.deadlines.request)
+                    self.metrics.timeouts.inc()
+                    return
+
+                session_id = int.from_bytes(tail[:2], 'big')
+                message = HEADER_STRUCT.pack(MAGIC_COOKIE, tail[2]) + body
+                session_reader = sessions.get(session_id)
+                if tail[2] in MUX_REFUSED_TYPES:
+                    # Only this session is refused, the others keep playing (see Mux.MuxDemultiplexer)
+                    if session_reader is not None:
+                        del sessions[session_id]
+                        session_reader.feed_eof()
+                    self.log.warning("mux_refused", "{addr} sent message type {msg_type} on session {session} of "
+                                                    "its multiplexed connection, which cannot carry it. Closing the "
+                                                    "session.", addr=addr, msg_type=hex(tail[2]), session=session_id)
+                    self.metrics.protocol_violations.inc()
+                    continue
+                if session_reader is None:
+                    session_reader = asyncio.StreamReader()
+                    sessions[session_id] = session_reader
+                    session_reader.feed_data(message)
+                    session_writer = MuxStreamWriter(writer, session_id, sessions, session_reader)
+                    task = asyncio.create_task(self.handle_player(session_reader, session_writer))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                else:
+                    session_reader.feed_data(message)
+        finally:
+            for session_reader in list(sessions.values()):
+                session_reader.feed_eof()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def read_mux(self, reader, n, sessions):
+        """
+                Reads exactly n bytes of a multiplexed connection. Without an open session, the connection has the
+                request deadline to send them (the sessions have their own deadlines).
+
+                Args:
+                    reader (asyncio.StreamReader): The shared connection's incoming stream.
+                    n (int): Number of bytes to read.
+                    sessions (dict): The connection's open sessions.
+
+                Raises:
+                    asyncio.TimeoutError: If the connection had no session and sent nothing in time.
+                    asyncio.IncompleteReadError: If the connection closed first.
+        """
+        while True:
+            try:
+                # A read cut short by the timeout takes nothing from the stream, so it can be started again
+                return await asyncio.wait_for(reader.readexactly(n), self.deadlines.request)
+            except asyncio.TimeoutError:
+                if not sessions:
+                    raise
+
+    async def play(self, reader, writer, rounds, team, delay=1.0, seed=None):
+        """
+                Manages the main game loop for a specific client connection: plays the rounds of
+                Dealer.session_steps with the event loop's I/O, so it never blocks the loop.
+
+                Args:
+                    reader (asyncio.StreamReader): The player's incoming stream.
+                    writer (asyncio.StreamWriter): The player's outgoing stream.
+                    rounds (int): Number of rounds requested.
+                    team (str): The team name.
+                    delay (float): Seconds to pause before each round and before the dealer's turn.
+                    seed (int): Deal from the shoe of this seed, e.g. to replay a captured session (None = a new
+                                shoe).
+
+                Returns:
+                    dict: The statistics of the rounds that were completed.
+        """
+        # Every step's payloads are collected and written together
+        out = FrameBuffer()
+        steps = self.session_steps(writer, rounds, team, delay, seed, out)
+        try:
+            step, argument = next(steps)
+            while True:
+                try:
+                    if step == STEP_SEND:
+                        answer = await self.send_frames(writer, out)
+                    elif step == STEP_DECIDE:
+                        answer = await self.read_timed_decision(reader, team, argument)
+                    else:
+                        await asyncio.sleep(argument)
+                        answer = None
+                except Exception as e:
+                    step, argument = steps.throw(e)
+                    continue
+                step, argument = steps.send(answer)
+        except StopIteration as finished:
+            return finished.value
+
+    async def read_timed_decision(self, reader, team, session_end):
+        """
+                Reads the player's next move before its deadline (see Dealer.read_timed_decision).
+
+                Returns:
+                    str: "Hittt" or "Stand", "Timeout" if the deadline passed first, or None if the player must
+                         leave now (all already logged).
+        """
+        decision_end, session_over = self.deadlines.decision_end(session_end)
+        try:
+            new_header = await self.all_recv(reader, HEADER_STRUCT.size, decision_end)
+            if not new_header:
+                self.log.info("connection_lost", "Connection lost with {team}. Closing session.", team=team)
+                return None
+            if not self.check_decision_header(new_header, team):
+                return None
+            decision_data = await self.all_recv(reader, DECISION_SIZE, decision_end)
+        except asyncio.TimeoutError:
+            self.decision_timed_out(team, session_over)
+            return "Timeout"
+        if not decision_data:
+            self.log.warning("incomplete_decision", "Failed to receive move content from {team}.", team=team)
+            return None
+        return self.parse_move(decision_data, team)
+
+    async def serve(self, server_socket=None):
+        """
+            Runs the accept loop on the current event loop.
+
+            Args:
+                server_socket (socket.socket): An already bound listening socket to serve on.
+                    If None, a new one is bound to an OS chosen port.
+        """
+        if server_socket is None:
+            self.server = await asyncio.start_server(self.handle_player, '0.0.0.0', 0, backlog=1024)
+        else:
+            self.server = await asyncio.start_server(self.handle_player, sock=server_socket)
+
+        server_ip, server_port = self.server.sockets[0].getsockname()[:2]
+        self.server_ip = server_ip
+        self.server_tcp_port = server_port
+        self.log.info("listening", "Dealer is listening on TCP IP {ip} and PORT {port}", ip=server_ip,
+                      port=server_port)
+
+        async with self.server:
+            await self.server.serve_forever()
+
+    def start_dealer(self):
+        """
+            Starts the broadcast thread and runs the asyncio accept loop forever.
+            Every connected player is served by a `handle_player` coroutine instead of a thread.
+        """
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server_socket:
+            server_socket.bind(('0.0.0.0', 0))  # "choose a port for me"
+            server_socket.listen(1024)
+            server_socket.setblocking(False)
+
+            server_port = server_socket.getsockname()[1]
+            broadcast_thread = threading.Thread(target=self.broadcast_offers, args=(server_port,))
+            broadcast_thread.daemon = True
+            broadcast_thread.start()
+
+            asyncio.run(self.serve(server_socket))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="The asyncio Blackjack dealer.")
+    parser.add_argument("--metrics-port", type=int, default=None, help="serve Prometheus metrics on this port")
+    parser.add_argument("--history", metavar="FILE", help="append every round to this history log")
+    parser.add_argument("--resume-grace", type=float, default=30.0,
+                        help="seconds a resumable session waits for its player to reconnect")
+    parser.add_argument("--max-sessions", type=int, default=0, help="sessions played at once (0 = no limit)")
+    parser.add_argument("--backlog", type=int, default=0, help="sessions that may wait for a free slot")
+    parser.add_argument("--hit-soft-17", action="store_true", help="the dealer hits a soft 17")
+    parser.add_argument("--seed", type=int, default=None, help="seed of the shoes' seeds, to deal the same run again")
+    parser.add_argument("--rng", choices=RNG_KINDS, default="mt", help="random generator of the shoes")
+    parser.add_argument("--capture", metavar="FILE", help="record the wire traffic to this capture file")
+    Pacing.add_arguments(parser)
+    Deadlines.add_arguments(parser)
+    EventLog.add_arguments(parser)
+    args = parser.parse_args()
+
+    history = HistoryWriter(args.history) if args.history else None
+    capture = CaptureWriter(args.capture) if args.capture else None
+    dealer = AsyncDealer(Pacing.from_args(args), log=EventLog.from_args(args),
+                         history=history, resume_grace=args.resume_grace,
+                         admission=AsyncAdmissionController(args.max_sessions, args.backlog),
+                         hit_soft_17=args.hit_soft_17, seed=args.seed, rng_kind=args.rng,
+                         deadlines=Deadlines.from_args(args),
+                         capture=capture)
+    if args.metrics_port is not None:
+        dealer.start_metrics_server(args.metrics_port)
+    try:
+        dealer.start_dealer()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Both logs are flushed by daemon threads: what they have not written yet would be lost on exit
+        if history is not None:
+            history.close()
+        if capture is not None:
+            capture.close()
@@ -0,0 +1,331 @@
+import argparse
+import json
+import platform
+import socket
+import statistics
+import sys
+import threading
+import time
+
+from Cards import CARD_VALUES, Card, Hand, Shoe, make_rng
+from Dealer import Dealer
+from EventLog import OFF, EventLog
+from Pacing import NoPacing
+from Player import Player
+from Protocol import PAYLOAD_STRUCT, FrameBuffer, RecvBuffer
+from Strategies import BasicStrategy
+
+"""
+The Benchmark suite:
+Micro and loopback benchmarks of the hot paths - card encoding, message framing, dealing, full rounds and
+session throughput. Every benchmark times a number of loops and reports the time per loop (lower is better).
+Results can be saved as a baseline (JSON) and later runs compared against it.
+
+    python Benchmark.py --save baseline.json
+    python Benchmark.py --compare baseline.json
+"""
+
+BENCHMARKS = []  # (name, loops, function)
+
+
+def benchmark(name, loops):
+    """
+        Registers a benchmark. The function gets a number of loops and returns the seconds they took.
+
+        Args:
+            name (str): Unique name of the benchmark.
+            loops (int): Number of loops per measurement.
+    """
+    def register(func):
+        BENCHMARKS.append((name, loops, func))
+        return func
+    return register
+
+
+class LoopbackDealer:
+    """
+        A threaded Dealer with no pacing and no event log serving on 127.0.0.1.
+    """
+
+    def __init__(self):
+        self.dealer = Dealer(NoPacing(), log=EventLog(OFF))
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_socket.bind(('127.0.0.1', 0))
+        self.server_socket.listen(1024)
+        self.port = self.server_socket.getsockname()[1]
+        thread = threading.Thread(target=self.dealer.accept_players, args=(self.server_socket,))
+        thread.daemon = True
+        thread.start()
+
+    def play_session(self, rounds):
+        """
+                Plays one headless session of up to 255 rounds.
+
+                Returns:
+                    int: Number of rounds played.
+        """
+        player = Player(BasicStrategy(), verbose=False)
+        player.server_ip = '127.0.0.1'
+        player.server_tcp_port = self.port
+        with player.initiate_game(rounds, 0):
+            result = player.play_game(rounds)
+        return result["wins"] + result["losses"] + result["ties"]
+
+
+_loopback_dealer = None
+
+
+def loopback_dealer():
+    """
+        Returns the shared LoopbackDealer, started on first use.
+    """
+    global _loopback_dealer
+    if _loopback_dealer is None:
+        _loopback_dealer = LoopbackDealer()
+    return _loopback_dealer
+
+
+# --- Card encoding ---
+
+@benchmark("cards.lookup", 200_000)
+def bench_card_lookup(loops):
+    lookup = Card.lookup
+    start = time.perf_counter()
+    for i in range(loops):
+        lookup(i & 3 | 1, 12)
+    return time.perf_counter() - start
+
+
+@benchmark("cards.hand_value", 200_000)
+def bench_hand_value(loops):
+    hand = [Card.lookup(1, 1), Card.lookup(2, 7), Card.lookup(3, 12)]
+    start = time.perf_counter()
+    for _ in range(loops):
+        total = 0
+        for card in hand:
+            total += card.get_value()
+    return time.perf_counter() - start
+
+
+@benchmark("cards.hand_add", 200_000)
+def bench_hand_add(loops):
+    cards = [Card.lookup(1, 1), Card.lookup(2, 7), Card.lookup(3, 12)]
+    start = time.perf_counter()
+    for _ in range(loops // 3):
+        hand = Hand()
+        for card in cards:
+            hand.add(card)
+    return time.perf_counter() - start
+
+
+@benchmark("cards.value_table", 200_000)
+def bench_value_table(loops):
+    values = CARD_VALUES
+    start = time.perf_counter()
+    for i in range(loops):
+        values[i % 52]
+    return time.perf_counter() - start
+
+
+# --- Dealing ---
+
+@benchmark("shoe.shuffle_1deck", 5_000)
+def bench_shuffle(loops):
+    shoe = Shoe(1)
+    start = time.perf_counter()
+    for _ in range(loops):
+        shoe.shuffle()
+    return time.perf_counter() - start
+
+
+@benchmark("shoe.shuffle_1deck_pcg", 5_000)
+def bench_shuffle_pcg(loops):
+    shoe = Shoe(1, rng=make_rng(0, "pcg"))
+    start = time.perf_counter()
+    for _ in range(loops):
+        shoe.shuffle()
+    return time.perf_counter() - start
+
+
+@benchmark("shoe.deal_one", 200_000)
+def bench_deal_one(loops):
+    shoe = Shoe(8, 1.0)
+    shoe.shuffle()
+    elapsed = 0.0
+    remaining = loops
+    while remaining > 0:
+        batch = min(remaining, len(shoe.cards))
+        start = time.perf_counter()
+        for _ in range(batch):
+            shoe.deal_one()
+        elapsed += time.perf_counter() - start
+        shoe.build_deck()
+        remaining -= batch
+    return elapsed
+
+
+# --- Message framing ---
+
+@benchmark("framing.pack_payload", 200_000)
+def bench_pack_payload(loops):
+    dealer = Dealer()
+    card = Card.lookup(2, 11)
+    start = time.perf_counter()
+    for _ in range(loops):
+        dealer.pack_payload_card(0x0, card)
+    return time.perf_counter() - start
+
+
+@benchmark("framing.frame_buffer_deal", 100_000)
+def bench_frame_buffer(loops):
+    out = FrameBuffer()
+    cards = [Card.lookup(1, 5), Card.lookup(2, 9), Card.lookup(4, 1)]
+    start = time.perf_counter()
+    for _ in range(loops):
+        for card in cards:
+            out.add_card(0x0, card)
+        out.take()
+    return time.perf_counter() - start
+
+
+@benchmark("framing.unpack_payload", 200_000)
+def bench_unpack_payload(loops):
+    data = bytearray(PAYLOAD_STRUCT.pack(0xabcddcba, 0x4, 0x0, 12, 3))
+    unpack_from = PAYLOAD_STRUCT.unpack_from
+    start = time.perf_counter()
+    for _ in range(loops):
+        unpack_from(data)
+    return time.perf_counter() - start
+
+
+@benchmark("framing.socketpair_payload", 50_000)
+def bench_socketpair_payload(loops):
+    dealer = Dealer()
+    card = Card.lookup(3, 4)
+    left, right = socket.socketpair()
+    inbox = RecvBuffer(right)
+    with left, right:
+        start = time.perf_counter()
+        for _ in range(loops):
+            dealer.send_payload_card(left, 0x0, card)
+            inbox.recv_exact(PAYLOAD_STRUCT.size)
+        return time.perf_counter() - start
+
+
+# --- Loopback rounds ---
+
+@benchmark("round.loopback_latency", 500)
+def bench_round_latency(loops):
+    dealer = loopback_dealer()
+    start = time.perf_counter()
+    played = 0
+    while played < loops:
+        played += dealer.play_session(min(255, loops - played))
+    return time.perf_counter() - start
+
+
+@benchmark("session.throughput_16x50", 800)
+def bench_session_throughput(loops):
+    # 16 concurrent sessions of 50 rounds; time per round over all of them
+    dealer = loopback_dealer()
+    sessions = 16
+    rounds = max(1, loops // sessions)
+    threads = [threading.Thread(target=dealer.play_session, args=(rounds,)) for _ in range(sessions)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return (time.perf_counter() - start) * loops / (rounds * sessions)
+
+
+def run_benchmarks(names=None, repeats=5):
+    """
+        Runs the registered benchmarks: one warmup, then `repeats` measurements each.
+
+        Args:
+            names (list): Only run benchmarks whose name starts with one of these (None = all).
+            repeats (int): Number of measurements per benchmark.
+
+        Returns:
+            dict: name -> {"mean", "stdev", "min"} seconds per loop.
+    """
+    results = {}
+    for name, loops, func in BENCHMARKS:
+        if names and not any(name.startswith(prefix) for prefix in names):
+            continue
+        func(max(1, loops // 10))
+        values = [func(loops) / loops for _ in range(repeats)]
+        results[name] = {
+            "mean": statistics.mean(values),
+            "stdev": statistics.stdev(values) if len(values) > 1 else 0.0,
+            "min": min(values),
+        }
+        print(f"{name:32} {format_time(results[name]['mean']):>12} +- {format_time(results[name]['stdev'])}")
+    return results
+
+
+def format_time(seconds):
+    """
+        Formats a duration with a fitting unit.
+    """
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-9:.1f} ns"
+
+
+def compare(results, baseline, threshold):
+    """
+        Prints the comparison of a run against a baseline.
+
+        Args:
+            results (dict): This run (see run_benchmarks).
+            baseline (dict): The saved baseline run.
+            threshold (float): Relative slowdown (e.g. 0.10) above which a benchmark counts as a regression.
+                               Runs are compared on their fastest measurement, the least noisy one.
+
+        Returns:
+            list: Names of the benchmarks that regressed.
+    """
+    regressions = []
+    print(f"\n{'benchmark':32} {'baseline':>12} {'now':>12} {'change':>8}")
+    for name, result in results.items():
+        if name not in baseline["results"]:
+            print(f"{name:32} {'-':>12} {format_time(result['min']):>12}      new")
+            continue
+        before = baseline["results"][name]["min"]
+        change = (result["min"] - before) / before if before else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  SLOWER"
+            regressions.append(name)
+        elif change < -threshold:
+            flag = "  faster"
+        print(f"{name:32} {format_time(before):>12} {format_time(result['min']):>12} {change:>+7.1%}{flag}")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmarks of the Blackjack dealer and player hot paths.")
+    parser.add_argument("names", nargs="*", help="only run benchmarks starting with these names")
+    parser.add_argument("--repeats", type=int, default=5, help="measurements per benchmark")
+    parser.add_argument("--save", metavar="FILE", help="store this run as a baseline")
+    parser.add_argument("--compare", metavar="FILE", help="compare this run against a stored baseline")
+    parser.add_argument("--threshold", type=float, default=0.10, help="slowdown counted as a regression")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.names, args.repeats)
+
+    if args.save:
+        with open(args.save, 'w') as baseline_file:
+            json.dump({"python": platform.python_version(), "machine": platform.machine(), "created": time.time(),
+                       "results": results}, baseline_file, indent=2)
+        print(f"\nBaseline saved to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
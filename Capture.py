@@ -0,0 +1,544 @@
+import argparse
+import struct
+import threading
+import time
+
+from Cards import RNG_KIND_CODES, RNG_KINDS
+from Protocol import (DECISION_SIZE, HEADER_STRUCT, MAGIC_COOKIE, MSG_TYPE_MUX, MSG_TYPE_PACED_REQUEST,
+                      MSG_TYPE_PAYLOAD, MSG_TYPE_REQUEST, MSG_TYPE_RESUMABLE_REQUEST, MSG_TYPE_RESUME,
+                      MSG_TYPE_SESSION, MUX_HEADER_STRUCT, PACED_REQUEST_STRUCT, PAYLOAD_STRUCT, REQUEST_STRUCT,
+                      SESSION_STRUCT)
+from Mux import body_size
+
+"""
+Wire traffic capture:
+A dealer started with a capture writer records every framed message of every connection - the requests and
+decisions it receives, the payloads it sends - and the offers it broadcasts, with their times, to a compact
+binary file. Together with the seed of every session's shoe this is enough for Replay.py to drive a Dealer or a
+Player through the same session again, at full speed or with the original timing.
+
+The file is append-only:
+    File header:     b"BJCAP" | version (1)
+    Open record:     b"O" | wall time (8)                   - a writer (re)opened the file, the session ids and the
+                                                              times below restart (seconds since this record)
+    Session record:  b"N" | session (4) | time (8) | length (1) | peer ("ip:port")
+    Shoe record:     b"S" | session (4) | seed (8) | generator (1) | decks (1) | penetration (8) | hit soft 17 (1)
+    Message record:  b"M" | session (4) | time (8) | direction (1) | length (2) | message
+    Close record:    b"C" | session (4) | time (8)
+Offers are message records of session 0. A message is cut from the byte stream by the protocol's sizes; bytes
+that do not parse as a message (a bad cookie or type) are recorded as they came, so nothing is lost.
+"""
+
+MAGIC = b"BJCAP"
+VERSION = 1
+FILE_HEADER_STRUCT = struct.Struct('!5s B')
+OPEN_STRUCT = struct.Struct('!c d')
+SESSION_RECORD_STRUCT = struct.Struct('!c I d B')
+SHOE_STRUCT = struct.Struct('!c I Q B B d ?')
+MESSAGE_STRUCT = struct.Struct('!c I d B H')
+CLOSE_STRUCT = struct.Struct('!c I d')
+
+# Message directions
+FROM_PLAYER = 0
+FROM_DEALER = 1
+OFFER = 2
+DIRECTION_NAMES = {FROM_PLAYER: "player", FROM_DEALER: "dealer", OFFER: "offer"}
+
+# Size of a whole message (header included) by type
+PLAYER_MESSAGE_SIZE = {
+    MSG_TYPE_REQUEST: HEADER_STRUCT.size + REQUEST_STRUCT.size,
+    MSG_TYPE_PACED_REQUEST: HEADER_STRUCT.size + PACED_REQUEST_STRUCT.size,
+    MSG_TYPE_RESUMABLE_REQUEST: HEADER_STRUCT.size + PACED_REQUEST_STRUCT.size,
+    MSG_TYPE_PAYLOAD: HEADER_STRUCT.size + DECISION_SIZE,
+    MSG_TYPE_RESUME: SESSION_STRUCT.size,
+}
+DEALER_MESSAGE_SIZE = {
+    MSG_TYPE_PAYLOAD: PAYLOAD_STRUCT.size,
+    MSG_TYPE_SESSION: SESSION_STRUCT.size,
+}
+
+
+class MessageFramer:
+    """
+        Cuts one direction of a connection into whole protocol messages, however the bytes arrive.
+    """
+
+    def __init__(self, from_dealer):
+        """
+                Args:
+                    from_dealer (bool): True for the dealer -> player direction.
+        """
+        self.from_dealer = from_dealer
+        self.sizes = DEALER_MESSAGE_SIZE if from_dealer else PLAYER_MESSAGE_SIZE
+        self.pending = bytearray()
+        self.raw = False  # Lost the message boundaries - everything is passed on as it comes
+
+    def message_size(self):
+        """
+                Returns:
+                    int: Size of the message at the start of the pending bytes, 0 if more bytes are needed to know,
+                         or None if they are not a message.
+        """
+        pending = self.pending
+        if len(pending) < HEADER_STRUCT.size:
+            return 0
+        cookie, msg_type = HEADER_STRUCT.unpack_from(pending)
+        if cookie != MAGIC_COOKIE:
+            return None
+        if msg_type != MSG_TYPE_MUX:
+            return self.sizes.get(msg_type)
+        # A mux message: its header, then the inner type and body
+        if len(pending) < MUX_HEADER_STRUCT.size + 1:
+            return 0
+        inner = body_size(pending[MUX_HEADER_STRUCT.size], self.from_dealer)
+        return None if inner is None else MUX_HEADER_STRUCT.size + 1 + inner
+
+    def feed(self, data):
+        """
+                Adds received or sent bytes.
+
+                Returns:
+                    list: The messages completed by them (bytes).
+        """
+        if self.raw:
+            return [bytes(data)] if data else []
+        self.pending += data
+        messages = []
+        while self.pending:
+            size = self.message_size()
+            if size is None:
+                self.raw = True
+                messages.append(bytes(self.pending))
+                self.pending.clear()
+                break
+            if not size or len(self.pending) < size:
+                break
+            messages.append(bytes(self.pending[:size]))
+            del self.pending[:size]
+        return messages
+
+
+class CaptureWriter:
+    """
+        Appends the traffic of one dealer (one process) to a capture file.
+    """
+
+    def __init__(self, path, flush_interval=1.0, flush_bytes=256 * 1024):
+        """
+                Opens (or creates) the capture and starts the background flusher.
+
+                Args:
+                    path (str): The capture file.
+                    flush_interval (float): Seconds between two flushes of the buffered records.
+                    flush_bytes (int): Buffered size that wakes the flusher early.
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+        self.flush_bytes = flush_bytes
+        self.file = open(path, 'ab')
+        self.buffer = bytearray()
+        if self.file.tell() == 0:
+            self.buffer += FILE_HEADER_STRUCT.pack(MAGIC, VERSION)
+        self.started = time.perf_counter()
+        self.buffer += OPEN_STRUCT.pack(b"O", time.time())
+        self.next_session = 1
+        self.lock = threading.Lock()  # Guards the buffer and the session counter
+        self.write_lock = threading.Lock()  # Keeps the batches in order on disk
+        self.wake = threading.Event()
+        self.closed = False
+        self.flusher = threading.Thread(target=self.flush_periodically, name="Capture flusher")
+        self.flusher.daemon = True
+        self.flusher.start()
+
+    def now(self):
+        return time.perf_counter() - self.started
+
+    def append(self, *parts):
+        # Called without the lock; the parts of a record are kept together
+        with self.lock:
+            for part in parts:
+                self.buffer += part
+            full = len(self.buffer) >= self.flush_bytes
+        if full:
+            self.wake.set()
+
+    def wrap(self, conn, addr):
+        """
+                Starts capturing a new connection.
+
+                Args:
+                    conn (socket.socket): The accepted connection.
+                    addr (tuple): The client's (IP, Port).
+
+                Returns:
+                    CapturedConnection: The connection to use instead, recording everything that goes through it.
+        """
+        return CapturedConnection(conn, self, self.start_session(addr))
+
+    def wrap_streams(self, reader, writer, addr):
+        """
+                Starts capturing a new asyncio connection (see `wrap`).
+
+                Args:
+                    reader (asyncio.StreamReader): The connection's incoming stream.
+                    writer (asyncio.StreamWriter): The connection's outgoing stream.
+                    addr (tuple): The client's (IP, Port).
+
+                Returns:
+                    tuple: (CapturedStreamReader, CapturedStreamWriter) to use instead.
+        """
+        session = self.start_session(addr)
+        return CapturedStreamReader(reader, self, session), CapturedStreamWriter(writer, self, session)
+
+    def start_session(self, addr):
+        """
+                Records a new connection.
+
+                Returns:
+                    int: The capture's id of the connection.
+        """
+        with self.lock:
+            session = self.next_session
+            self.next_session = (self.next_session + 1) & 0xFFFFFFFF or 1
+        peer = f"{addr[0]}:{addr[1]}".encode('utf-8')[:255]
+        self.append(SESSION_RECORD_STRUCT.pack(b"N", session, self.now(), len(peer)), peer)
+        return session
+
+    def record_message(self, session, direction, message):
+        self.append(MESSAGE_STRUCT.pack(b"M", session, self.now(), direction, len(message)), message)
+
+    def record_offer(self, packet):
+        """
+                Records a broadcast offer (as a message of session 0).
+        """
+        self.record_message(0, OFFER, packet)
+
+    def record_shoe(self, conn, seed, rng_kind, decks, penetration, hit_soft_17):
+        """
+                Records the shoe a captured connection's session is dealt from, so a replay deals the same cards.
+                Sessions that are not played straight on a captured connection (multiplexed, resumable) are
+                not recorded.
+
+                Args:
+                    conn (socket.socket): The connection the session is played on.
+                    seed (int): The shoe's seed (see Dealer.new_shoe).
+                    rng_kind (str): The shoe's random generator, one of Cards.RNG_KINDS.
+                    decks (int): Number of decks in the shoe.
+                    penetration (float): Part of the shoe dealt before it is reshuffled.
+                    hit_soft_17 (bool): The dealer hits a soft 17.
+        """
+        session = getattr(conn, "capture_session", None)
+        if session is not None:
+            self.append(SHOE_STRUCT.pack(b"S", session, seed, RNG_KIND_CODES[rng_kind], decks, penetration,
+                                         hit_soft_17))
+
+    def record_close(self, session):
+        self.append(CLOSE_STRUCT.pack(b"C", session, self.now()))
+
+    def flush(self):
+        """
+                Writes the buffered records to the file.
+        """
+        with self.write_lock:
+            with self.lock:
+                data, self.buffer = self.buffer, bytearray()
+            if data and not self.file.closed:
+                self.file.write(data)
+                self.file.flush()
+
+    def flush_periodically(self):
+        while not self.closed:
+            self.wake.wait(self.flush_interval)
+            self.wake.clear()
+            self.flush()
+
+    def close(self):
+        """
+                Flushes what is left and closes the file.
+        """
+        self.closed = True
+        self.wake.set()
+        self.flusher.join()
+        self.flush()
+        with self.write_lock:
+            self.file.close()
+
+
+class CapturedConnection:
+    """
+        A connection that records every message read from it and written to it, with the socket methods the
+        dealer uses.
+    """
+
+    def __init__(self, sock, writer, session):
+        """
+                Args:
+                    sock (socket.socket): The real connection.
+                    writer (CaptureWriter): Where the messages are recorded.
+                    session (int): The capture's id of the connection.
+        """
+        self.sock = sock
+        self.writer = writer
+        self.capture_session = session
+        self.incoming = MessageFramer(from_dealer=False)
+        self.outgoing = MessageFramer(from_dealer=True)
+        self.closed = False
+
+    def recv_into(self, view, n=0):
+        got = self.sock.recv_into(view, n)
+        if got:
+            for message in self.incoming.feed(view[:got]):
+                self.writer.record_message(self.capture_session, FROM_PLAYER, message)
+        return got
+
+    def sendall(self, data):
+        for message in self.outgoing.feed(data):
+            self.writer.record_message(self.capture_session, FROM_DEALER, message)
+        self.sock.sendall(data)
+
+    def settimeout(self, timeout):
+        self.sock.settimeout(timeout)
+
+    def setsockopt(self, *args):
+        self.sock.setsockopt(*args)
+
+    def shutdown(self, how):
+        self.sock.shutdown(how)
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def detach(self):
+        """
+                Hands the socket over (to a resumed session) - the capture of this connection ends here.
+        """
+        self.finish()
+        return self.sock.detach()
+
+    def finish(self):
+        if not self.closed:
+            self.closed = True
+            self.writer.record_close(self.capture_session)
+
+    def close(self):
+        self.finish()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class CapturedStreamReader:
+    """
+        The incoming stream of a captured asyncio connection: records every message read from it.
+    """
+
+    def __init__(self, reader, writer, session):
+        """
+                Args:
+                    reader (asyncio.StreamReader): The real stream.
+                    writer (CaptureWriter): Where the messages are recorded.
+                    session (int): The capture's id of the connection.
+        """
+        self.reader = reader
+        self.writer = writer
+        self.capture_session = session
+        self.incoming = MessageFramer(from_dealer=False)
+
+    async def readexactly(self, n):
+        data = await self.reader.readexactly(n)
+        for message in self.incoming.feed(data):
+            self.writer.record_message(self.capture_session, FROM_PLAYER, message)
+        return data
+
+
+class CapturedStreamWriter:
+    """
+        The outgoing stream of a captured asyncio connection: records every message written to it, and the end of
+        the connection.
+    """
+
+    def __init__(self, stream, writer, session):
+        """
+                Args:
+                    stream (asyncio.StreamWriter): The real stream.
+                    writer (CaptureWriter): Where the messages are recorded.
+                    session (int): The capture's id of the connection.
+        """
+        self.stream = stream
+        self.writer = writer
+        self.capture_session = session
+        self.outgoing = MessageFramer(from_dealer=True)
+        self.closed = False
+
+    def write(self, data):
+        for message in self.outgoing.feed(data):
+            self.writer.record_message(self.capture_session, FROM_DEALER, message)
+        self.stream.write(data)
+
+    async def drain(self):
+        await self.stream.drain()
+
+    def get_extra_info(self, name, default=None):
+        return self.stream.get_extra_info(name, default)
+
+    def is_closing(self):
+        return self.stream.is_closing()
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.writer.record_close(self.capture_session)
+        self.stream.close()
+
+    async def wait_closed(self):
+        await self.stream.wait_closed()
+
+
+class CapturedSession:
+    """
+        One connection read back from a capture.
+    """
+
+    def __init__(self, session, peer, started):
+        self.session = session
+        self.peer = peer
+        self.started = started
+        self.ended = None
+        self.shoe = None  # dict: seed, rng, decks, penetration, hit_soft_17 - None if not recorded
+        self.messages = []  # (time since the session started, direction, message bytes)
+
+    def request(self):
+        """
+                Returns:
+                    bytes: The first message of the player (its request), or None.
+        """
+        return next((message for _, direction, message in self.messages if direction == FROM_PLAYER), None)
+
+    def __repr__(self):
+        return f"session {self.session} from {self.peer} ({len(self.messages)} messages)"
+
+
+def read_capture(path):
+    """
+        Reads a whole capture file.
+        A record cut short at the end (still being flushed) ends the read.
+
+        Args:
+            path (str): The capture file.
+
+        Returns:
+            tuple: (list of CapturedSession in the order they started, list of (time, offer packet)).
+    """
+    with open(path, 'rb') as capture_file:
+        data = capture_file.read()
+    view = memoryview(data)
+    if len(data) < FILE_HEADER_STRUCT.size:
+        return [], []
+    magic, version = FILE_HEADER_STRUCT.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} is not a version {VERSION} capture")
+    sessions = []
+    offers = []
+    open_sessions = {}  # id -> CapturedSession, in the current segment
+    segment_start = 0.0  # Times are made absolute (wall clock) across segments
+    position = FILE_HEADER_STRUCT.size
+    end = len(data)
+    while position < end:
+        kind = data[position:position + 1]
+        if kind == b"M":
+            if position + MESSAGE_STRUCT.size > end:
+                break
+            _, session, at, direction, length = MESSAGE_STRUCT.unpack_from(view, position)
+            message_end = position + MESSAGE_STRUCT.size + length
+            if message_end > end:
+                break
+            message = bytes(view[position + MESSAGE_STRUCT.size:message_end])
+            if direction == OFFER:
+                offers.append((segment_start + at, message))
+            elif session in open_sessions:
+                captured = open_sessions[session]
+                captured.messages.append((segment_start + at - captured.started, direction, message))
+            position = message_end
+        elif kind == b"N":
+            if position + SESSION_RECORD_STRUCT.size > end:
+                break
+            _, session, at, length = SESSION_RECORD_STRUCT.unpack_from(view, position)
+            peer_end = position + SESSION_RECORD_STRUCT.size + length
+            if peer_end > end:
+                break
+            peer = bytes(view[position + SESSION_RECORD_STRUCT.size:peer_end]).decode('utf-8', 'replace')
+            captured = open_sessions[session] = CapturedSession(session, peer, segment_start + at)
+            sessions.append(captured)
+            position = peer_end
+        elif kind == b"S":
+            if position + SHOE_STRUCT.size > end:
+                break
+            _, session, seed, rng_code, decks, penetration, hit_soft_17 = SHOE_STRUCT.unpack_from(view, position)
+            if session in open_sessions:
+                open_sessions[session].shoe = {"seed": seed, "rng": RNG_KINDS[rng_code], "decks": decks,
+                                               "penetration": penetration, "hit_soft_17": hit_soft_17}
+            position += SHOE_STRUCT.size
+        elif kind == b"C":
+            if position + CLOSE_STRUCT.size > end:
+                break
+            _, session, at = CLOSE_STRUCT.unpack_from(view, position)
+            captured = open_sessions.pop(session, None)
+            if captured is not None:
+                captured.ended = segment_start + at - captured.started
+            position += CLOSE_STRUCT.size
+        elif kind == b"O":
+            if position + OPEN_STRUCT.size > end:
+                break
+            segment_start = OPEN_STRUCT.unpack_from(view, position)[1]
+            open_sessions = {}
+            position += OPEN_STRUCT.size
+        else:
+            raise ValueError(f"Corrupt capture {path} at byte {position}")
+    view.release()
+    return sessions, offers
+
+
+def describe_message(direction, message):
+    """
+        Returns:
+            str: A one-line description of a captured message.
+    """
+    if len(message) < HEADER_STRUCT.size:
+        return f"{len(message)} raw bytes"
+    cookie, msg_type = HEADER_STRUCT.unpack_from(message)
+    if cookie != MAGIC_COOKIE:
+        return f"{len(message)} raw bytes (cookie {cookie:#x})"
+    if msg_type == MSG_TYPE_PAYLOAD and direction == FROM_DEALER:
+        _, _, result, rank, suit = PAYLOAD_STRUCT.unpack(message)
+        return f"payload result {result} card {rank}/{suit}" if rank else f"payload result {result}"
+    if msg_type == MSG_TYPE_PAYLOAD:
+        return f"decision {message[HEADER_STRUCT.size:].decode('utf-8', 'replace')}"
+    if msg_type in (MSG_TYPE_PACED_REQUEST, MSG_TYPE_RESUMABLE_REQUEST):
+        rounds, team, pacing_ms = PACED_REQUEST_STRUCT.unpack_from(message, HEADER_STRUCT.size)
+        team = team.rstrip(b'\0').decode('utf-8', 'replace')
+        return f"request type {msg_type:#x}: {rounds} rounds for {team}, {pacing_ms} ms"
+    if msg_type == MSG_TYPE_REQUEST:
+        rounds, team = REQUEST_STRUCT.unpack_from(message, HEADER_STRUCT.size)
+        team = team.rstrip(b'\0').decode('utf-8', 'replace')
+        return f"request: {rounds} rounds for {team}"
+    return f"type {msg_type:#x}, {len(message)} bytes"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Summary (or dump) of a Blackjack wire capture.")
+    parser.add_argument("path", help="the capture file")
+    parser.add_argument("--dump", action="store_true", help="print every message")
+    args = parser.parse_args()
+
+    captured_sessions, captured_offers = read_capture(args.path)
+    print(f"{args.path}: {len(captured_sessions)} sessions, {len(captured_offers)} offers")
+    for captured in captured_sessions:
+        shoe = f"shoe seed {captured.shoe['seed']}" if captured.shoe else "no shoe recorded"
+        print(f"  {captured!r}, {shoe}")
+        if args.dump:
+            for at, direction, message in captured.messages:
+                print(f"    {at:10.6f} {DIRECTION_NAMES[direction]:>6}: {describe_message(direction, message)}")
@@ -1,11 +1,59 @@
+import os
 import random
 
+"""
+Compact card encoding:
+Every card of the 52-card deck is a small int code = (suit - 1) * 13 + (rank - 1), 0..51.
+Decks hold codes in a bytearray, values come from a precomputed lookup table, and the Card objects handed
+out are shared read-only views from the CARDS table - dealing and summing a hand allocates nothing.
+
+Every deck shuffles with its own random generator (see make_rng), so sessions do not share one random state, and
+a deck built from a recorded seed deals the very same cards again.
+"""
+
+SUIT_COUNT = 4
+RANK_COUNT = 13
+DECK_SIZE = SUIT_COUNT * RANK_COUNT
+
+# Blackjack value by rank (index 0 = "no card", used by result payloads)
+RANK_VALUES = (0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 10, 10, 10)
+
+# Blackjack value by card code
+CARD_VALUES = bytes(RANK_VALUES[code % RANK_COUNT + 1] for code in range(DECK_SIZE))
+
+# A full deck of card codes, copied into a deck when it is (re)built
+FULL_DECK = bytes(range(DECK_SIZE))
+
+BLACKJACK = 21  # Above this the hand busts
+DEALER_STAND_ON = 17  # The dealer hits below this total (and on a soft 17 with hit_soft_17)
+SOFT_ACE_BONUS = 10  # An ace counted as 11 instead of 1
+
+# The shuffle generators: Python's Mersenne Twister, or numpy's PCG64 (5-10x faster shuffles, needs numpy)
+RNG_KINDS = ("mt", "pcg")
+RNG_KIND_CODES = {kind: code for code, kind in enumerate(RNG_KINDS)}  # As recorded in the history log
+
+
+def card_code(suit, rank):
+    """
+        Encodes a card as its small int code.
+
+        Args:
+            suit (int): 1-4.
+            rank (int): 1-13.
+
+        Returns:
+            int: The card code (0-51).
+    """
+    return (suit - 1) * RANK_COUNT + (rank - 1)
+
 
 class Card:
     """
         Represents a single playing card in a standard 52-card deck.
     """
 
+    __slots__ = ('suit', 'rank')
+
     def __init__(self, suit, rank):
         """
                 Initializes a new Card instance.
@@ -29,12 +77,45 @@ class Card:
                 Returns:
                     int: The point value of the card.
         """
-        if self.rank == 1:
-            return 1
-        elif 11 <= self.rank <= 13:
-            return 10
-        else:
-            return self.rank
+        return RANK_VALUES[self.rank]
+
+    @property
+    def code(self):
+        """
+                int: The compact code of the card (0-51).
+        """
+        return card_code(self.suit, self.rank)
+
+    @staticmethod
+    def lookup(suit, rank):
+        """
+                Returns the shared Card view for a suit and rank read off the wire.
+
+                Args:
+                    suit (int): 1-4 (0 with round results).
+                    rank (int): 1-13 (0 with round results).
+
+                Returns:
+                    Card: The shared card, NO_CARD for (0, 0), or a new Card for anything else.
+        """
+        if 1 <= suit <= SUIT_COUNT and 1 <= rank <= RANK_COUNT:
+            return CARDS[card_code(suit, rank)]
+        if suit == 0 and rank == 0:
+            return NO_CARD
+        return Card(suit, rank)
+
+    @staticmethod
+    def from_code(code):
+        """
+                Returns the shared Card view of a card code (no allocation).
+
+                Args:
+                    code (int): The card code (0-51).
+
+                Returns:
+                    Card: The read-only Card for that code.
+        """
+        return CARDS[code]
 
     def print_card(self):
 
@@ -53,48 +134,168 @@ class Card:
         description = description + suits[self.suit - 1]
         return description
 
+    def __str__(self):
+        # Cards are logged as event fields and formatted on the log writer's thread
+        return self.print_card()
+
+
+# One shared, read-only Card per code - never modify these
+CARDS = tuple(Card(code // RANK_COUNT + 1, code % RANK_COUNT + 1) for code in range(DECK_SIZE))
+
+# The card sent along with round results
+NO_CARD = Card(0, 0)
+
+
+class Hand:
+    """
+        The cards of one hand with its totals kept up to date card by card - adding a card is O(1), nothing is
+        re-summed. Aces count 1 in the hard total; one of them counts 11 (a soft total) while that does not bust
+        the hand.
+    """
+
+    __slots__ = ('cards', 'hard', 'aces')
+
+    def __init__(self, cards=()):
+        """
+                Initializes the Hand.
+
+                Args:
+                    cards (iterable): Cards to start with.
+        """
+        self.cards = []
+        self.hard = 0  # Every ace as 1
+        self.aces = 0
+        for card in cards:
+            self.add(card)
+
+    def add(self, card):
+        """
+                Adds a card and updates the totals.
+
+                Args:
+                    card (Card): The card dealt to the hand.
+
+                Returns:
+                    int: The new total.
+        """
+        self.cards.append(card)
+        value = RANK_VALUES[card.rank]
+        self.hard += value
+        if value == 1:
+            self.aces += 1
+        return self.total
+
+    @property
+    def soft(self):
+        """
+                bool: True if an ace counts 11 in the total.
+        """
+        return self.aces > 0 and self.hard + SOFT_ACE_BONUS <= BLACKJACK
+
+    @property
+    def total(self):
+        """
+                int: The best total of the hand - soft if an ace can count 11, else hard.
+        """
+        hard = self.hard
+        if self.aces and hard + SOFT_ACE_BONUS <= BLACKJACK:
+            return hard + SOFT_ACE_BONUS
+        return hard
+
+    def is_bust(self):
+        """
+                Returns True if the hand is over 21 (even with every ace counting 1).
+        """
+        return self.hard > BLACKJACK
+
+    def __len__(self):
+        return len(self.cards)
+
+    def __iter__(self):
+        return iter(self.cards)
+
+    def __getitem__(self, index):
+        return self.cards[index]
+
+
+def new_seed():
+    """
+        Returns:
+            int: A fresh 64-bit seed from the OS entropy pool.
+    """
+    return int.from_bytes(os.urandom(8), 'big')
+
+
+class PcgShuffler:
+    """
+        Shuffles card codes in place with numpy's PCG64 generator.
+    """
+
+    def __init__(self, seed=None):
+        import numpy  # Only needed by the decks that use this generator
+        self.numpy = numpy
+        self.generator = numpy.random.Generator(numpy.random.PCG64(seed))
+
+    def shuffle(self, cards):
+        # The view is dropped right away - a bytearray with a live view cannot shrink
+        self.generator.shuffle(self.numpy.frombuffer(cards, dtype=self.numpy.uint8))
+
+
+def make_rng(seed=None, kind="mt"):
+    """
+        Builds a private shuffle generator for a deck.
+
+        Args:
+            seed (int): The seed (None = a fresh one from the OS).
+            kind (str): One of RNG_KINDS - "mt" (random.Random) or "pcg" (numpy's PCG64).
+
+        Returns:
+            object: A generator with a shuffle(cards) method. The same seed and kind always shuffle the same way.
+    """
+    if kind == "mt":
+        return random.Random(seed)
+    if kind == "pcg":
+        return PcgShuffler(seed)
+    raise ValueError(f"Unknown random generator: {kind}")
+
 
 class Deck:
     """
         Represents a standard deck of 52 playing cards.
     """
 
-    def __init__(self):
+    def __init__(self, rng=None):
         """
                 Initializes a new Deck.
                 Automatically builds the deck upon creation.
+
+                Args:
+                    rng (object): The deck's own shuffle generator (see make_rng). Defaults to a fresh random.Random.
         """
-        self.cards = []  # list of cards
+        self.rng = rng if rng is not None else random.Random()
+        self.cards = bytearray(DECK_SIZE)  # card codes, the top of the deck is the end
         self.build_deck()
 
     def build_deck(self):
         """
-                Populates the deck with 52 cards.
+                Populates the deck with 52 cards (in place).
                 4 suits x 13 ranks.
         """
-        # create deck
-
         # "Hearts" 1, "Diamonds" 2, "Clubs" 3, "Spades" 4
-        suits = [1, 2, 3, 4]
-        ranks = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13]
-
-        self.cards = []
-        for suit in suits:
-            for rank in ranks:
-                self.cards.append(Card(suit, rank))
+        self.cards[:] = FULL_DECK
 
     def shuffle(self):
         """
                 Randomizes the order of the cards in the deck.
         """
-        random.shuffle(self.cards)
+        self.rng.shuffle(self.cards)
 
-    def deal_one(self):
+    def deal_code(self):
         """
-                Removes and returns the top card from the deck.
+                Removes and returns the code of the top card of the deck.
 
                 Returns:
-                    Card: The card object that was removed.
+                    int: The card code (0-51).
                     If the deck was empty - create new one
         """
         if len(self.cards) > 0:
@@ -104,3 +305,107 @@ class Deck:
             self.build_deck()
             self.shuffle()
             return self.cards.pop()
+
+    def deal_one(self):
+        """
+                Removes and returns the top card from the deck.
+
+                Returns:
+                    Card: The (shared) card object that was removed.
+                    If the deck was empty - create new one
+        """
+        return CARDS[self.deal_code()]
+
+
+class Shoe(Deck):
+    """
+        Represents a dealing shoe of 1-8 standard decks with a cut card.
+        The shoe lives for a whole session; it is only reshuffled once the cut card has come out.
+        A shoe that runs out in the middle of a round (a deep cut card, or a table of many seats) goes on with its
+        discards reshuffled - every card except the ones dealt in this round, so no card comes out twice.
+    """
+
+    def __init__(self, decks=1, penetration=0.75, rng=None):
+        """
+                Initializes a new Shoe and builds it.
+
+                Args:
+                    decks (int): Number of 52-card decks in the shoe (1-8).
+                    penetration (float): Part of the shoe dealt before the cut card comes out (0-1].
+                    rng (object): The shoe's own shuffle generator (see make_rng). Defaults to a fresh random.Random.
+        """
+        if not 1 <= decks <= 8:
+            raise ValueError(f"A shoe holds 1-8 decks, got {decks}")
+        if not 0 < penetration <= 1:
+            raise ValueError(f"Penetration must be in (0, 1], got {penetration}")
+        self.decks = decks
+        self.penetration = penetration
+        # Reshuffle once this few cards are left behind the cut card
+        self.cut_remaining = decks * DECK_SIZE - int(decks * DECK_SIZE * penetration)
+        self.rng = rng if rng is not None else random.Random()
+        self.cards = bytearray(decks * DECK_SIZE)
+        self.in_play = bytearray()  # The cards dealt in this round
+        self.discards_shuffled = False  # The shoe ran out in this round and went on with its discards
+        self.build_deck()
+
+    def build_deck(self):
+        """
+                Refills the shoe with all of its decks (in place).
+        """
+        self.cards[:] = FULL_DECK * self.decks
+        del self.in_play[:]
+
+    def deal_code(self):
+        """
+                Removes and returns the code of the top card of the shoe.
+                If the shoe is empty, its discards are reshuffled first (see `shuffle_discards`).
+
+                Returns:
+                    int: The card code (0-51).
+        """
+        if not self.cards:
+            self.shuffle_discards()
+        code = self.cards.pop()
+        self.in_play.append(code)
+        return code
+
+    def shuffle_discards(self):
+        """
+                Refills an empty shoe with the cards dealt before this round and reshuffles it, in the middle of a
+                round. The cards of this round stay on the table.
+
+                Raises:
+                    RuntimeError: If every card of the shoe is already on the table.
+        """
+        left = [self.decks] * DECK_SIZE
+        for code in self.in_play:
+            left[code] -= 1
+        self.cards[:] = bytes(code for code in FULL_DECK for _ in range(left[code]))
+        if not self.cards:
+            raise RuntimeError("Every card of the shoe is on the table")
+        self.shuffle()
+        self.discards_shuffled = True
+
+    def needs_shuffle(self):
+        """
+                Checks whether the cut card has come out.
+
+                Returns:
+                    bool: True if the shoe should be reshuffled before the next round.
+        """
+        return len(self.cards) <= self.cut_remaining
+
+    def start_round(self):
+        """
+                Called before every round: rebuilds and reshuffles the shoe if the cut card has come out.
+
+                Returns:
+                    bool: True if the shoe was reshuffled.
+        """
+        del self.in_play[:]
+        self.discards_shuffled = False
+        if self.needs_shuffle():
+            self.build_deck()
+            self.shuffle()
+            return True
+        return False
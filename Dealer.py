@@ -1,18 +1,44 @@
+import argparse
+import os
 import random
 import socket
-import struct
 import threading
 import time
-from Cards import *
+from functools import partial
+from Admission import ADMISSION_POLL, AdmissionController
+from Capture import CaptureWriter
+from Cards import BLACKJACK, DEALER_STAND_ON, Hand, NO_CARD, RNG_KINDS, Shoe, make_rng, new_seed
+from Pacing import FixedPacing, Pacing
+from Protocol import (DECISION_SIZE, FrameBuffer, HEADER_STRUCT, MAGIC_COOKIE, MSG_TYPE_MUX, MSG_TYPE_OFFER,
+                      MSG_TYPE_PACED_REQUEST, MSG_TYPE_PAYLOAD, MSG_TYPE_REQUEST, MSG_TYPE_RESUMABLE_REQUEST,
+                      MSG_TYPE_RESUME, OFFER_LOAD_STRUCT, OFFER_STRUCT, PACED_REQUEST_STRUCT, PAYLOAD_STRUCT,
+                      REQUEST_STRUCT, RecvBuffer, SESSION_BODY_STRUCT, set_nodelay)
+from EventLog import EventLog
+from History import HistoryWriter
+from Metrics import DealerMetrics, MetricsServer
+from Mux import MuxDemultiplexer
+from Resume import SessionRegistry
+from Table import TableLobby
+from Timers import Deadlines, TimerHeap, shutdown_reads
+from WorkerPool import WorkerPool
 
 UDP_DEST_PORT = 13122  # The client needs to listen for the offer message on 13122 UDP port
-MAGIC_COOKIE = 0xabcddcba
-MSG_TYPE_OFFER = 0x2  # Offer
-MSG_TYPE_REQUEST = 0x3
-MSG_TYPE_PAYLOAD = 0x4
 SERVER_NAME = "MyBlackJackDealer"
+SATURATED_OFFER_INTERVAL = 5.0  # A dealer with every slot taken announces itself this rarely
 TCP_PORT = 0  # The port at the offer
 
+# What the rules of a session need from its connection (see Dealer.session_steps)
+STEP_PAUSE = 0
+STEP_SEND = 1
+STEP_DECIDE = 2
+
+# Body size (after cookie + type) of every request kind
+REQUEST_BODY_SIZE = {
+    MSG_TYPE_REQUEST: 33,  # rounds 1 + team name 32
+    MSG_TYPE_PACED_REQUEST: 35,  # rounds 1 + team name 32 + pacing ms 2
+    MSG_TYPE_RESUMABLE_REQUEST: 35,  # same as the paced request
+}
+
 """
 The Handshake:
 step 1. Player Listen: The client opens a UDP Socket in passive mode and waits for requests from one of the dealers in the network.
@@ -30,14 +56,78 @@ class Dealer:
         Represents the Dealer in the Blackjack game.
         """
 
-    def __init__(self):
+    def __init__(self, pacing=None, stats_queue=None, decks=1, penetration=0.75, tcp_nodelay=True, log=None,
+                 metrics=None, history=None, resume_grace=30.0, admission=None, pool_size=0, pool_queue=128,
+                 hit_soft_17=False, table_seats=0, seat_timeout=10.0, seed=None, rng_kind="mt",
+                 capture=None, deadlines=None):
         """
              Initializes the Dealer instance.
+
+             Args:
+                 pacing (Pacing): How long to pause between rounds. Defaults to FixedPacing(1.0).
+                 stats_queue (multiprocessing.Queue): If set, the statistics of every finished session
+                                                      are reported there as (pid, team, statistics).
+                 decks (int): Number of decks in every session's shoe (1-8).
+                 penetration (float): Part of the shoe dealt before it is reshuffled.
+                 tcp_nodelay (bool): Turn Nagle's algorithm off on player connections.
+                 log (EventLog): Where the game events go. Defaults to EventLog() (INFO, text, stdout).
+                 metrics (DealerMetrics): The counters and histograms the dealer updates. Defaults to a new set,
+                                          served over HTTP once `start_metrics_server` is called.
+                 history (HistoryWriter): If set, every round played is appended to this history log.
+                 resume_grace (float): Seconds a resumable session waits for its player to reconnect.
+                 admission (AdmissionController): Limits the sessions played at once. Defaults to no limit.
+                 pool_size (int): Handle the connections on a pool of this many threads (0 = a new thread for
+                                  every connection).
+                 pool_queue (int): Connections that may wait for a free pool thread before new ones are refused.
+                 hit_soft_17 (bool): The dealer hits a soft 17 (an ace counted as 11) instead of standing on it.
+                 table_seats (int): Seat the players at tables of this many seats sharing a shoe and a dealer hand
+                                    (0 = a private game for every player).
+                 seat_timeout (float): At a table, seconds a seat has for every decision before it stands and leaves.
+                 seed (int): Derive every shoe's seed from this one, so a whole run deals the same cards again
+                             (None = fresh seeds from the OS).
+                 rng_kind (str): The shoes' random generator, one of Cards.RNG_KINDS.
+                 capture (CaptureWriter): If set, the traffic of every connection and the offers are recorded
+                                          there (see Capture.py, replayed by Replay.py).
+                 deadlines (Deadlines): How long to wait for the players' requests and decisions (see Timers.py).
+                                        Defaults to Deadlines().
         """
         self.server_ip = None
         self.server_tcp_port = None
         self.tcp_socket = None
+        self.pacing = pacing if pacing is not None else FixedPacing(1.0)
+        self.stats_queue = stats_queue
+        self.decks = decks
+        self.penetration = penetration
+        self.tcp_nodelay = tcp_nodelay
+        self.log = log if log is not None else EventLog()
+        self.metrics = metrics if metrics is not None else DealerMetrics()
+        self.metrics_server = None
+        self.history = history
+        self.resumable_sessions = SessionRegistry(resume_grace)
+        self.admission = admission if admission is not None else AdmissionController()
+        self.pool = WorkerPool(self.handle_player, pool_size, pool_queue, self.metrics) if pool_size else None
+        self.hit_soft_17 = hit_soft_17
+        self.rng_kind = rng_kind
+        self.seeds = random.Random(seed) if seed is not None else None
+        self.seeds_lock = threading.Lock()
+        self.tables = TableLobby(self, table_seats, seat_timeout) if table_seats else None
+        self.capture = capture
+        self.deadlines = deadlines if deadlines is not None else Deadlines()
+        self.timers = TimerHeap()
+        self.parked_lock = threading.Lock()
+        self.parked_timer = None  # Polls the admission backlog while requests are parked there
+
+    def start_metrics_server(self, port=9100, host='127.0.0.1'):
+        """
+                Serves the dealer's metrics in the Prometheus text format on http://host:port/metrics.
 
+                Returns:
+                    int: The port of the endpoint.
+        """
+        self.metrics_server = MetricsServer(self.metrics.registry, port, host)
+        port = self.metrics_server.start()
+        self.log.info("metrics_listening", "Metrics available on http://{host}:{port}/metrics", host=host, port=port)
+        return port
 
     # step 2:
     def broadcast_offers(self, server_port):  # offer - The client is generally a "UDP server" (listener), and the
@@ -50,6 +140,7 @@ class Dealer:
                 - Message Type (1 byte)
                 - Server Port (2 bytes)
                 - Server Name (32 bytes, padded)
+                - Active Sessions (2 bytes) and Max Sessions (2 bytes, 0 = no limit), refreshed every offer
 
                 Args:
                     server_port (int): The TCP port number the dealer is listening on.
@@ -72,146 +163,710 @@ class Dealer:
 
         # Padding the server name to 32 bytes
         SERVER_NAME_PADDED = SERVER_NAME.encode('utf-8').ljust(32, b'\0')
-        packet = struct.pack('!I B H 32s', MAGIC_COOKIE, MSG_TYPE_OFFER, server_port, SERVER_NAME_PADDED)
+        packet = OFFER_STRUCT.pack(MAGIC_COOKIE, MSG_TYPE_OFFER, server_port, SERVER_NAME_PADDED)
 
-        print(f"Dealer started broadcasting on UDP port {UDP_DEST_PORT}...")
+        self.log.info("broadcast_start", "Dealer started broadcasting on UDP port {port}...", port=UDP_DEST_PORT)
 
+        next_saturated_offer = 0.0
         while True:
             try:
                 # The server sends an Offer message to the whole world (Broadcast).
-                udp_socket.sendto(packet, ('<broadcast>', UDP_DEST_PORT))
+                # A full dealer only announces every SATURATED_OFFER_INTERVAL (with its load), so the players'
+                # caches drop it in between and new players go to the other dealers
+                active, capacity = self.offer_load()
+                now = time.monotonic()
+                if not (capacity and active >= capacity) or now >= next_saturated_offer:
+                    offer = packet + OFFER_LOAD_STRUCT.pack(min(active, 0xFFFF), min(capacity, 0xFFFF))
+                    udp_socket.sendto(offer, ('<broadcast>', UDP_DEST_PORT))
+                    if self.capture is not None:
+                        self.capture.record_offer(offer)
+                    next_saturated_offer = now + SATURATED_OFFER_INTERVAL
                 time.sleep(1)
             except Exception as e:
-                print(f"Broadcast error: {e}")
+                self.log.warning("broadcast_error", "Broadcast error: {error}", error=str(e))
 
-    def handle_player(self, conn, addr):  # payload, request
+    def offer_load(self):
+        """
+                The load announced in the offers, so players can pick the emptiest dealer.
+
+                Returns:
+                    tuple: (active sessions, max sessions - 0 = no limit)
+        """
+        return self.admission.load()
+
+    def admit(self, team, addr):
+        """
+                Asks the admission controller for a slot for a new session (waiting in the backlog if needed).
+
+                Returns:
+                    bool: True if the session may start (call `self.admission.leave()` when it ends).
+        """
+        self.metrics.sessions_waiting.inc()
+        try:
+            admitted = self.admission.enter()
+        finally:
+            self.metrics.sessions_waiting.dec()
+        if not admitted:
+            self.metrics.sessions_rejected.inc()
+            self.log.warning("session_rejected", "Dealer is full, turning {team} away.", team=team, addr=addr)
+        return admitted
+
+    def handle_player(self, conn, addr, pooled=False):  # payload, request
         """
             Handles the communication session with a single connected player.
             Args:
                 conn (socket.socket): The active socket object representing the connection.
                 addr (tuple): A tuple containing the client's (IP, Port).
+                pooled (bool): Runs on a worker of the pool. A session that finds every slot taken then waits in
+                               the backlog without holding the worker (see `park_session`).
 
             Returns:
                 None
         """
         team_name = "Unknown"
-        with conn:
-            try:
-                # header = magic cookie 4 + type 1 = 5
-                conn.settimeout(60.0)
+        parked = False  # Waiting in the backlog: the connection stays open for its session
+        # A connection that does not send its request in time is closed (the timer cuts the read short)
+        request_timer = self.timers.call_later(self.deadlines.request, partial(shutdown_reads, conn))
+        try:
+            # header = magic cookie 4 + type 1 = 5
+            set_nodelay(conn, self.tcp_nodelay)
+            inbox = RecvBuffer(conn)
 
-                header_data = self.all_recv(conn, 5)
+            header_data = self.all_recv(inbox, HEADER_STRUCT.size)
 
-                if header_data is None:
-                    print("Connection lost while waiting for header.")
+            if header_data is None:
+                if request_timer.fired:
+                    self.request_timed_out(addr)
+                else:
+                    self.log.info("connection_lost", "Connection lost while waiting for header.", addr=addr)
+                return None
+
+            # (Unpack)
+            # I = 4 bytes (Cookie), B = 1 byte (Type)
+            cookie, msg_type = HEADER_STRUCT.unpack_from(header_data)
+
+            # Check the Magic Cookie:
+            if cookie != MAGIC_COOKIE:
+                self.log.warning("invalid_cookie", "Invalid Cookie: {cookie}. Kicking player out!",
+                                 cookie=hex(cookie), addr=addr)
+                self.metrics.protocol_violations.inc()
+                return
+
+            # check the type:
+            if msg_type in REQUEST_BODY_SIZE:
+
+                remaining_data = self.all_recv(inbox, REQUEST_BODY_SIZE[msg_type])
+                request_timer.cancel()
+                if request_timer.fired:  # Even if the request came just in time, the reads are shut now
+                    self.request_timed_out(addr)
+                    return None
+                if remaining_data is None:
+                    self.log.warning("incomplete_request", "Incomplete request packet", addr=addr)
+                    self.metrics.protocol_violations.inc()
                     return None
 
-                if len(header_data) < 5:
-                    print("Packet too short, closing connection.")
+                rounds, team_name, requested_ms = self.unpack_request(msg_type, remaining_data)
+                request = (conn, addr, inbox, msg_type, rounds, team_name, requested_ms)
+
+                if pooled and not self.admission.try_enter():
+                    parked = self.park_session(request)
+                    return None
+                if not pooled and not self.admit(team_name, addr):
                     return
 
-                # (Unpack)
-                # I = 4 bytes (Cookie), B = 1 byte (Type)
-                cookie, msg_type = struct.unpack('!I B', header_data)
+                self.play_session(*request)
 
-                # Check the Magic Cookie:
-                if cookie != MAGIC_COOKIE:
-                    print(f"Invalid Cookie: {hex(cookie)}. Kicking player out!")
-                    return
+            elif msg_type == MSG_TYPE_RESUME:
+                team_name = self.resume_session(conn, addr, inbox, request_timer)
 
-                # check the type:
-                if msg_type == MSG_TYPE_REQUEST:
+            elif msg_type == MSG_TYPE_MUX:
+                request_timer.cancel()  # Every session on the connection has its own deadlines
+                if request_timer.fired:
+                    self.request_timed_out(addr)
+                    return None
+                team_name = f"multiplexed players {addr}"
+                self.handle_mux(conn, addr, inbox)
 
-                    remaining_data = self.all_recv(conn, 33)
-                    if remaining_data is None:
-                        print("Connection lost while waiting for header.")
-                        return None
+            else:
+                self.log.warning("unknown_type", "Unknown message type: {msg_type}", msg_type=msg_type, addr=addr)
+                self.metrics.protocol_violations.inc()
 
-                    if len(remaining_data) < 33:
-                        print("Incomplete request packet")
-                        return
+        except Exception as e:
+            self.log.error("session_error", "Error handling player {addr}: {error}", addr=addr, error=str(e))
 
-                    rounds, team_name_bytes = struct.unpack('!B 32s', remaining_data)
-                    team_name = team_name_bytes.decode('utf-8').strip('\x00')
+        finally:
+            request_timer.cancel()
+            if not parked:
+                conn.close()
 
-                    print(f"{team_name} connected requesting {rounds} rounds.")
+        self.log.info("connection_closed", "Connection with {team} closed.", team=team_name)
 
-                    # step 4
-                    print(f"Welcome to the Game {team_name}!")
-                    self.play(conn, rounds, team_name)
+    def play_session(self, conn, addr, inbox, msg_type, rounds, team_name, requested_ms):
+        """
+            Plays a requested session on its connection (which the caller closes). Its slot is already taken,
+            and is freed at the end.
 
-                else:
-                    print(f"Unknown message type: {msg_type}")
+            Args:
+                conn (socket.socket): The player's connection, the request already read.
+                addr (tuple): The client's (IP, Port).
+                inbox (RecvBuffer): The connection's receive buffer.
+                msg_type (int): The request's type.
+                rounds (int): Rounds requested.
+                team_name (str): The team name.
+                requested_ms (int): The pause between rounds the player asked for (None = not asked).
+        """
+        self.log.info("session_start", "{team} connected requesting {rounds} rounds.\n"
+                                       "Welcome to the Game {team}!",
+                      team=team_name, rounds=rounds, pacing_ms=requested_ms)
+
+        # step 4
+        session = None
+        self.metrics.sessions.inc()
+        self.metrics.sessions_active.inc()
+        try:
+            if msg_type == MSG_TYPE_RESUMABLE_REQUEST:
+                # Played on a session that outlives this connection
+                session = self.resumable_sessions.open(conn, team_name)
+                conn, inbox = session, RecvBuffer(session)
+            delay = self.pacing.session_delay(requested_ms)
+            if self.tables is not None:
+                statistics = self.tables.play(conn, inbox, rounds, team_name, delay)
+            else:
+                statistics = self.play(conn, rounds, team_name, delay, inbox)
+        finally:
+            self.metrics.sessions_active.dec()
+            self.admission.leave()
+            if session is not None:
+                session.close()
+            if self.pool is not None:
+                self.start_parked_sessions()
+        self.report_session(team_name, statistics)
+
+    def park_session(self, request):
+        """
+            Puts a request that found every slot taken in the backlog, so that the pool worker that read it can
+            serve other connections meanwhile. A freed slot (here or, with a shared count, in another process)
+            starts the session on the next free worker.
 
-            except socket.timeout:
-                print(f" {team_name} it's been over a minute since you responded, are you cheating?! I'm kicking you "
-                      f"out!")
+            Args:
+                request (tuple): The arguments of `play_session`.
 
-            except Exception as e:
-                print(f"Error handling player {addr}: {e}")
+            Returns:
+                bool: True if the request waits in the backlog, False if it was turned away (the backlog is full).
+        """
+        if not self.admission.park(request):
+            self.metrics.sessions_rejected.inc()
+            self.log.warning("session_rejected", "Dealer is full, turning {team} away.", team=request[5],
+                             addr=request[1])
+            return False
+        self.metrics.sessions_waiting.inc()
+        with self.parked_lock:
+            if self.parked_timer is None:
+                self.parked_timer = self.timers.call_later(ADMISSION_POLL, self.poll_parked_sessions)
+        return True
+
+    def poll_parked_sessions(self):
+        """
+            Runs on the timer thread while requests are parked: starts the ones that got a slot freed in another
+            process, and turns away the ones that waited too long.
+        """
+        with self.parked_lock:
+            self.parked_timer = None
+        self.start_parked_sessions()
+        with self.parked_lock:
+            if self.admission.parked and self.parked_timer is None:
+                self.parked_timer = self.timers.call_later(ADMISSION_POLL, self.poll_parked_sessions)
+
+    def start_parked_sessions(self):
+        """
+            Hands the free slots to the parked requests and queues their sessions for the pool's workers.
+        """
+        admitted, expired = self.admission.unpark()
+        for request in admitted:
+            self.metrics.sessions_waiting.dec()
+            if not self.pool.submit_call(self.run_parked_session, request):
+                self.admission.leave()
+                self.log.warning("pool_full", "All workers are busy and the queue is full, refusing {addr}.",
+                                 addr=request[1])
+                request[0].close()
+        for conn, addr, _, _, _, team_name, _ in expired:
+            self.metrics.sessions_waiting.dec()
+            self.metrics.sessions_rejected.inc()
+            self.log.warning("session_rejected", "Dealer is full, turning {team} away.", team=team_name, addr=addr)
+            conn.close()
+
+    def run_parked_session(self, request):
+        """
+            A pool worker's job: plays the session of a request that waited in the backlog.
+        """
+        conn, addr, team_name = request[0], request[1], request[5]
+        try:
+            self.play_session(*request)
+        except Exception as e:
+            self.log.error("session_error", "Error handling player {addr}: {error}", addr=addr, error=str(e))
+        finally:
+            conn.close()
+        self.log.info("connection_closed", "Connection with {team} closed.", team=team_name)
 
+    def request_timed_out(self, addr):
+        self.log.warning("request_timeout", "{addr} did not send a request within {seconds}s. Closing.", addr=addr,
+                         seconds=self.deadlines.request)
+        self.metrics.timeouts.inc()
 
-        print(f"Connection with {team_name} closed.")
+    def resume_session(self, conn, addr, inbox, request_timer=None):
+        """
+            Moves a resumable session to the player's new connection. The session's own thread goes on playing
+            on it; this one returns right away.
 
-    def current_dealer_sum(self,dealer_hand):
+            Args:
+                conn (socket.socket): The new connection, its resume message header already read.
+                addr (tuple): The client's (IP, Port).
+                inbox (RecvBuffer): The connection's receive buffer.
+                request_timer (Timer): The connection's request deadline, cancelled before the socket is handed over.
+
+            Returns:
+                str: The session's team name ("Unknown" if it was not resumed).
+        """
+        body = self.all_recv(inbox, SESSION_BODY_STRUCT.size)
+        if request_timer is not None:
+            request_timer.cancel()
+            if request_timer.fired:
+                self.request_timed_out(addr)
+                return "Unknown"
+        if body is None:
+            self.log.warning("incomplete_request", "Incomplete resume packet", addr=addr)
+            self.metrics.protocol_violations.inc()
+            return "Unknown"
+        token, received = SESSION_BODY_STRUCT.unpack_from(body)
+        session = self.resumable_sessions.get(token)
+        if session is None:
+            self.log.info("resume_rejected", "Unknown or expired session from {addr}, closing.", addr=addr)
+            return "Unknown"
+        # The session owns the socket from now on, this handler must not close it
+        if not session.resume(socket.socket(fileno=conn.detach()), received):
+            self.log.info("resume_rejected", "Session of {team} cannot be resumed, closing.", team=session.team)
+            return "Unknown"
+        self.metrics.sessions_resumed.inc()
+        self.log.info("session_resumed", "{team} reconnected from {addr}, resuming the session.", team=session.team,
+                      addr=addr)
+        return session.team
+
+    def handle_mux(self, conn, addr, inbox):
+        """
+            Serves a multiplexed connection: every session on it is handled by `handle_player`
+            (in its own thread, or on the worker pool if the dealer has one) as if it had its own connection.
+
+            Args:
+                conn (socket.socket): The shared connection.
+                addr (tuple): The client's (IP, Port).
+                inbox (RecvBuffer): The connection's receive buffer, the first mux header already read.
+        """
+        conn.settimeout(None)  # Every session times out on its own
+        demux = MuxDemultiplexer(conn, from_dealer=False, message_size=PAYLOAD_STRUCT.size)
+        # Without an open session, the connection has the request deadline to send its next mux message
+        idle_timer = None
+        idled = done = False
+
+        def check_idle():
+            nonlocal idle_timer, idled
+            if done:
+                return
+            idle = demux.idle()
+            if idle is not None and idle >= self.deadlines.request:
+                idled = True
+                shutdown_reads(conn)
+                return
+            wait = self.deadlines.request - idle if idle is not None else self.deadlines.request
+            idle_timer = self.timers.call_later(wait, check_idle)
+
+        def start_session(session):
+            if self.pool is None:
+                session_thread = threading.Thread(target=self.handle_player, args=(session, addr))
+                session_thread.start()
+            elif not self.pool.submit(session, addr, True):
+                # Like a connection when the pool's queue is full: only this session is refused
+                self.log.warning("pool_full", "All workers are busy and the queue is full, refusing session "
+                                              "{session} of {addr}.", session=session.session_id, addr=addr)
+                session.close()
+
+        def refuse_session(session_id, msg_type):
+            self.log.warning("mux_refused", "{addr} sent message type {msg_type} on session {session} of its "
+                                            "multiplexed connection, which cannot carry it. Closing the session.",
+                             addr=addr, msg_type=hex(msg_type), session=session_id)
+            self.metrics.protocol_violations.inc()
+
+        idle_timer = self.timers.call_later(self.deadlines.request, check_idle)
+        try:
+            error = demux.read_messages(inbox, start_session, header_read=True, on_refused=refuse_session)
+        finally:
+            done = True
+            idle_timer.cancel()
+        if idled:
+            self.log.warning("mux_idle", "{addr} sent nothing on its multiplexed connection without a session for "
+                                         "{seconds}s. Closing.", addr=addr, seconds=self.deadlines.request)
+            self.metrics.timeouts.inc()
+        elif error:
+            self.log.warning("mux_error", "{error}. Closing the multiplexed connection with {addr}.", error=error,
+                             addr=addr)
+            self.metrics.protocol_violations.inc()
+
+    def unpack_request(self, msg_type, data):
         """
-                Calculates the total value of the cards currently in the dealer's hand.
+                Parses the body of a request / paced request / resumable request.
+
+                Args:
+                    msg_type (int): MSG_TYPE_REQUEST, MSG_TYPE_PACED_REQUEST or MSG_TYPE_RESUMABLE_REQUEST.
+                    data (bytes): The body that followed the cookie and type (may be longer than the body).
 
                 Returns:
-                    int: The cur sum of the card values.
-         """
-        total_sum = 0
-        for card in dealer_hand:
-            total_sum += card.get_value()
-        return total_sum
-
-    def all_recv(self, sock, n):
-        data = b''
+                    tuple: (rounds, team name, requested pause in ms or None).
+        """
+        if msg_type != MSG_TYPE_REQUEST:
+            rounds, team_name_bytes, requested_ms = PACED_REQUEST_STRUCT.unpack_from(data)
+        else:
+            rounds, team_name_bytes = REQUEST_STRUCT.unpack_from(data)
+            requested_ms = None
+        return rounds, team_name_bytes.decode('utf-8').strip('\x00'), requested_ms
+
+    def report_session(self, team, statistics):
+        """
+                Sends the statistics of a finished session to the stats queue (pre-fork mode).
+
+                Args:
+                    team (str): The team name.
+                    statistics (dict): wins / losses / ties of the session.
+        """
+        if self.stats_queue is not None and statistics is not None:
+            self.stats_queue.put((os.getpid(), team, statistics))
+
+    def dealer_hits(self, dealer_hand):
+        """
+                The dealer's rule: hit below 17, and on a soft 17 if the table says so.
+
+                Args:
+                    dealer_hand (Hand): The dealer's hand.
+
+                Returns:
+                    bool: True if the dealer takes another card.
+        """
+        total = dealer_hand.total
+        return total < DEALER_STAND_ON or (self.hit_soft_17 and total == DEALER_STAND_ON and dealer_hand.soft)
+
+    def new_shoe(self, seed=None):
+        """
+                A shuffled shoe with its own random generator, for a session (or a table).
+
+                Args:
+                    seed (int): Deal from the shoe of this seed (None = the next seed of the dealer).
+
+                Returns:
+                    tuple: (Shoe, seed) - the same seed deals the same shoe again (see History.replay_session).
+        """
+        if seed is None and self.seeds is None:
+            seed = new_seed()
+        elif seed is None:
+            with self.seeds_lock:
+                seed = self.seeds.getrandbits(64)
+        shoe = Shoe(self.decks, self.penetration, make_rng(seed, self.rng_kind))
+        shoe.shuffle()
+        return shoe, seed
+
+    def start_history(self, team, seed=None):
+        """
+                Registers a session in the history log, if the dealer keeps one.
+
+                Args:
+                    team (str): The team name.
+                    seed (int): The seed of the session's own shoe (None if it shares one, at a table).
+
+                Returns:
+                    tuple: The session handle for `record_history` (None = no history).
+        """
+        if self.history is None:
+            return None
+        return self.history.start_session(team, seed, self.rng_kind, self.decks, self.penetration)
+
+    def all_recv(self, inbox, n):
+        """
+                Reads exactly n bytes into the connection's receive buffer.
+
+                Args:
+                    inbox (RecvBuffer): The connection's receive buffer.
+                    n (int): Number of bytes to read.
+
+                Returns:
+                    bytearray: The buffer holding the data at its start (valid until the next read),
+                               or None if the connection was lost.
+        """
         try:
-            while len(data) < n:
-                more = sock.recv(n - len(data))
-                if not more:
-                    print("Connection closed before receiving full data")
-                    return
-                data += more
+            data = inbox.recv_exact(n)
+            if data is None:
+                self.log.debug("recv_closed", "Connection closed before receiving full data")
+            else:
+                self.metrics.bytes_received.inc(n)
             return data
         except (ConnectionResetError, ConnectionAbortedError):
             return None
+        except socket.timeout:
+            raise  # The caller decides what a player that does not answer costs
         except Exception as e:
-            print(f"Unexpected error during recv: {e}")
+            self.log.error("recv_error", "Unexpected error during recv: {error}", error=str(e))
+            return None
+
+    def read_decision(self, inbox, team, timer=None):
+        """
+                Reads the player's next move (header + decision).
+
+                Args:
+                    inbox (RecvBuffer): The connection's receive buffer.
+                    team (str): The team name (for the event log).
+                    timer (Timer): The decision's deadline - a read it cut short is not logged as a lost connection.
+
+                Returns:
+                    str: "Hittt" or "Stand", or None if the player must leave (the connection was lost or it broke
+                         the protocol - already logged).
+
+                Raises:
+                    socket.timeout: If the player did not answer within the connection's timeout.
+        """
+        new_header = self.all_recv(inbox, HEADER_STRUCT.size)
+        if not new_header:
+            if timer is None or not timer.fired:
+                self.log.info("connection_lost", "Connection lost with {team}. Closing session.", team=team)
+            return None
+        if not self.check_decision_header(new_header, team):
             return None
 
+        decision_data = self.all_recv(inbox, DECISION_SIZE)
+        if not decision_data:
+            self.log.warning("incomplete_decision", "Failed to receive move content from {team}.", team=team)
+            return None
+        return self.parse_move(decision_data, team)
+
+    def check_decision_header(self, header, team):
+        """
+                Checks the header of a player's move. Shared by the threaded and the asyncio dealer.
+
+                Returns:
+                    bool: False if the player broke the protocol and must leave (already logged).
+        """
+        cookie, m_type = HEADER_STRUCT.unpack_from(header)
+
+        # Check the Magic Cookie:
+        if cookie != MAGIC_COOKIE:
+            self.log.warning("invalid_cookie", "Invalid Cookie: {cookie}. Kicking player out!", cookie=hex(cookie),
+                             team=team)
+            self.metrics.protocol_violations.inc()
+            return False
+
+        if m_type != MSG_TYPE_PAYLOAD:
+            self.log.warning("protocol_error", "Protocol Error: Received MSG_TYPE {msg_type} instead of 0x4 "
+                                               "from {team}. Kicking player out!", msg_type=hex(m_type), team=team)
+            self.metrics.protocol_violations.inc()
+            return False
+        return True
+
+    def parse_move(self, decision_data, team):
+        """
+                Reads the move out of a decision body. Shared by the threaded and the asyncio dealer.
+
+                Returns:
+                    str: "Hittt" or "Stand", or None if it is not a move (the player must leave - already logged).
+        """
+        # Compared in place, decoded only to report a bad move
+        if decision_data.startswith(b"Stand"):
+            return "Stand"
+        if decision_data.startswith(b"Hittt"):
+            return "Hittt"
+        move = decision_data[:DECISION_SIZE].decode('utf-8', 'replace').strip()
+        self.log.warning("illegal_move", "Illogical move received: '{move}' from {team}. "
+                                         "Protocol violation! Kicking player out.", move=move, team=team)
+        self.metrics.protocol_violations.inc()
+        return None
+
+    def read_timed_decision(self, inbox, team, wake, session_end, turn=None):
+        """
+                Reads the player's next move before its deadline. The deadline is a timer, not a socket timeout:
+                when it passes, `wake` cuts the read short.
+
+                Args:
+                    inbox (RecvBuffer): The connection's receive buffer.
+                    team (str): The team name (for the event log).
+                    wake (callable): Ends the connection's reads (see Timers.shutdown_reads).
+                    session_end (float): The session's deadline (None = no limit).
+                    turn (float): Seconds for the decision (None = the dealer's Deadlines.turn).
+
+                Returns:
+                    str: "Hittt" or "Stand", "Timeout" if the deadline passed first (the player stands and must
+                         leave after the round), or None if the player must leave now (all already logged).
+                         A move read just as the deadline passed is a timeout too: the reads are shut by then.
+        """
+        when, session_over = self.deadlines.decision_end(session_end, turn)
+        timer = self.timers.call_at(when, wake)
+        try:
+            move = self.read_decision(inbox, team, timer)
+        finally:
+            timer.cancel()
+        if timer.fired:
+            self.decision_timed_out(team, session_over)
+            return "Timeout"
+        return move
+
+    def decision_timed_out(self, team, session_over):
+        if session_over:
+            self.log.warning("session_timeout", "{team}'s session ran out of time! Standing for them and letting "
+                                                "them go.", team=team)
+        else:
+            self.log.warning("turn_timeout", "{team} took too long to respond this turn! Standing for them and "
+                                             "letting them go.", team=team)
+        self.metrics.timeouts.inc()
+
+    def pack_payload_card(self, result, card):
+        """
+        Builds the payload packet for a single card / round result.
+        Shared by the threaded and the asyncio dealer.
+
+        result: 0x0 / 0x1 / 0x2 / 0x3
+        card: Card object
+        """
+        return PAYLOAD_STRUCT.pack(MAGIC_COOKIE, MSG_TYPE_PAYLOAD, result, card.rank, card.suit)
+
     def send_payload_card(self, conn, result, card):
         """
         result: 0x0 / 0x1 / 0x2 / 0x3
         card: Card object
         """
-        packet = struct.pack(
-            '!I B B H B',
-            MAGIC_COOKIE,
-            MSG_TYPE_PAYLOAD,
-            result,
-            card.rank,
-            card.suit
-        )
-        conn.sendall(packet)
+        conn.sendall(self.pack_payload_card(result, card))
 
+    def settle_round(self, team, player_total, dealer_total, statistics):
+        """
+                Decides the winner of a round in which the player did not bust.
 
-    def play(self, conn, rounds, team):
+                Args:
+                    team (str): The team name (for the event log).
+                    player_total (int): The player's final total.
+                    dealer_total (int): The dealer's final total.
+                    statistics (dict): The session statistics, updated in place.
+
+                Returns:
+                    int: The result code to send (0x1 tie, 0x2 loss, 0x3 win).
         """
-                Manages the main game loop for a specific client connection.
+        if dealer_total > BLACKJACK:
+            self.log.info("round_result", "Result: Dealer busts, {team} wins.", team=team, result="win",
+                          reason="dealer_bust", player_total=player_total, dealer_total=dealer_total)
+            statistics["wins"] += 1
+            return 0x3
+        if player_total > dealer_total:
+            self.log.info("round_result", "Result: {team} has higher total, {team} wins.", team=team, result="win",
+                          reason="higher_total", player_total=player_total, dealer_total=dealer_total)
+            statistics["wins"] += 1
+            return 0x3
+        if dealer_total > player_total:
+            self.log.info("round_result", "Result: Dealer has higher total, {team} loses.", team=team, result="loss",
+                          reason="lower_total", player_total=player_total, dealer_total=dealer_total)
+            statistics["losses"] += 1
+            return 0x2
+        self.log.info("round_result", "Result: Tie! {team}: {player_total}, Dealer: {dealer_total}", team=team,
+                      result="tie", reason="equal_total", player_total=player_total, dealer_total=dealer_total)
+        statistics["ties"] += 1
+        return 0x1
+
+
+    def record_round(self, round_seconds, compute_seconds):
+        """
+                Updates the round metrics once a round has been played to its result.
 
-                Responsibilities:
-                1. Initializes the deck and deals initial cards.
+                Args:
+                    round_seconds (float): The round's duration, pacing excluded.
+                    compute_seconds (float): The part of it the dealer spent dealing, settling and sending
+                                             (the rest was spent waiting for the player's decisions).
+        """
+        self.metrics.rounds.inc()
+        self.metrics.round_seconds.observe(round_seconds)
+        self.metrics.dealer_compute.observe(compute_seconds)
+
+    def record_history(self, session, round_num, player_hand, dealer_hand, player_total, dealer_total, result):
+        """
+                Appends a finished round to the history log, if the dealer keeps one.
+
+                Args:
+                    session (tuple): The session handle from HistoryWriter.start_session (None = no history).
+                    result (int): The result code sent to the player.
+        """
+        if session is not None:
+            self.history.record_round(session, round_num, player_hand, dealer_hand, player_total, dealer_total,
+                                      result)
+
+    def play(self, conn, rounds, team, delay=1.0, inbox=None, seed=None):
+        """
+                Manages the main game loop for a specific client connection: plays the rounds of `session_steps`
+                with blocking reads and sends.
+
+                Args:
+                    conn (socket.socket): The active TCP socket for communication.
+                    rounds (int): Number of rounds requested.
+                    team (str): The team name.
+                    delay (float): Seconds to pause before each round and before the dealer's turn.
+                    inbox (RecvBuffer): The connection's receive buffer (created if None).
+                    seed (int): Deal from the shoe of this seed, e.g. to replay a captured session (None = a new
+                                shoe).
+
+                Returns:
+                    dict: The statistics of the rounds that were completed.
+        """
+        if inbox is None:
+            inbox = RecvBuffer(conn)
+        # Every step's payloads are collected and sent together
+        out = FrameBuffer(conn)
+        wake = partial(shutdown_reads, conn)
+        steps = self.session_steps(conn, rounds, team, delay, seed, out)
+        try:
+            step, argument = next(steps)
+            while True:
+                try:
+                    if step == STEP_SEND:
+                        answer = out.flush()
+                    elif step == STEP_DECIDE:
+                        answer = self.read_timed_decision(inbox, team, wake, argument)
+                    else:
+                        time.sleep(argument)
+                        answer = None
+                except Exception as e:
+                    step, argument = steps.throw(e)
+                    continue
+                step, argument = steps.send(answer)
+        except StopIteration as finished:
+            return finished.value
+
+    def session_steps(self, conn, rounds, team, delay, seed, out):
+        """
+                The rules of a session without its I/O, shared by the threaded and the asyncio dealer:
+                1. Initializes the session's shoe and deals initial cards.
                 2. Sends initial game state to the player.
                 3. Waits for player actions (Hit/Stand) via the protocol.
                 4. Executes dealer logic.
                 5. Determines the winner and sends the result.
 
+                A generator: it yields (step, argument) for what it needs from the connection, and gets the answer
+                sent back -
+                    (STEP_PAUSE, seconds): wait; the answer is None.
+                    (STEP_SEND, None): send the payloads collected in `out`; the answer is the number of bytes sent.
+                    (STEP_DECIDE, session end): read the player's next move before its deadline; the answer is
+                        "Hittt", "Stand", "Timeout" (it stands and leaves after the round) or None (it must leave
+                        now - already logged).
+                An I/O error is thrown into it: it ends the session quietly during the player's turn.
+
                 Args:
-                    conn (socket.socket): The active TCP socket for communication.
-        """
+                    conn: The connection, or the asyncio stream writer (to find its capture).
+                    rounds (int): Number of rounds requested.
+                    team (str): The team name.
+                    delay (float): Seconds to pause before each round and before the dealer's turn.
+                    seed (int): Deal from the shoe of this seed (None = a new shoe).
+                    out (FrameBuffer): Where the payloads are collected.
 
+                Returns:
+                    dict: The statistics of the rounds that were completed (the generator's return value).
+        """
         # Statistics
         statistics = {
             "wins": 0,
@@ -219,142 +874,133 @@ class Dealer:
             "ties": 0
         }
 
+        # One shoe for the whole session, reshuffled at the cut card - its seed is logged and kept in the history
+        shoe, seed = self.new_shoe(seed)
+        self.log.debug("session_shoe", "{team} plays from a shoe with seed {seed}", team=team, seed=seed)
+        if self.capture is not None:
+            self.capture.record_shoe(conn, seed, self.rng_kind, self.decks, self.penetration, self.hit_soft_17)
+
+        history_session = self.start_history(team, seed)
+        metrics = self.metrics
+        perf_counter = time.perf_counter
+        session_end = self.deadlines.session_end()
+        timed_out = False
+
         for round_num in range(1, rounds + 1):
 
-            time.sleep(1)
-            print(f"\n==={team} starting round {round_num} ===")
+            if timed_out:
+                return statistics  # It stood on its last round, it plays no more
+            if delay:
+                yield STEP_PAUSE, delay
+            round_start = perf_counter()
+            self.log.debug("round_start", "\n==={team} starting round {round} ===", team=team, round=round_num)
 
             # Initial Deal - round 0:
-            deck = Deck()  # Deck to each thread
-            deck.shuffle()
-
-            player_hand = []
-            dealer_hand = []
-
-            player_hand.append(deck.deal_one())
-            dealer_hand.append(deck.deal_one())  # The player will see it
-            player_hand.append(deck.deal_one())
-            dealer_hand.append(deck.deal_one())  # The player cannot see it
-
-            self.send_payload_card(conn, 0x0, player_hand[0])
-            self.send_payload_card(conn, 0x0, player_hand[1])
-            self.send_payload_card(conn, 0x0, dealer_hand[0])
-
-            player_total = sum([card.get_value() for card in player_hand])
-            print(f"{team} initial cards: {[c.print_card() for c in player_hand]}")
-            print(f"{team} total: {player_total}")
-            print(f"Dealer that play with {team} visible card: {dealer_hand[0].print_card()}")
-            print(f"Dealer that play with {team} invisible card: {dealer_hand[1].print_card()}")
-            print(f"Dealer that play with {team} total: {self.current_dealer_sum(dealer_hand)}")
-
-            flag = True
-            while flag:
-                conn.settimeout(60.0)
+            if shoe.discards_shuffled:  # Reset by start_round
+                self.log.debug("shuffle", "The shoe of {team} ran out during the last round, its discards were "
+                                          "reshuffled", team=team)
+            if shoe.start_round():
+                self.log.debug("shuffle", "Cut card reached, shuffling the shoe of {team}", team=team)
+
+            player_hand = Hand()
+            dealer_hand = Hand()
+
+            player_hand.add(shoe.deal_one())
+            dealer_hand.add(shoe.deal_one())  # The player will see it
+            player_hand.add(shoe.deal_one())
+            dealer_hand.add(shoe.deal_one())  # The player cannot see it
+
+            out.add_card(0x0, player_hand[0])
+            out.add_card(0x0, player_hand[1])
+            out.add_card(0x0, dealer_hand[0])
+            metrics.bytes_sent.inc((yield STEP_SEND, None))
+            wait_start = perf_counter()
+            compute = wait_start - round_start
+
+            player_total = player_hand.total
+            self.log.debug("initial_deal", "{team} initial cards: {card1}, {card2}\n{team} total: {total}\n"
+                                          "Dealer that play with {team} visible card: {up_card}\n"
+                                          "Dealer that play with {team} invisible card: {hole_card}\n"
+                                          "Dealer that play with {team} total: {dealer_total}",
+                           team=team, round=round_num, card1=player_hand[0], card2=player_hand[1],
+                           total=player_total, up_card=dealer_hand[0], hole_card=dealer_hand[1],
+                           dealer_total=dealer_hand.total)
+
+            while True:
                 # (Hittt / Stand)
                 try:
-                    # checking fo new msg:
-                    new_header = self.all_recv(conn, 5)
-
-                    if not new_header:
-                        print(f"Connection lost with {team}. Closing session.")
-                        return
-
-                    cookie, m_type = struct.unpack('!I B', new_header)
-
-                    # Check the Magic Cookie:
-                    if cookie != MAGIC_COOKIE:
-                        print(f"Invalid Cookie: {hex(cookie)}. Kicking player out!")
-                        return
-
-                    if m_type != MSG_TYPE_PAYLOAD:
-                        print(
-                            f"Protocol Error: Received MSG_TYPE {hex(m_type)} instead of 0x4 from {team}. Kicking player out!")
-                        return
-
-                    else:
-
-                        decision_data = self.all_recv(conn, 5)
-
-                        if not decision_data:
-                            print(f"Failed to receive move content from {team}.")
-                            return
-
-                        move = struct.unpack('!5s', decision_data)[0].decode('utf-8').strip()
-
-                        if move == "Stand":
-                            print(f"{team} decision: {move}")
-                            flag = False
-                            break
-
-                        elif move == "Hittt":
-                            print(f"Player decision: {move}")
-                            new_card = deck.deal_one()
-                            player_hand.append(new_card)
-                            player_total = sum([c.get_value() for c in player_hand])
-                            self.send_payload_card(conn, 0x0, new_card)
-                            print(f"{team} received: {new_card.print_card()}")
-                            print(f"{team} total: {player_total}")
-                            if player_total > 21:
-
-                                flag = False
-                                break
-
-                        else:
-                            print(
-                                f"Illogical move received: '{move}' from {team}. Protocol violation! Kicking player out.")
-                            return
-                except socket.timeout:
-                    print(f"{team} took too long to respond this turn! Kicking out.")
-                    return
-
+                    move = yield STEP_DECIDE, session_end
+                    if move is None:
+                        return statistics
+                    decided = perf_counter()
+                    metrics.decision_wait.observe(decided - wait_start)
+
+                    if move == "Timeout":
+                        timed_out = True
+                        break
+                    if move == "Stand":
+                        self.log.debug("decision", "{team} decision: Stand", team=team, move="Stand")
+                        break
+
+                    new_card = shoe.deal_one()
+                    player_total = player_hand.add(new_card)
+                    out.add_card(0x0, new_card)
+                    metrics.bytes_sent.inc((yield STEP_SEND, None))
+                    wait_start = perf_counter()
+                    compute += wait_start - decided
+                    self.log.debug("decision", "{team} decision: Hittt\n{team} received: {card}\n"
+                                               "{team} total: {total}", team=team, move="Hittt", card=new_card,
+                                   total=player_total)
+                    if player_hand.is_bust():
+                        break
                 except Exception as e:
-                    print(f"Error during {team}'s turn: {e}")
-                    return
-
-            time.sleep(1)
-            if player_total > 21:
-                print(f"{team} busts! Dealer wins this round")
-                self.send_payload_card(conn, 0x2,Card(0,0))  # player loss
+                    self.log.error("turn_error", "Error during {team}'s turn: {error}", team=team, error=str(e))
+                    return statistics
+
+            round_time = perf_counter() - round_start
+            if delay:
+                yield STEP_PAUSE, delay
+            turn_start = perf_counter()
+            if player_hand.is_bust():
+                self.log.info("round_result", "{team} busts! Dealer wins this round", team=team, result="loss",
+                              reason="player_bust", player_total=player_total)
+                out.add_card(0x2, NO_CARD)  # player loss
+                metrics.bytes_sent.inc((yield STEP_SEND, None))
                 statistics["losses"] += 1
+                self.record_history(history_session, round_num, player_hand, dealer_hand, player_total,
+                                    dealer_hand.total, 0x2)
+                turn_time = perf_counter() - turn_start
+                self.record_round(round_time + turn_time, compute + turn_time)
                 continue
             # dealer
-            self.send_payload_card(conn, 0x0, dealer_hand[1])
-            dealer_total = self.current_dealer_sum(dealer_hand)
-            while dealer_total < 17:
-                new_card = deck.deal_one()
-                dealer_hand.append(new_card)
-                dealer_total = self.current_dealer_sum(dealer_hand)
-                self.send_payload_card(conn, 0x0, new_card)
-                print(f"Dealer that play with {team}received: {new_card.print_card()}")
-                print(f"Dealer that play with {team} total: {dealer_total}")
+            out.add_card(0x0, dealer_hand[1])
+            while self.dealer_hits(dealer_hand):
+                new_card = shoe.deal_one()
+                dealer_hand.add(new_card)
+                out.add_card(0x0, new_card)
+                self.log.debug("dealer_card", "Dealer that play with {team} received: {card}\n"
+                                               "Dealer that play with {team} total: {total}",
+                               team=team, round=round_num, card=new_card, total=dealer_hand.total)
+            dealer_total = dealer_hand.total
 
             # Deciding winner
-            result = 0x0
-            if dealer_total > 21:
-                result = 0x3
-                print(f"Result: Dealer busts, {team} wins.")
-                statistics["wins"] += 1
-            else:
-                if player_total > dealer_total:
-                    result = 0x3
-                    print(f"Result: {team} has higher total, {team} wins.")
-                    statistics["wins"] += 1
-                elif dealer_total > player_total:
-                    result = 0x2
-                    print(f"Result: Dealer has higher total, {team} loses.")
-                    statistics["losses"] += 1
-                else:
-                    result = 0x1
-                    print(f"Result: Tie! {team}: {player_total}, Dealer: {dealer_total}")
-                    statistics["ties"] += 1
+            result = self.settle_round(team, player_total, dealer_total, statistics)
 
-            self.send_payload_card(conn, result,Card(0,0))
-            print(f"End of round {round_num} for {team}")
+            # The dealer's whole turn and the result go out together
+            out.add_card(result, NO_CARD)
+            metrics.bytes_sent.inc((yield STEP_SEND, None))
+            self.record_history(history_session, round_num, player_hand, dealer_hand, player_total, dealer_total,
+                                result)
+            turn_time = perf_counter() - turn_start
+            self.record_round(round_time + turn_time, compute + turn_time)
+            self.log.debug("round_end", "End of round {round} for {team}", team=team, round=round_num)
 
-        print(f"\n{team} - All rounds finished")
         total_played = statistics["wins"] + statistics["losses"] + statistics["ties"]
         win_rate = statistics["wins"] / total_played if total_played > 0 else 0
-        print(f"{team} finished {total_played} rounds, win rate: {win_rate:.2f}")
+        self.log.info("session_end", "\n{team} - All rounds finished\n{team} finished {rounds} rounds, "
+                                     "win rate: {win_rate:.2f}", team=team, rounds=total_played, win_rate=win_rate,
+                      **statistics)
+        return statistics
 
     def start_dealer(self):
         """
@@ -369,21 +1015,82 @@ class Dealer:
             server_socket.listen()
 
             server_ip, server_port = server_socket.getsockname()
-            print(f"Dealer is listening on TCP IP {server_ip} and PORT {server_port}")
+            self.log.info("listening", "Dealer is listening on TCP IP {ip} and PORT {port}", ip=server_ip,
+                          port=server_port)
 
             broadcast_thread = threading.Thread(target=self.broadcast_offers, args=(server_port,))
             broadcast_thread.daemon = True
             broadcast_thread.start()
 
-            # get players
-            while True:
-                conn, addr = server_socket.accept()
+            self.accept_players(server_socket)
+
+    def accept_players(self, server_socket):
+        """
+            Accepts players forever on a listening socket, one thread per player (or queued for the worker pool).
+
+            Args:
+                server_socket (socket.socket): A bound, listening TCP socket.
+        """
+        # get players
+        while True:
+            conn, addr = server_socket.accept()
+            if self.capture is not None:
+                conn = self.capture.wrap(conn, addr)
+
+            if self.pool is not None:
+                # The pool's queue is full: refuse now instead of making every waiting player wait longer
+                if not self.pool.submit(conn, addr, True):
+                    self.log.warning("pool_full", "All workers are busy and the queue is full, refusing {addr}.",
+                                     addr=addr)
+                    conn.close()
+                continue
 
-                # If a new player came, we send him to the handle_player func
-                client_thread = threading.Thread(target=self.handle_player, args=(conn, addr))
-                client_thread.start()
+            # If a new player came, we send him to the handle_player func
+            client_thread = threading.Thread(target=self.handle_player, args=(conn, addr))
+            client_thread.start()
 
 
 if __name__ == '__main__':
-    dealer = Dealer()
-    dealer.start_dealer()
+    parser = argparse.ArgumentParser(description="The threaded Blackjack dealer.")
+    parser.add_argument("--metrics-port", type=int, default=None, help="serve Prometheus metrics on this port")
+    parser.add_argument("--history", metavar="FILE", help="append every round to this history log")
+    parser.add_argument("--resume-grace", type=float, default=30.0,
+                        help="seconds a resumable session waits for its player to reconnect")
+    parser.add_argument("--max-sessions", type=int, default=0, help="sessions played at once (0 = no limit)")
+    parser.add_argument("--backlog", type=int, default=0, help="sessions that may wait for a free slot")
+    parser.add_argument("--pool", type=int, default=0, help="handle players on this many threads (0 = one each)")
+    parser.add_argument("--pool-queue", type=int, default=128, help="connections that may wait for a pool thread")
+    parser.add_argument("--hit-soft-17", action="store_true", help="the dealer hits a soft 17")
+    parser.add_argument("--seed", type=int, default=None, help="seed of the shoes' seeds, to deal the same run again")
+    parser.add_argument("--rng", choices=RNG_KINDS, default="mt", help="random generator of the shoes")
+    parser.add_argument("--capture", metavar="FILE", help="record the wire traffic to this capture file")
+    parser.add_argument("--table-seats", type=int, default=0,
+                        help="seat the players at tables of this many seats (0 = a private game each)")
+    parser.add_argument("--seat-timeout", type=float, default=10.0,
+                        help="at a table, seconds a seat has for a decision before it stands and leaves")
+    Pacing.add_arguments(parser)
+    Deadlines.add_arguments(parser)
+    EventLog.add_arguments(parser)
+    args = parser.parse_args()
+
+    history = HistoryWriter(args.history) if args.history else None
+    capture = CaptureWriter(args.capture) if args.capture else None
+    dealer = Dealer(Pacing.from_args(args), log=EventLog.from_args(args),
+                    history=history, resume_grace=args.resume_grace,
+                    admission=AdmissionController(args.max_sessions, args.backlog),
+                    pool_size=args.pool, pool_queue=args.pool_queue, hit_soft_17=args.hit_soft_17,
+                    table_seats=args.table_seats, seat_timeout=args.seat_timeout, seed=args.seed,
+                    rng_kind=args.rng, capture=capture,
+                    deadlines=Deadlines.from_args(args))
+    if args.metrics_port is not None:
+        dealer.start_metrics_server(args.metrics_port)
+    try:
+        dealer.start_dealer()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Both logs are flushed by daemon threads: what they have not written yet would be lost on exit
+        if history is not None:
+            history.close()
+        if capture is not None:
+            capture.close()
@@ -0,0 +1,238 @@
+import socket
+import struct
+import threading
+import time
+
+from Protocol import HEADER_STRUCT, MAGIC_COOKIE, MSG_TYPE_OFFER, OFFER_LOAD_STRUCT, OFFER_PORT, OFFER_STRUCT
+
+"""
+Dealer discovery:
+A background listener that keeps every dealer offer it hears in a cache, each entry living for a TTL after its
+last offer. A player asking for a dealer gets one straight from the cache instead of waiting up to a second for
+the next broadcast, and when several dealers are broadcasting it gets the least loaded one (by the load extension
+of the offers, see OFFER_LOAD_STRUCT).
+"""
+
+DEFAULT_TTL = 3.0  # Dealers announce every second - three missed offers and the dealer is considered gone
+
+
+class DealerOffer:
+    """
+        A dealer seen on the network, as of its last offer.
+    """
+
+    def __init__(self, ip, port, name, active=None, capacity=None, seen=None):
+        """
+                Args:
+                    ip (str): The dealer's IP.
+                    port (int): The dealer's TCP port.
+                    name (str): The server name in the offer.
+                    active (int): Sessions the dealer is playing (None if the offer has no load extension).
+                    capacity (int): The most sessions it accepts (0 = no limit, None if unknown).
+                    seen (float): time.monotonic() of the last offer.
+        """
+        self.ip = ip
+        self.port = port
+        self.name = name
+        self.active = active
+        self.capacity = capacity
+        self.seen = time.monotonic() if seen is None else seen
+
+    def load(self):
+        """
+                Returns:
+                    tuple: A sort key - dealers that announce their load first, the emptiest of them first
+                           (by the part of the capacity in use when it is known, else by the session count).
+        """
+        if self.active is None:
+            return 1, 0.0
+        if self.capacity:
+            return 0, self.active / self.capacity
+        return 0, float(self.active)
+
+    def __repr__(self):
+        load = "unknown load" if self.active is None else f"{self.active}/{self.capacity or '-'} sessions"
+        return f"{self.name} at {self.ip}:{self.port} ({load})"
+
+
+def parse_offer(data):
+    """
+        Parses an offer packet.
+
+        Args:
+            data (bytes): The UDP datagram.
+
+        Returns:
+            tuple: (TCP port, server name, active sessions, max sessions) - the last two None without the load
+                   extension - or None if this is not an offer.
+    """
+    # Cookie(4) + Type(1) + TCP_Port(2) is the least an offer has
+    if len(data) < HEADER_STRUCT.size + 2:
+        return None
+    cookie, msg_type = HEADER_STRUCT.unpack_from(data)
+    if cookie != MAGIC_COOKIE or msg_type != MSG_TYPE_OFFER:
+        return None
+    port, = struct.unpack_from('!H', data, HEADER_STRUCT.size)
+    name = data[HEADER_STRUCT.size + 2:OFFER_STRUCT.size].rstrip(b'\0').decode('utf-8', 'replace')
+    active = capacity = None
+    if len(data) >= OFFER_STRUCT.size + OFFER_LOAD_STRUCT.size:
+        active, capacity = OFFER_LOAD_STRUCT.unpack_from(data, OFFER_STRUCT.size)
+    return port, name, active, capacity
+
+
+class DiscoveryService:
+    """
+        Listens for offers on a background thread and caches the dealers it hears.
+        One service can be shared by every player of a process.
+    """
+
+    def __init__(self, port=OFFER_PORT, ttl=DEFAULT_TTL):
+        """
+                Args:
+                    port (int): The UDP port the offers are broadcast to.
+                    ttl (float): Seconds a dealer stays in the cache after its last offer.
+        """
+        self.port = port
+        self.ttl = ttl
+        self.offers = {}  # (ip, port) -> DealerOffer
+        self.changed = threading.Condition()
+        self.udp_sock = None
+        self.thread = None
+
+    def start(self):
+        """
+                Binds the UDP port and starts listening (once).
+
+                Returns:
+                    DiscoveryService: self, to chain with the constructor.
+        """
+        with self.changed:
+            if self.thread is not None:
+                return self
+            udp_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            udp_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            udp_sock.bind(("", self.port))
+            udp_sock.settimeout(0.5)  # A blocked recvfrom does not notice the socket being closed
+            self.udp_sock = udp_sock
+            self.thread = threading.Thread(target=self.listen, args=(udp_sock,), name="Discovery")
+            self.thread.daemon = True
+            self.thread.start()
+        return self
+
+    def listen(self, udp_sock):
+        """
+                The listener thread: every valid offer refreshes its dealer in the cache.
+        """
+        while self.udp_sock is udp_sock:
+            try:
+                data, addr = udp_sock.recvfrom(1024)
+            except socket.timeout:
+                continue
+            except OSError:
+                return  # Closed by stop()
+            self.update(addr[0], data)
+
+    def update(self, ip, data):
+        """
+                Adds or refreshes the dealer of an offer.
+
+                Args:
+                    ip (str): The IP the offer came from.
+                    data (bytes): The offer packet.
+
+                Returns:
+                    DealerOffer: The cached dealer, or None if the packet is not a valid offer.
+        """
+        offer = parse_offer(data)
+        if offer is None:
+            return None
+        port, name, active, capacity = offer
+        dealer = DealerOffer(ip, port, name, active, capacity)
+        with self.changed:
+            self.offers[(ip, port)] = dealer
+            self.changed.notify_all()
+        return dealer
+
+    def dealers(self):
+        """
+                Returns:
+                    list: The dealers heard within the TTL, least loaded first (most recently heard first on a tie).
+        """
+        with self.changed:
+            self.expire()
+            fresh = list(self.offers.values())
+        fresh.sort(key=lambda dealer: (dealer.load(), -dealer.seen))
+        return fresh
+
+    def expire(self):
+        # Called with the lock held
+        oldest = time.monotonic() - self.ttl
+        for key in [key for key, dealer in self.offers.items() if dealer.seen < oldest]:
+            del self.offers[key]
+
+    def best(self):
+        """
+                Returns:
+                    DealerOffer: The least loaded known dealer, or None if none is known.
+        """
+        dealers = self.dealers()
+        return dealers[0] if dealers else None
+
+    def wait_for_dealer(self, timeout=None, settle=0.0):
+        """
+                Returns a dealer right away if one is cached, else waits for the first offer.
+
+                Args:
+                    timeout (float): Seconds to wait for an offer (None = forever).
+                    settle (float): On an empty cache, seconds to keep listening after the first offer so the
+                                    other dealers can be heard and compared.
+
+                Returns:
+                    DealerOffer: The least loaded dealer, or None if no offer came in time.
+        """
+        self.start()
+        best = self.best()
+        if best is not None:
+            return best
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.changed:
+            while True:
+                self.expire()
+                if self.offers:
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self.changed.wait(remaining)
+        if settle:
+            time.sleep(settle)
+        return self.best()
+
+    def forget(self, ip, port):
+        """
+                Drops a dealer from the cache (e.g. it refused the connection), until its next offer.
+        """
+        with self.changed:
+            self.offers.pop((ip, port), None)
+
+    def stop(self):
+        with self.changed:
+            udp_sock, self.udp_sock, self.thread = self.udp_sock, None, None
+        if udp_sock is not None:
+            udp_sock.close()
+
+
+shared_service = None
+shared_lock = threading.Lock()
+
+
+def shared_discovery():
+    """
+        Returns:
+            DiscoveryService: The process-wide discovery service, started on first use.
+    """
+    global shared_service
+    with shared_lock:
+        if shared_service is None:
+            shared_service = DiscoveryService().start()
+        return shared_service
@@ -0,0 +1,203 @@
+import atexit
+import json
+import queue
+import sys
+import threading
+import time
+import zlib
+
+"""
+The event log:
+Structured game events (an event name and its fields) instead of print() calls on the player threads.
+Logging an event only checks the level and puts a tuple on a queue - formatting and writing happen on a
+background writer thread, so sessions never wait for the terminal. Events can be written as the familiar
+text lines or as one JSON object per line, sampled per session, or turned off completely.
+"""
+
+DEBUG = 10  # Every card and decision
+INFO = 20  # Sessions and round results
+WARNING = 30  # Protocol violations and timeouts
+ERROR = 40  # Unexpected failures
+OFF = 100  # Nothing at all
+
+LEVELS = {
+    "debug": DEBUG,
+    "info": INFO,
+    "warning": WARNING,
+    "error": ERROR,
+    "off": OFF,
+}
+LEVEL_NAMES = {value: name for name, value in LEVELS.items()}
+
+
+class EventLog:
+    """
+        A non-blocking structured logger with a background writer thread.
+    """
+
+    def __init__(self, level=INFO, sample_rate=1.0, fmt="text", path=None, max_pending=100_000):
+        """
+                Initializes the EventLog. The writer thread starts with the first event that is logged.
+
+                Args:
+                    level (int): Events below this level are dropped (OFF = log nothing).
+                    sample_rate (float): Part of the sessions (by their team field) whose DEBUG / INFO events are
+                                         kept. Whole sessions are kept or dropped, so a sampled session stays
+                                         complete. WARNING and above, and events of no session, are always kept.
+                    fmt (str): "text" for the readable message, "json" for one JSON object per event.
+                    path (str): File the events are appended to (None = stdout).
+                    max_pending (int): Events waiting for the writer above which new events are dropped
+                                       (and counted) instead of growing memory.
+        """
+        if fmt not in ("text", "json"):
+            raise ValueError(f"Unknown log format: {fmt}")
+        self.level = level
+        self.sample_rate = sample_rate
+        self.fmt = fmt
+        self.path = path
+        self.max_pending = max_pending
+        self.dropped = 0
+        self.pending = queue.SimpleQueue()
+        self.writer = None
+        self.writer_lock = threading.Lock()
+
+    def __reduce__(self):
+        # Only the settings travel to another process (pre-fork workers), it starts its own writer
+        return EventLog, (self.level, self.sample_rate, self.fmt, self.path, self.max_pending)
+
+    def enabled(self, level):
+        """
+                Returns True if events of this level are logged (to skip building expensive fields).
+        """
+        return level >= self.level
+
+    def sampled(self, key):
+        """
+                Decides whether the events of a session are kept. Stable for the same key.
+
+                Args:
+                    key (str): The session's key (its team name).
+        """
+        if self.sample_rate >= 1.0:
+            return True
+        return zlib.crc32(str(key).encode('utf-8')) < self.sample_rate * 0x100000000
+
+    def event(self, level, name, message, **fields):
+        """
+                Logs an event.
+
+                Args:
+                    level (int): DEBUG / INFO / WARNING / ERROR.
+                    name (str): The event name (e.g. "round_result").
+                    message (str): A str.format template of the text line, filled from the fields
+                                   on the writer thread.
+                    **fields: The event's data. Values are formatted later, so they must not change afterwards.
+        """
+        if level < self.level:
+            return
+        if level < WARNING and self.sample_rate < 1.0 and "team" in fields and not self.sampled(fields["team"]):
+            return
+        if self.pending.qsize() >= self.max_pending:
+            self.dropped += 1
+            return
+        if self.writer is None:
+            self.start()
+        self.pending.put((time.time(), level, name, message, fields))
+
+    def debug(self, name, message, **fields):
+        self.event(DEBUG, name, message, **fields)
+
+    def info(self, name, message, **fields):
+        self.event(INFO, name, message, **fields)
+
+    def warning(self, name, message, **fields):
+        self.event(WARNING, name, message, **fields)
+
+    def error(self, name, message, **fields):
+        self.event(ERROR, name, message, **fields)
+
+    def format_event(self, record):
+        """
+                Turns a queued event into its output line.
+
+                Returns:
+                    str: The line, newline included.
+        """
+        timestamp, level, name, message, fields = record
+        if self.fmt == "json":
+            line = {"ts": round(timestamp, 6), "level": LEVEL_NAMES.get(level, level), "event": name}
+            line.update(fields)
+            return json.dumps(line, default=str) + "\n"
+        try:
+            return message.format(**fields) + "\n"
+        except (KeyError, IndexError, ValueError):
+            return f"{name} {fields}\n"
+
+    def start(self):
+        """
+                Starts the writer thread (once).
+        """
+        with self.writer_lock:
+            if self.writer is not None:
+                return
+            self.writer = threading.Thread(target=self.write_events, name="EventLog writer")
+            self.writer.daemon = True
+            self.writer.start()
+            atexit.register(self.close)
+
+    def write_events(self):
+        """
+                The writer thread: drains the queue in batches, one write and flush per batch.
+        """
+        out = open(self.path, 'a') if self.path else None
+        try:
+            while True:
+                record = self.pending.get()
+                lines = []
+                while record is not None:
+                    lines.append(self.format_event(record))
+                    if len(lines) >= 1024:
+                        break
+                    try:
+                        record = self.pending.get_nowait()
+                    except queue.Empty:
+                        break
+                stream = out or sys.stdout  # Looked up per batch, so redirecting stdout works
+                try:
+                    stream.write("".join(lines))
+                    stream.flush()
+                except (OSError, ValueError):
+                    pass  # A closed stream must not kill the writer
+                if record is None:
+                    return
+        finally:
+            if out is not None:
+                out.close()
+
+    def close(self, timeout=5.0):
+        """
+                Writes the events still queued and stops the writer thread.
+        """
+        with self.writer_lock:
+            writer = self.writer
+            self.writer = None
+        if writer is not None:
+            self.pending.put(None)
+            writer.join(timeout)
+
+    @staticmethod
+    def add_arguments(parser):
+        """
+                Adds the --log-* options to an argparse parser.
+        """
+        parser.add_argument("--log-level", choices=list(LEVELS), default="info", help="lowest event level logged")
+        parser.add_argument("--log-format", choices=["text", "json"], default="text", help="event line format")
+        parser.add_argument("--log-sample", type=float, default=1.0, help="part of the sessions logged below warning")
+        parser.add_argument("--log-file", default=None, help="append the events to this file instead of stdout")
+
+    @staticmethod
+    def from_args(args):
+        """
+                Builds an EventLog from the options added by `add_arguments`.
+        """
+        return EventLog(LEVELS[args.log_level], args.log_sample, args.log_format, args.log_file)
@@ -0,0 +1,458 @@
+import argparse
+import json
+import os
+import struct
+import threading
+import time
+
+from Cards import RNG_KIND_CODES, RNG_KINDS, Shoe, make_rng
+
+"""
+The game history store:
+Every round a dealer plays is appended to a compact binary log - the team, the cards each side was dealt,
+the totals and the result - so sessions can be analyzed long after they ended without parsing stdout.
+
+The file is append-only:
+    File header:  b"BJHIST" | version (1)
+    Open record:  b"O" | time (8)                      - a writer (re)opened the file, team ids restart
+    Team record:  b"T" | team id (2) | length (1) | name
+    Shoe record:  b"S" | team id (2) | session (4) | seed (8) | generator (1) | decks (1) | penetration (8)
+                  - the session dealt from its own shoe, which replay_session deals again (version 2)
+    Round record: b"R" | team id (2) | session (4) | time (8) | round (1) | result (1) |
+                  player total (1) | dealer total (1) | player cards (1) | dealer cards (1) | card codes
+The player's decisions follow from the cards: every player card after the first two is a Hit, and the player
+stood unless it busted. Writers buffer the records and flush them in batches from a background thread.
+
+Version 1 logs (without shoe records) are still read.
+HistoryReader scans a log once and keeps per-team aggregates in a sidecar index (FILE.idx), so later queries
+only scan what was appended since.
+"""
+
+MAGIC = b"BJHIST"
+VERSION = 2
+READ_VERSIONS = (1, 2)
+FILE_HEADER_STRUCT = struct.Struct('!6s B')
+OPEN_STRUCT = struct.Struct('!c d')
+TEAM_STRUCT = struct.Struct('!c H B')
+ROUND_STRUCT = struct.Struct('!c H I d B B B B B B')
+SHOE_STRUCT = struct.Struct('!c H I Q B B d')
+
+RESULT_NAMES = {0x1: "tie", 0x2: "loss", 0x3: "win"}  # The payload result codes
+
+
+class HistoryWriter:
+    """
+        Appends the rounds of one process's sessions to a history log.
+    """
+
+    def __init__(self, path, flush_interval=1.0, flush_bytes=64 * 1024):
+        """
+                Opens (or creates) the log and starts the background flusher.
+
+                Args:
+                    path (str): The log file.
+                    flush_interval (float): Seconds between two flushes of the buffered records.
+                    flush_bytes (int): Buffered size that wakes the flusher early.
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+        self.flush_bytes = flush_bytes
+        self.file = open(path, 'ab')
+        self.buffer = bytearray()
+        if self.file.tell() == 0:
+            self.buffer += FILE_HEADER_STRUCT.pack(MAGIC, VERSION)
+        self.buffer += OPEN_STRUCT.pack(b"O", time.time())
+        self.team_ids = {}
+        self.next_session = 0
+        self.lock = threading.Lock()  # Guards the buffer, team ids and session counter
+        self.write_lock = threading.Lock()  # Keeps the batches in order on disk
+        self.wake = threading.Event()
+        self.closed = False
+        self.flusher = threading.Thread(target=self.flush_periodically, name="History flusher")
+        self.flusher.daemon = True
+        self.flusher.start()
+
+    def start_session(self, team, seed=None, rng_kind="mt", decks=1, penetration=0.75):
+        """
+                Registers a new session.
+
+                Args:
+                    team (str): The team name.
+                    seed (int): The seed of the session's own shoe, recorded so it can be dealt again
+                                (None = not recorded, e.g. a shared table shoe).
+                    rng_kind (str): The shoe's random generator, one of Cards.RNG_KINDS.
+                    decks (int): Number of decks in the shoe.
+                    penetration (float): Part of the shoe dealt before it is reshuffled.
+
+                Returns:
+                    tuple: The session handle to pass to `record_round`.
+        """
+        with self.lock:
+            team_id = self.team_ids.get(team)
+            if team_id is None:
+                team_id = len(self.team_ids)
+                self.team_ids[team] = team_id
+                name = team.encode('utf-8')[:255]
+                self.buffer += TEAM_STRUCT.pack(b"T", team_id, len(name))
+                self.buffer += name
+            session = self.next_session
+            self.next_session = (self.next_session + 1) & 0xFFFFFFFF
+            if seed is not None:
+                self.buffer += SHOE_STRUCT.pack(b"S", team_id, session, seed, RNG_KIND_CODES[rng_kind], decks,
+                                                penetration)
+        return team_id, session
+
+    def record_round(self, session, round_num, player_hand, dealer_hand, player_total, dealer_total, result):
+        """
+                Appends a finished round.
+
+                Args:
+                    session (tuple): The handle returned by `start_session`.
+                    round_num (int): The round number in the session (1-255).
+                    player_hand (list): The player's Cards, in the order dealt.
+                    dealer_hand (list): The dealer's Cards, in the order dealt.
+                    player_total (int): The player's final total.
+                    dealer_total (int): The dealer's final total.
+                    result (int): The result code sent to the player (0x1 tie, 0x2 loss, 0x3 win).
+        """
+        team_id, session_id = session
+        record = ROUND_STRUCT.pack(b"R", team_id, session_id, time.time(), round_num, result, player_total,
+                                   dealer_total, len(player_hand), len(dealer_hand))
+        cards = bytes([card.code for card in player_hand] + [card.code for card in dealer_hand])
+        with self.lock:
+            self.buffer += record
+            self.buffer += cards
+            full = len(self.buffer) >= self.flush_bytes
+        if full:
+            self.wake.set()
+
+    def flush(self):
+        """
+                Writes the buffered records to the file.
+        """
+        with self.write_lock:
+            with self.lock:
+                data, self.buffer = self.buffer, bytearray()
+            if data and not self.file.closed:
+                self.file.write(data)
+                self.file.flush()
+
+    def flush_periodically(self):
+        while not self.closed:
+            self.wake.wait(self.flush_interval)
+            self.wake.clear()
+            self.flush()
+
+    def close(self):
+        """
+                Flushes what is left and closes the file.
+        """
+        self.closed = True
+        self.wake.set()
+        self.flusher.join()
+        self.flush()
+        with self.write_lock:
+            self.file.close()
+
+
+def empty_aggregates():
+    return {"sessions": 0, "rounds": 0, "wins": 0, "losses": 0, "ties": 0, "player_busts": 0, "dealer_busts": 0,
+            "hits": 0, "player_total_sum": 0, "dealer_total_sum": 0}
+
+
+def add_aggregates(total, other):
+    for key, value in other.items():
+        total[key] += value
+
+
+def with_rates(aggregates):
+    """
+        Returns a copy of the aggregates with the derived win rate, average totals and hits per round.
+    """
+    result = dict(aggregates)
+    rounds = aggregates["rounds"]
+    result["win_rate"] = aggregates["wins"] / rounds if rounds else 0
+    result["house_edge"] = (aggregates["losses"] - aggregates["wins"]) / rounds if rounds else 0
+    result["avg_player_total"] = aggregates["player_total_sum"] / rounds if rounds else 0
+    result["hits_per_round"] = aggregates["hits"] / rounds if rounds else 0
+    return result
+
+
+class HistoryReader:
+    """
+        Reads a history log and answers aggregate queries, backed by an incremental index.
+    """
+
+    def __init__(self, path, use_index=True):
+        """
+                Args:
+                    path (str): The log file.
+                    use_index (bool): Load and save the FILE.idx sidecar, so only new records get scanned.
+        """
+        self.path = path
+        self.index_path = path + ".idx"
+        self.use_index = use_index
+        self.offset = 0  # Bytes of the log already aggregated
+        self.segment_teams = []  # Team names by id in the segment the scan stopped in
+        self.aggregates = {}  # team -> aggregates
+        if use_index:
+            self.load_index()
+        self.refresh()
+
+    def load_index(self):
+        try:
+            with open(self.index_path) as index_file:
+                index = json.load(index_file)
+        except (OSError, ValueError):
+            return
+        if index.get("version") != VERSION or index.get("offset", 0) > os.path.getsize(self.path):
+            return  # Stale (the log was replaced), rebuild from scratch
+        self.offset = index["offset"]
+        self.segment_teams = index["segment_teams"]
+        self.aggregates = index["teams"]
+
+    def save_index(self):
+        index = {"version": VERSION, "offset": self.offset, "segment_teams": self.segment_teams,
+                 "teams": self.aggregates}
+        temp_path = self.index_path + ".tmp"
+        with open(temp_path, 'w') as index_file:
+            json.dump(index, index_file)
+        os.replace(temp_path, self.index_path)
+
+    def refresh(self):
+        """
+                Aggregates the records appended since the last scan.
+
+                Returns:
+                    int: Number of new rounds.
+        """
+        rounds = 0
+        start = self.offset
+        for team, round_record in self.scan(self.offset, update_state=True):
+            stats = self.aggregates.get(team)
+            if stats is None:
+                stats = self.aggregates[team] = empty_aggregates()
+            _, _, _, round_num, result, player_total, dealer_total, player_cards, dealer_cards = round_record
+            stats["rounds"] += 1
+            stats["sessions"] += round_num == 1
+            if result == 0x3:
+                stats["wins"] += 1
+            elif result == 0x2:
+                stats["losses"] += 1
+            else:
+                stats["ties"] += 1
+            stats["player_busts"] += player_total > 21
+            stats["dealer_busts"] += dealer_total > 21
+            stats["hits"] += player_cards - 2
+            stats["player_total_sum"] += player_total
+            stats["dealer_total_sum"] += dealer_total
+            rounds += 1
+        if self.use_index and self.offset != start:
+            self.save_index()
+        return rounds
+
+    def scan(self, offset=0, update_state=False, with_cards=False):
+        """
+                Iterates over the round records of the log from an offset.
+                A record cut short at the end (still being flushed) ends the scan and is read next time.
+
+                Args:
+                    offset (int): Where to start (0 = the beginning of the file).
+                    update_state (bool): Advance the reader's offset and team table as the scan goes.
+                    with_cards (bool): Also yield the card codes.
+
+                Yields:
+                    tuple: (team, ROUND_STRUCT fields without the record type[, player codes, dealer codes,
+                           the session's shoe record as a dict or None]).
+                           Shoe records are only known to scans from the start of the file.
+        """
+        with open(self.path, 'rb') as log_file:
+            log_file.seek(offset)
+            data = log_file.read()
+        view = memoryview(data)
+        teams = list(self.segment_teams) if offset else []
+        shoes = {}  # (team id, session) -> shoe record fields, in the current segment
+        position = 0  # In data, which starts at offset
+        if offset == 0:
+            if len(data) < FILE_HEADER_STRUCT.size:
+                return
+            magic, version = FILE_HEADER_STRUCT.unpack_from(data)
+            if magic != MAGIC or version not in READ_VERSIONS:
+                raise ValueError(f"{self.path} is not a version {VERSION} history log")
+            position = FILE_HEADER_STRUCT.size
+
+        end = len(data)
+        while position < end:
+            kind = data[position:position + 1]
+            if kind == b"R":
+                if position + ROUND_STRUCT.size > end:
+                    break
+                fields = ROUND_STRUCT.unpack_from(view, position)
+                cards_end = position + ROUND_STRUCT.size + fields[8] + fields[9]
+                if cards_end > end:
+                    break
+                if with_cards:
+                    codes_start = position + ROUND_STRUCT.size
+                    yield (teams[fields[1]], fields[1:], bytes(view[codes_start:codes_start + fields[8]]),
+                           bytes(view[codes_start + fields[8]:cards_end]), shoes.get(fields[1:3]))
+                else:
+                    yield teams[fields[1]], fields[1:]
+                position = cards_end
+            elif kind == b"T":
+                if position + TEAM_STRUCT.size > end:
+                    break
+                _, team_id, length = TEAM_STRUCT.unpack_from(view, position)
+                name_end = position + TEAM_STRUCT.size + length
+                if name_end > end:
+                    break
+                name = bytes(view[position + TEAM_STRUCT.size:name_end]).decode('utf-8', 'replace')
+                if team_id == len(teams):
+                    teams.append(name)
+                else:
+                    teams[team_id] = name
+                position = name_end
+            elif kind == b"S":
+                if position + SHOE_STRUCT.size > end:
+                    break
+                _, team_id, session, seed, rng_code, decks, penetration = SHOE_STRUCT.unpack_from(view, position)
+                shoes[(team_id, session)] = {"seed": seed, "rng": RNG_KINDS[rng_code], "decks": decks,
+                                             "penetration": penetration}
+                position += SHOE_STRUCT.size
+            elif kind == b"O":
+                if position + OPEN_STRUCT.size > end:
+                    break
+                teams = []
+                shoes = {}
+                position += OPEN_STRUCT.size
+            else:
+                raise ValueError(f"Corrupt history log {self.path} at byte {offset + position}")
+            if update_state:
+                self.offset = offset + position
+                self.segment_teams = teams
+        view.release()
+
+    def teams(self):
+        """
+                Returns:
+                    list: The names of every team in the log.
+        """
+        return sorted(self.aggregates)
+
+    def team(self, name):
+        """
+                Returns:
+                    dict: The aggregates of one team (all zero if it never played), with the derived rates.
+        """
+        return with_rates(self.aggregates.get(name, empty_aggregates()))
+
+    def totals(self):
+        """
+                Returns:
+                    dict: The aggregates over every team, with the derived rates.
+        """
+        total = empty_aggregates()
+        for stats in self.aggregates.values():
+            add_aggregates(total, stats)
+        return with_rates(total)
+
+    def rounds(self, team=None):
+        """
+                Iterates over the rounds of the log (a full scan).
+
+                Args:
+                    team (str): Only the rounds of this team (None = every round).
+
+                Yields:
+                    dict: team, session, time, round, result, player_total, dealer_total, player_cards,
+                          dealer_cards (card codes, see Cards.card_code) and shoe (seed, rng, decks and
+                          penetration of the session's own shoe, None if not recorded).
+        """
+        for name, fields, player_codes, dealer_codes, shoe in self.scan(with_cards=True):
+            if team is not None and name != team:
+                continue
+            _, session, timestamp, round_num, result, player_total, dealer_total, _, _ = fields
+            yield {"team": name, "session": session, "time": timestamp, "round": round_num,
+                   "result": RESULT_NAMES.get(result, result), "player_total": player_total,
+                   "dealer_total": dealer_total, "player_cards": list(player_codes),
+                   "dealer_cards": list(dealer_codes), "shoe": shoe}
+
+
+def replay_session(shoe, rounds):
+    """
+        Deals a recorded session again from its shoe's seed, in the order Dealer.play deals: player, dealer,
+        player, dealer, then the player's hits and the dealer's draws.
+
+        Args:
+            shoe (dict): The session's shoe record (the "shoe" of its rounds).
+            rounds (list): The session's rounds from HistoryReader.rounds, in order. Only the number of cards of
+                           each hand is used - the cards themselves come from the seed.
+
+        Yields:
+            tuple: (round number, player card codes, dealer card codes) as dealt again.
+    """
+    replayed = Shoe(shoe["decks"], shoe["penetration"], make_rng(shoe["seed"], shoe["rng"]))
+    replayed.shuffle()
+    for round_info in rounds:
+        replayed.start_round()
+        player = [replayed.deal_code()]
+        dealer = [replayed.deal_code()]
+        player.append(replayed.deal_code())
+        dealer.append(replayed.deal_code())
+        player += [replayed.deal_code() for _ in range(len(round_info["player_cards"]) - 2)]
+        dealer += [replayed.deal_code() for _ in range(len(round_info["dealer_cards"]) - 2)]
+        yield round_info["round"], player, dealer
+
+
+def verify_replays(reader):
+    """
+        Replays every session of a log that recorded its shoe and compares the cards with the recorded ones.
+
+        Returns:
+            tuple: (sessions replayed, list of (team, seed, round) where the cards differ).
+    """
+    sessions = {}  # seed -> (team, rounds)
+    for round_info in reader.rounds():
+        if round_info["shoe"] is not None:
+            sessions.setdefault(round_info["shoe"]["seed"], (round_info["team"], []))[1].append(round_info)
+    mismatches = []
+    for seed, (team, rounds) in sessions.items():
+        for round_info, (round_num, player, dealer) in zip(rounds, replay_session(rounds[0]["shoe"], rounds)):
+            if player != round_info["player_cards"] or dealer != round_info["dealer_cards"]:
+                mismatches.append((team, seed, round_num))
+                break
+    return len(sessions), mismatches
+
+
+def print_aggregates(title, stats):
+    print(f"{title}: {stats['sessions']} sessions, {stats['rounds']} rounds "
+          f"(W {stats['wins']} / L {stats['losses']} / T {stats['ties']}), win rate {stats['win_rate']:.3f}, "
+          f"house edge {stats['house_edge']:.3f}, busts {stats['player_busts']} / dealer {stats['dealer_busts']}, "
+          f"hits per round {stats['hits_per_round']:.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Aggregates of Blackjack history logs.")
+    parser.add_argument("paths", nargs="+", help="history log files (e.g. one per pre-fork worker)")
+    parser.add_argument("--team", action="append", help="only these teams (repeatable)")
+    parser.add_argument("--no-index", action="store_true", help="do not read or write the .idx files")
+    parser.add_argument("--replay", action="store_true",
+                        help="deal every seeded session again and check the cards match the log")
+    args = parser.parse_args()
+
+    readers = [HistoryReader(path, not args.no_index) for path in args.paths]
+    names = args.team or sorted({name for reader in readers for name in reader.teams()})
+    overall = empty_aggregates()
+    for name in names:
+        stats = empty_aggregates()
+        for reader in readers:
+            add_aggregates(stats, reader.aggregates.get(name, empty_aggregates()))
+        add_aggregates(overall, stats)
+        print_aggregates(name, with_rates(stats))
+    print_aggregates("All teams", with_rates(overall))
+
+    if args.replay:
+        for reader in readers:
+            replayed, mismatches = verify_replays(reader)
+            print(f"{reader.path}: {replayed} sessions replayed, {len(mismatches)} differ")
+            for team, seed, round_num in mismatches:
+                print(f"  {team} (seed {seed}) differs from round {round_num}")
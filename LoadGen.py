@@ -0,0 +1,300 @@
+import argparse
+import multiprocessing
+import os
+import queue
+import socket
+import threading
+import time
+
+from Mux import MuxConnection
+from Player import Player
+from Strategies import STRATEGIES, make_strategy
+
+"""
+The Load Generator:
+Opens thousands of concurrent Player sessions against a dealer and measures what it sustains.
+Sessions are spread over several processes, each running one thread per session with the regular Player
+protocol code (initiate_game, send_decision, receive_payload) and a headless strategy.
+New sessions are started on a ramp (sessions per second), and every finished session reports back its
+rounds, round latencies and how it failed, if it did.
+With --mux, the sessions of a process share TCP connections, that many games per connection.
+"""
+
+THREAD_STACK_SIZE = 256 * 1024  # Session threads only run Player code, a small stack is plenty
+
+
+def percentile(sorted_values, fraction):
+    """
+        Returns a percentile of an already sorted list (0 if it is empty).
+    """
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def run_session(host, port, session_id, rounds, strategy, timeout, pacing_ms, connection=None):
+    """
+        Plays one headless session.
+
+        Args:
+            strategy (Strategy): The session's strategy, built before the session is timed.
+            connection (MuxConnection): A shared connection to play on (None = a connection of its own).
+
+        Returns:
+            dict: "rounds" played, "round_latencies" and "error" (None, "connect", "timeout", "reset",
+                  "closed", "protocol" or "incomplete").
+    """
+    player = Player(strategy, verbose=False, team_name=f"load-{session_id}", timeout=timeout)
+    player.server_ip = host
+    player.server_tcp_port = port
+    report = {"rounds": 0, "round_latencies": [], "error": None}
+
+    if connection is not None:
+        try:
+            sock = player.initiate_game_over(connection.open_session(), rounds, pacing_ms)
+        except OSError:
+            sock = None
+    else:
+        sock = player.initiate_game(rounds, pacing_ms)
+    if not sock:
+        report["error"] = player.last_error or "connect"
+        return report
+
+    try:
+        with sock:
+            statistics = player.play_game(rounds)
+    except OSError:
+        statistics = {"wins": 0, "losses": 0, "ties": 0}
+        player.last_error = player.last_error or "reset"
+
+    report["rounds"] = statistics["wins"] + statistics["losses"] + statistics["ties"]
+    report["round_latencies"] = player.round_latencies
+    if report["rounds"] < rounds:
+        report["error"] = player.last_error or "incomplete"
+    return report
+
+
+def run_worker(host, port, schedule, rounds, strategy_name, timeout, pacing_ms, results, mux=0, rules=(1, False)):
+    """
+        Entry point of a load process: starts every session of its schedule on time.
+
+        Args:
+            schedule (list): (session id, start time) pairs, start times on the time.time() clock.
+            results (multiprocessing.Queue): Where every finished session report goes.
+            mux (int): Sessions per shared connection (0 = a connection per session).
+            rules (tuple): (decks, hit_soft_17) of the dealer, for the strategies that depend on them.
+    """
+    threading.stack_size(THREAD_STACK_SIZE)
+    connections = []
+    # Built (and their tables loaded) before the first session starts, not inside the timed sessions
+    strategies = {session_id: make_strategy(strategy_name, *rules) for session_id, _ in schedule}
+
+    def session(session_id, connection):
+        try:
+            results.put(run_session(host, port, session_id, rounds, strategies[session_id], timeout, pacing_ms,
+                                    connection))
+        except Exception:
+            results.put({"rounds": 0, "round_latencies": [], "error": "crash"})
+
+    threads = []
+    for index, (session_id, start_at) in enumerate(schedule):
+        wait = start_at - time.time()
+        if wait > 0:
+            time.sleep(wait)
+        connection = None
+        if mux:
+            if index % mux == 0:
+                connections.append(MuxConnection(host, port, timeout))
+                try:
+                    connections[-1].connect()
+                except OSError:
+                    pass  # Its sessions fail on open_session and report "connect"
+            connection = connections[-1]
+        thread = threading.Thread(target=session, args=(session_id, connection))
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+
+    for thread in threads:
+        thread.join()
+    for connection in connections:
+        connection.close()
+
+
+class LoadGenerator:
+    """
+        Drives many concurrent Player sessions against one dealer and reports throughput and latency.
+    """
+
+    def __init__(self, host, port, sessions=1000, rounds=10, ramp=200.0, processes=None, strategy="basic",
+                 timeout=30.0, pacing_ms=0, mux=0, decks=1, hit_soft_17=False):
+        """
+                Initializes the LoadGenerator.
+
+                Args:
+                    host (str): The dealer's IP.
+                    port (int): The dealer's TCP port.
+                    sessions (int): Total number of sessions to open.
+                    rounds (int): Rounds requested by every session (1-255).
+                    ramp (float): New sessions started per second.
+                    processes (int): Number of load processes. Defaults to the number of cores.
+                    strategy (str): Name of the strategy every player uses (see Strategies.STRATEGIES).
+                    timeout (float): Seconds a player waits for the dealer before counting a timeout.
+                    pacing_ms (int): Pause asked from the dealer between rounds.
+                    mux (int): Sessions sharing one multiplexed connection (0 = a connection per session).
+                    decks (int): Number of decks the dealer plays with (for the "optimal" strategy).
+                    hit_soft_17 (bool): The dealer hits a soft 17 (for the "optimal" strategy).
+        """
+        self.host = host
+        self.port = port
+        self.sessions = sessions
+        self.rounds = rounds
+        self.ramp = ramp
+        self.processes = processes or os.cpu_count() or 1
+        self.strategy = strategy
+        self.timeout = timeout
+        self.pacing_ms = pacing_ms
+        self.mux = mux
+        self.rules = (decks, hit_soft_17)
+
+    def run(self):
+        """
+                Runs the whole load test and prints the report.
+
+                Returns:
+                    dict: The report (see `build_report`).
+        """
+        results = multiprocessing.Queue()
+        make_strategy(self.strategy, *self.rules)  # Computes and caches the strategy's tables once, up front
+        start = time.time() + 0.5  # Let the processes come up before the first session
+        schedules = [[] for _ in range(self.processes)]
+        for session_id in range(self.sessions):
+            schedules[session_id % self.processes].append((session_id, start + session_id / self.ramp))
+
+        workers = []
+        for schedule in schedules:
+            process = multiprocessing.Process(target=run_worker,
+                                              args=(self.host, self.port, schedule, self.rounds, self.strategy,
+                                                    self.timeout, self.pacing_ms, results, self.mux, self.rules))
+            process.start()
+            workers.append(process)
+
+        print(f"Load: {self.sessions} sessions x {self.rounds} rounds against {self.host}:{self.port}, "
+              f"ramp {self.ramp:g}/s over {self.processes} processes"
+              + (f", {self.mux} sessions per connection" if self.mux else ""))
+
+        reports = []
+        while len(reports) < self.sessions:
+            try:
+                reports.append(results.get(timeout=1.0))
+                if len(reports) % 1000 == 0:
+                    print(f"{len(reports)} sessions finished...")
+            except queue.Empty:
+                if not any(process.is_alive() for process in workers) and results.empty():
+                    break
+        elapsed = time.time() - start
+
+        for process in workers:
+            process.join()
+
+        report = self.build_report(reports, elapsed)
+        self.print_report(report)
+        return report
+
+    def build_report(self, reports, elapsed):
+        """
+                Aggregates the session reports.
+
+                Returns:
+                    dict: sessions, completed, errors by kind, rounds, elapsed, rounds_per_sec, p50 / p99 / max
+                          round latency in seconds.
+        """
+        latencies = sorted(latency for report in reports for latency in report["round_latencies"])
+        errors = {}
+        for report in reports:
+            if report["error"]:
+                errors[report["error"]] = errors.get(report["error"], 0) + 1
+        errors["lost"] = self.sessions - len(reports)  # Sessions whose process died before reporting
+
+        rounds = sum(report["rounds"] for report in reports)
+        return {
+            "sessions": self.sessions,
+            "completed": sum(1 for report in reports if not report["error"]),
+            "errors": errors,
+            "rounds": rounds,
+            "elapsed": elapsed,
+            "rounds_per_sec": rounds / elapsed if elapsed > 0 else 0,
+            "p50": percentile(latencies, 0.50),
+            "p99": percentile(latencies, 0.99),
+            "max": latencies[-1] if latencies else 0.0,
+        }
+
+    def print_report(self, report):
+        """
+                Prints the aggregated report.
+        """
+        errors = report["errors"]
+        print("\n=== Load report ===")
+        print(f"Sessions: {report['sessions']}, completed: {report['completed']}")
+        print(f"Connection errors: {errors.get('connect', 0) + errors.get('reset', 0) + errors.get('closed', 0)}, "
+              f"timeouts: {errors.get('timeout', 0)}, other failures: "
+              f"{sum(errors.values()) - sum(errors.get(key, 0) for key in ('connect', 'reset', 'closed', 'timeout'))}")
+        print(f"Rounds: {report['rounds']} in {report['elapsed']:.2f}s = {report['rounds_per_sec']:.1f} rounds/sec")
+        print(f"Round latency: p50 {report['p50'] * 1000:.2f} ms, p99 {report['p99'] * 1000:.2f} ms, "
+              f"max {report['max'] * 1000:.2f} ms")
+
+
+def run_local_dealer(server_socket, engine):
+    """
+        Entry point of the local dealer process (--local): serves players on an already listening socket.
+    """
+    from AsyncDealer import AsyncDealer
+    from Dealer import Dealer
+    from EventLog import OFF, EventLog
+    from Pacing import NegotiatedPacing
+
+    log = EventLog(OFF)  # The dealer's events would drown the report
+    if engine == "async":
+        import asyncio
+        server_socket.setblocking(False)
+        asyncio.run(AsyncDealer(NegotiatedPacing(), log=log).serve(server_socket))
+    else:
+        Dealer(NegotiatedPacing(), log=log).accept_players(server_socket)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load generator for the Blackjack dealer.")
+    parser.add_argument("--host", default="127.0.0.1", help="dealer IP")
+    parser.add_argument("--port", type=int, help="dealer TCP port (required unless --local)")
+    parser.add_argument("--local", choices=["thread", "async"], help="start a local dealer on loopback and use it")
+    parser.add_argument("--sessions", type=int, default=1000, help="total sessions")
+    parser.add_argument("--rounds", type=int, default=10, help="rounds per session")
+    parser.add_argument("--ramp", type=float, default=200.0, help="new sessions per second")
+    parser.add_argument("--processes", type=int, default=None, help="load processes")
+    parser.add_argument("--strategy", choices=sorted(STRATEGIES), default="basic", help="player strategy")
+    parser.add_argument("--timeout", type=float, default=30.0, help="seconds before a player counts a timeout")
+    parser.add_argument("--pacing-ms", type=int, default=0, help="pause asked from the dealer between rounds")
+    parser.add_argument("--mux", type=int, default=0, help="sessions sharing one connection (0 = no multiplexing)")
+    parser.add_argument("--decks", type=int, default=1, help="decks the dealer plays with (for --strategy optimal)")
+    parser.add_argument("--hit-soft-17", action="store_true", help="the dealer hits a soft 17 (for --strategy optimal)")
+    args = parser.parse_args()
+
+    dealer_process = None
+    host, port = args.host, args.port
+    if args.local:
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(4096)
+        host, port = listener.getsockname()
+        dealer_process = multiprocessing.Process(target=run_local_dealer, args=(listener, args.local))
+        dealer_process.daemon = True
+        dealer_process.start()
+        listener.close()
+    elif port is None:
+        parser.error("--port is required unless --local is used")
+
+    LoadGenerator(host, port, args.sessions, args.rounds, args.ramp, args.processes, args.strategy, args.timeout,
+                  args.pacing_ms, args.mux, args.decks, args.hit_soft_17).run()
+
+    if dealer_process is not None:
+        dealer_process.terminate()
@@ -0,0 +1,232 @@
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+"""
+Dealer metrics:
+Counters, gauges and histograms updated on the dealers' hot paths, and a small HTTP endpoint that serves them in
+the Prometheus text format (GET /metrics). Updating a metric is a lock and an addition, so it can run every round;
+rates such as rounds/sec are left to the scraper (rate(blackjack_rounds_total[1m])).
+"""
+
+# Seconds - from sub-millisecond dealer work up to a player thinking for the whole turn timeout
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+                   5.0, 10.0, 30.0, 60.0)
+
+
+class Counter:
+    """
+        A value that only goes up.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def samples(self):
+        """
+                Returns:
+                    list: (name suffix, labels, value) of every sample of the metric.
+        """
+        return [("", "", self.value)]
+
+
+class Gauge(Counter):
+    """
+        A value that goes up and down.
+    """
+
+    kind = "gauge"
+
+    def dec(self, amount=1):
+        with self.lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+class Histogram:
+    """
+        Counts observations into fixed buckets, with their sum and count.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        """
+                Args:
+                    name (str): The metric name.
+                    help_text (str): Its description.
+                    buckets (tuple): Sorted upper bounds of the buckets (+Inf is added).
+        """
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # The last one is +Inf
+        self.total = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.total += value
+            self.count += 1
+
+    def samples(self):
+        with self.lock:
+            counts = list(self.counts)
+            total, count = self.total, self.count
+        samples = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            label = "+Inf" if bound == float("inf") else repr(bound)
+            samples.append(("_bucket", f'{{le="{label}"}}', cumulative))
+        samples.append(("_sum", "", total))
+        samples.append(("_count", "", count))
+        return samples
+
+
+class Registry:
+    """
+        A set of metrics rendered together.
+    """
+
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, help_text):
+        return self.register(Counter(name, help_text))
+
+    def gauge(self, name, help_text):
+        return self.register(Gauge(name, help_text))
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help_text, buckets))
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """
+                Renders every metric in the Prometheus text exposition format.
+
+                Returns:
+                    str: The page served on /metrics.
+        """
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for suffix, labels, value in metric.samples():
+                lines.append(f"{metric.name}{suffix}{labels} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class DealerMetrics:
+    """
+        The metrics of one dealer (one process): sessions, rounds, where the time of a round goes, traffic and
+        failures.
+    """
+
+    def __init__(self):
+        self.registry = Registry()
+        r = self.registry
+        self.sessions_active = r.gauge("blackjack_sessions_active", "Sessions being played right now.")
+        self.sessions = r.counter("blackjack_sessions_total", "Sessions started.")
+        self.sessions_waiting = r.gauge("blackjack_sessions_waiting", "Sessions waiting in the backlog for a slot.")
+        self.sessions_rejected = r.counter("blackjack_sessions_rejected_total",
+                                           "Sessions turned away because the dealer was full.")
+        self.sessions_resumed = r.counter("blackjack_sessions_resumed_total",
+                                          "Resumable sessions moved to a new connection after a drop.")
+        self.rounds = r.counter("blackjack_rounds_total", "Rounds played to a result.")
+        self.round_seconds = r.histogram("blackjack_round_seconds", "Duration of a round, pacing excluded.")
+        self.decision_wait = r.histogram("blackjack_decision_wait_seconds",
+                                         "Time from sending cards to receiving the player's decision.")
+        self.dealer_compute = r.histogram("blackjack_dealer_compute_seconds",
+                                          "Time per round the dealer spends dealing, settling and sending.")
+        self.bytes_sent = r.counter("blackjack_bytes_sent_total", "Payload bytes sent to players.")
+        self.bytes_received = r.counter("blackjack_bytes_received_total", "Bytes received from players.")
+        self.timeouts = r.counter("blackjack_timeouts_total", "Players kicked out for not answering in time.")
+        self.protocol_violations = r.counter("blackjack_protocol_violations_total",
+                                             "Connections closed for a bad cookie, type, request or move.")
+        self.pool_workers = r.gauge("blackjack_pool_workers", "Worker threads of the session pool (0 = no pool).")
+        self.pool_busy = r.gauge("blackjack_pool_busy_workers", "Pool workers handling a connection.")
+        self.pool_queue_depth = r.gauge("blackjack_pool_queue_depth", "Connections waiting for a free pool worker.")
+        self.pool_queue_wait = r.histogram("blackjack_pool_queue_wait_seconds",
+                                           "Time a connection waited in the queue for a pool worker.")
+        self.pool_rejected = r.counter("blackjack_pool_rejected_total",
+                                       "Connections refused because the pool's queue was full.")
+        self.tables_open = r.gauge("blackjack_tables_open", "Multi-seat tables being played (0 = no table mode).")
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """
+        Serves the registry of the server on GET /metrics.
+    """
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes are not game events
+
+
+class MetricsServer:
+    """
+        A local HTTP endpoint for a registry, served from a background thread.
+    """
+
+    def __init__(self, registry, port=9100, host='127.0.0.1'):
+        """
+                Args:
+                    registry (Registry): The metrics to serve.
+                    port (int): The HTTP port (0 = let the OS choose).
+                    host (str): The interface to listen on (local only by default).
+        """
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.httpd = None
+
+    def start(self):
+        """
+                Starts serving.
+
+                Returns:
+                    int: The port the endpoint listens on.
+        """
+        self.httpd = ThreadingHTTPServer((self.host, self.port), MetricsHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.registry = self.registry
+        self.port = self.httpd.server_address[1]
+        thread = threading.Thread(target=self.httpd.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self.port
+
+    def stop(self):
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
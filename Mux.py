@@ -0,0 +1,330 @@
+import socket
+import threading
+import time
+
+from Protocol import (DECISION_SIZE, HEADER_STRUCT, MAGIC_COOKIE, MSG_TYPE_MUX, MSG_TYPE_PACED_REQUEST,
+                      MSG_TYPE_PAYLOAD, MSG_TYPE_REQUEST, MSG_TYPE_RESUMABLE_REQUEST, MSG_TYPE_RESUME,
+                      MUX_HEADER_STRUCT, PAYLOAD_STRUCT, RecvBuffer, SESSION_BODY_STRUCT, set_nodelay)
+
+"""
+Session multiplexing:
+Many games can share one TCP connection. Every message of a game is sent as a mux message - the cookie,
+MSG_TYPE_MUX and the game's session id, followed by the game's own message without its cookie:
+
+    Cookie (4) | 0x6 (1) | Session Id (2) | Type (1) | Body (request 33/35, decision 5, payload 4)
+
+Each end splits the connection into MuxSession objects that look like a socket to the game code: reading one
+gives back the plain messages of that session (cookie included), and writing plain messages to it sends them
+as mux messages. So Dealer.handle_player and Player run unchanged on top of a session.
+"""
+
+# Size of the body that follows the type of an unwrapped message, by type
+MUX_BODY_SIZE = {
+    MSG_TYPE_REQUEST: 33,
+    MSG_TYPE_PACED_REQUEST: 35,
+    MSG_TYPE_RESUMABLE_REQUEST: 35,
+    MSG_TYPE_RESUME: SESSION_BODY_STRUCT.size,
+}
+
+# Messages a shared connection cannot carry (a session that outlives its connection makes no sense on one).
+# They are still framed, so only their session is refused and the other sessions keep playing.
+MUX_REFUSED_TYPES = frozenset((MSG_TYPE_RESUMABLE_REQUEST, MSG_TYPE_RESUME))
+
+
+def body_size(msg_type, from_dealer):
+    """
+        Returns the body size of a message inside a mux message.
+
+        Args:
+            msg_type (int): The inner message type.
+            from_dealer (bool): True for dealer -> player messages (payloads are 4 bytes, decisions are 5).
+
+        Returns:
+            int: The body size, or None for a type that cannot appear there.
+    """
+    if msg_type == MSG_TYPE_PAYLOAD:
+        return PAYLOAD_STRUCT.size - HEADER_STRUCT.size if from_dealer else DECISION_SIZE
+    if from_dealer:
+        return None
+    return MUX_BODY_SIZE.get(msg_type)
+
+
+class MuxSession:
+    """
+        One session on a multiplexed connection, with the socket methods the game code uses.
+    """
+
+    def __init__(self, sock, send_lock, session_id, message_size=None, on_close=None):
+        """
+                Initializes the session.
+
+                Args:
+                    sock (socket.socket): The shared connection.
+                    send_lock (threading.Lock): Serializes the sends of all sessions on the connection.
+                    session_id (int): The id of this session (0-65535).
+                    message_size (int): Size of every plain message written to the session, so several can be sent
+                                        at once (the dealer's payloads). None = every write is a single message.
+                    on_close (callable): Called with the session when it is closed.
+        """
+        self.sock = sock
+        self.send_lock = send_lock
+        self.session_id = session_id
+        self.message_size = message_size
+        self.on_close = on_close
+        self.timeout = None
+        self.inbound = bytearray()
+        self.eof = False
+        self.closed = False
+        self.ready = threading.Condition()
+
+    def feed(self, data):
+        """
+                Hands a plain message received for this session to its reader.
+        """
+        with self.ready:
+            self.inbound += data
+            self.ready.notify()
+
+    def feed_eof(self):
+        """
+                Marks the end of the session's input (the shared connection closed).
+        """
+        with self.ready:
+            self.eof = True
+            self.ready.notify_all()
+
+    def recv_into(self, view, n):
+        """
+                Reads up to n bytes of the session's plain messages into view, like socket.recv_into.
+
+                Returns:
+                    int: Number of bytes read (0 once the connection has closed).
+
+                Raises:
+                    socket.timeout: If nothing arrived within the session's timeout.
+        """
+        with self.ready:
+            if not self.inbound and not self.eof:
+                if not self.ready.wait_for(lambda: self.inbound or self.eof, self.timeout):
+                    raise socket.timeout("timed out")
+            count = min(n, len(self.inbound))
+            view[:count] = self.inbound[:count]
+            del self.inbound[:count]
+            return count
+
+    def sendall(self, data):
+        """
+                Sends plain messages of this session as mux messages.
+        """
+        if self.closed:
+            raise ConnectionAbortedError("Session closed")
+        size = self.message_size or len(data)
+        frames = bytearray()
+        for start in range(0, len(data), size):
+            frames += MUX_HEADER_STRUCT.pack(MAGIC_COOKIE, MSG_TYPE_MUX, self.session_id)
+            frames += data[start + 4:start + size]  # Drop the cookie (4 bytes), keep the type and body
+        with self.send_lock:
+            self.sock.sendall(frames)
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    def setsockopt(self, *args):
+        pass  # Options belong to the shared connection
+
+    def shutdown(self, how):
+        """
+                Ends the session's input (its reader gets nothing more). Writes still go out.
+        """
+        self.feed_eof()
+
+    def close(self):
+        """
+                Closes the session (not the shared connection).
+        """
+        if not self.closed:
+            self.closed = True
+            self.feed_eof()
+            if self.on_close is not None:
+                self.on_close(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class MuxDemultiplexer:
+    """
+        Reads the mux messages of one connection and hands every session its plain messages.
+        Used by both ends: the dealer creates sessions as requests arrive, the player opens them itself.
+    """
+
+    def __init__(self, sock, from_dealer, message_size=None):
+        """
+                Args:
+                    sock (socket.socket): The shared connection.
+                    from_dealer (bool): True if the messages read come from the dealer (player side).
+                    message_size (int): Size of the plain messages this end writes (see MuxSession).
+        """
+        self.sock = sock
+        self.from_dealer = from_dealer
+        self.message_size = message_size
+        self.send_lock = threading.Lock()
+        self.sessions = {}
+        self.sessions_lock = threading.Lock()
+        self.last_message = time.monotonic()  # When the last mux message was read (see `idle`)
+
+    def new_session(self, session_id):
+        """
+                Creates and registers a session.
+
+                Returns:
+                    MuxSession: The new session.
+        """
+        session = MuxSession(self.sock, self.send_lock, session_id, self.message_size, self.forget)
+        with self.sessions_lock:
+            self.sessions[session_id] = session
+        return session
+
+    def forget(self, session):
+        with self.sessions_lock:
+            if self.sessions.get(session.session_id) is session:
+                del self.sessions[session.session_id]
+
+    def idle(self):
+        """
+                Returns:
+                    float: Seconds since the last mux message was read, or None while a session is open.
+        """
+        with self.sessions_lock:
+            if self.sessions:
+                return None
+        return time.monotonic() - self.last_message
+
+    def read_messages(self, inbox, on_new_session=None, header_read=False, on_refused=None):
+        """
+                Dispatches mux messages until the connection closes or breaks the protocol.
+
+                Args:
+                    inbox (RecvBuffer): The connection's receive buffer.
+                    on_new_session (callable): Called with a new session when a message arrives for an unknown
+                                               session id (dealer side). If None, such messages are dropped.
+                    header_read (bool): True if the cookie and type of the first message were already read.
+                    on_refused (callable): Called with the session id and type of a message of MUX_REFUSED_TYPES
+                                           (dealer side), after the session it was sent on is closed.
+
+                Returns:
+                    str: Why the loop ended (None if the connection closed normally).
+        """
+        try:
+            while True:
+                if not header_read:
+                    data = inbox.recv_exact(HEADER_STRUCT.size)
+                    if data is None:
+                        return None
+                    cookie, msg_type = HEADER_STRUCT.unpack_from(data)
+                    if cookie != MAGIC_COOKIE or msg_type != MSG_TYPE_MUX:
+                        return f"Invalid mux message: cookie {hex(cookie)}, type {hex(msg_type)}"
+                header_read = False
+
+                # Session Id (2) + inner Type (1)
+                data = inbox.recv_exact(3)
+                if data is None:
+                    return "Connection closed inside a mux message"
+                session_id = int.from_bytes(data[:2], 'big')
+                msg_type = data[2]
+                size = body_size(msg_type, self.from_dealer)
+                if size is None:
+                    return f"Unknown message type {hex(msg_type)} for session {session_id}"
+                data = inbox.recv_exact(size)
+                if data is None:
+                    return "Connection closed inside a mux message"
+
+                self.last_message = time.monotonic()
+                with self.sessions_lock:
+                    session = self.sessions.get(session_id)
+                if not self.from_dealer and msg_type in MUX_REFUSED_TYPES:
+                    if session is not None:
+                        session.close()
+                    if on_refused is not None:
+                        on_refused(session_id, msg_type)
+                    continue
+                if session is None:
+                    if on_new_session is None:
+                        continue
+                    session = self.new_session(session_id)
+                    session.feed(HEADER_STRUCT.pack(MAGIC_COOKIE, msg_type) + data[:size])
+                    on_new_session(session)
+                else:
+                    session.feed(HEADER_STRUCT.pack(MAGIC_COOKIE, msg_type) + data[:size])
+        finally:
+            with self.sessions_lock:
+                sessions = list(self.sessions.values())
+            for session in sessions:
+                session.feed_eof()
+
+
+class MuxConnection:
+    """
+        The player side of a multiplexed connection: one TCP connection carrying many games.
+    """
+
+    def __init__(self, server_ip, server_tcp_port, timeout=None):
+        """
+                Args:
+                    server_ip (str): The dealer's IP.
+                    server_tcp_port (int): The dealer's TCP port.
+                    timeout (float): Default timeout of the sessions' reads (None = forever).
+        """
+        self.server_ip = server_ip
+        self.server_tcp_port = server_tcp_port
+        self.timeout = timeout
+        self.sock = None
+        self.demux = None
+        self.next_session_id = 0
+        self.id_lock = threading.Lock()
+
+    def connect(self):
+        """
+                Opens the connection and starts the thread reading it.
+        """
+        self.sock = socket.create_connection((self.server_ip, self.server_tcp_port))
+        set_nodelay(self.sock)
+        self.demux = MuxDemultiplexer(self.sock, from_dealer=True)
+        reader = threading.Thread(target=self.demux.read_messages, args=(RecvBuffer(self.sock),))
+        reader.daemon = True
+        reader.start()
+
+    def open_session(self):
+        """
+                Opens a new game on the connection.
+
+                Returns:
+                    MuxSession: A socket-like session to play on (see Player.initiate_game_over).
+
+                Raises:
+                    ConnectionError: If the connection is not open.
+                    RuntimeError: If all the 65536 session ids are taken by open sessions.
+        """
+        if self.demux is None:
+            raise ConnectionError("Not connected")
+        with self.id_lock:
+            # The ids wrap around: skip the ones of sessions still open
+            with self.demux.sessions_lock:
+                for session_id in range(self.next_session_id, self.next_session_id + 65536):
+                    if session_id % 65536 not in self.demux.sessions:
+                        break
+                else:
+                    raise RuntimeError("Every session id of the connection is in use")
+            session_id %= 65536
+            self.next_session_id = (session_id + 1) % 65536
+            session = self.demux.new_session(session_id)
+        session.settimeout(self.timeout)
+        return session
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
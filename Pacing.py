@@ -0,0 +1,94 @@
+"""
+Pacing policies:
+Decide how long the dealer waits at the start of every round and before its own turn.
+Human players want a pause to follow the game, bots and load tests want to run at wire speed.
+"""
+
+PACING_POLICIES = ("none", "fixed", "negotiated")
+
+
+class Pacing:
+    """
+        Base pacing policy - no delay at all.
+    """
+
+    def session_delay(self, requested_ms=None):
+        """
+                Returns the pause (in seconds) to use for a whole session.
+
+                Args:
+                    requested_ms (int): The delay the player asked for in its request, or None
+                                        if it sent a plain request.
+
+                Returns:
+                    float: Seconds to sleep at each pacing point (0 = no sleep).
+        """
+        return 0.0
+
+    @staticmethod
+    def add_arguments(parser):
+        """
+                Adds the --pacing* options to an argparse parser.
+        """
+        parser.add_argument("--pacing", choices=PACING_POLICIES, default="negotiated",
+                            help="none: wire speed, fixed: --pacing-ms for everyone, negotiated: the pause every "
+                                 "player asks for (--pacing-ms for plain requests)")
+        parser.add_argument("--pacing-ms", type=int, default=1000, help="the fixed or default pause in milliseconds")
+        parser.add_argument("--pacing-max-ms", type=int, default=5000, help="the longest pause a player may ask for")
+
+    @staticmethod
+    def from_args(args):
+        """
+                Builds the pacing policy chosen with the options added by `add_arguments`.
+        """
+        if args.pacing == "none":
+            return NoPacing()
+        if args.pacing == "fixed":
+            return FixedPacing(args.pacing_ms / 1000)
+        return NegotiatedPacing(args.pacing_ms / 1000, max_delay=args.pacing_max_ms / 1000)
+
+
+class NoPacing(Pacing):
+    """
+        Runs rounds at wire speed, whatever the player asked for.
+    """
+
+
+class FixedPacing(Pacing):
+    """
+        The same pause for every player (the original dealer behaviour is FixedPacing(1.0)).
+    """
+
+    def __init__(self, delay=1.0):
+        """
+                Args:
+                    delay (float): Seconds to pause at each pacing point.
+        """
+        self.delay = delay
+
+    def session_delay(self, requested_ms=None):
+        return self.delay
+
+
+class NegotiatedPacing(Pacing):
+    """
+        Lets every player pick its own pause (sent in a paced request), clamped to the dealer's limits.
+        Players that send a plain request get the default.
+    """
+
+    def __init__(self, default=1.0, min_delay=0.0, max_delay=5.0):
+        """
+                Args:
+                    default (float): Seconds to pause for players that did not ask for anything.
+                    min_delay (float): Smallest pause the dealer agrees to.
+                    max_delay (float): Largest pause the dealer agrees to.
+        """
+        self.default = default
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+
+    def session_delay(self, requested_ms=None):
+        if requested_ms is None:
+            return self.default
+        return min(max(requested_ms / 1000, self.min_delay), self.max_delay)
+
@@ -1,13 +1,21 @@
+import argparse
 import socket
 import struct
+import time
 
-from Cards import Card
+from Cards import Card, Hand
+from Discovery import shared_discovery
+from Protocol import PAYLOAD_STRUCT, RecvBuffer
+from Resume import ResumableConnection
+from Strategies import STRATEGIES, make_strategy
 
 UDP_DEST_PORT = 13122  # The client needs to listen for the offer message on 13122 UDP port
 MAGIC_COOKIE = 0xabcddcba
 MSG_TYPE_OFFER = 0x2  # Offer
 MSG_TYPE_REQUEST = 0x3  # request
 MSG_TYPE_PAYLOAD = 0x4  # payload
+MSG_TYPE_PACED_REQUEST = 0x5  # request + wanted pause between rounds
+MSG_TYPE_RESUMABLE_REQUEST = 0x7  # paced request for a session that survives a dropped connection
 TEAM_NAME = "JackWho"
 
 """
@@ -27,20 +35,104 @@ class Player:
         Represents a Player in the Blackjack game.
     """
 
-    def __init__(self):
+    def __init__(self, strategy=None, verbose=True, team_name=TEAM_NAME, timeout=None, discovery=None):
         """
                 Initializes the Player instance with default values.
+
+                Args:
+                    strategy (Strategy): Plays the decisions headless. If None, the user is asked every time.
+                    verbose (bool): Print every card and total (off for bots running at full speed).
+                    team_name (str): The name sent to the dealer (up to 32 bytes).
+                    timeout (float): Seconds to wait for the dealer before giving up (None = forever).
+                    discovery (DiscoveryService): Picks the dealer from its cache of offers instead of waiting for
+                                                  the next one (None = listen for a single offer).
         """
         self.server_ip = None
         self.server_tcp_port = None
         self.tcp_socket = None
+        self.inbox = None
         self.total_sum = 0
+        self.strategy = strategy
+        self.verbose = verbose
+        self.team_name = team_name
+        self.timeout = timeout
+        self.discovery = discovery
+        # Why the last connect / receive failed: "connect", "timeout", "reset", "closed" or "protocol"
+        self.last_error = None
+        # Seconds from sending a decision to receiving the dealer's answer
+        self.decision_latencies = []
+        # Seconds from waiting for a round's first card to receiving its result
+        self.round_latencies = []
+
+    def say(self, text):
+        """
+                Prints game progress, unless the player is quiet.
+        """
+        if self.verbose:
+            print(text)
+
+    def choose_move(self, player_total, dealer_up_value, soft=False):
+        """
+                Picks the next move - from the strategy if there is one, otherwise from the user.
+
+                Args:
+                    player_total (int): The player's current total.
+                    dealer_up_value (int): The value of the dealer's visible card.
+                    soft (bool): True if an ace counts 11 in the player's total.
+
+                Returns:
+                    str: "hit" or "stand" (anything else is asked again).
+        """
+        if self.strategy is not None:
+            return "hit" if self.strategy.decide(player_total, dealer_up_value, soft) else "stand"
+        return input("Hit or Stand? ").strip().lower()
+
+    def print_summary(self, statistics):
+        """
+                Prints the final statistics of a session and the decision latencies.
+
+                Args:
+                    statistics (dict): wins / losses / ties of the session.
+        """
+        total_played = statistics["wins"] + statistics["losses"] + statistics["ties"]
+        print(f"\n{self.team_name} - Game Over: {total_played} rounds played")
+        print(f"Wins: {statistics['wins']}, Losses: {statistics['losses']}, Ties: {statistics['ties']}")
+        if total_played > 0:
+            print(f"Win rate: {statistics['wins'] / total_played:.2f}")
+        self.print_latency_report()
+
+    def print_latency_report(self):
+        """
+                Prints how long the dealer took to answer the player's decisions.
+        """
+        if not self.decision_latencies:
+            return
+        latencies = sorted(self.decision_latencies)
+        p50 = latencies[len(latencies) // 2]
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        mean = sum(latencies) / len(latencies)
+        print(f"{self.team_name} decisions: {len(latencies)}, latency mean {mean * 1000:.3f} ms, "
+              f"p50 {p50 * 1000:.3f} ms, p99 {p99 * 1000:.3f} ms")
 
     # step 1:
-    def listen_for_offers(self):
+    def listen_for_offers(self, settle=0.0):
         """
                 Listens for UDP broadcast offers from an active Dealer.
+                With a discovery service, a dealer it already knows is used right away (the least loaded one).
+
+                Args:
+                    settle (float): With a discovery service that knows no dealer yet, seconds to keep listening
+                                    after the first offer to compare the dealers.
         """
+        if self.discovery is not None:
+            dealer = self.discovery.wait_for_dealer(self.timeout, settle)
+            if dealer is None:
+                print(f"{self.team_name} has error: No dealer offer received.")
+                return
+            self.say(f"{self.team_name} picked dealer {dealer}")
+            self.server_ip = dealer.ip
+            self.server_tcp_port = dealer.port
+            return
 
         # The client opens a UDP socket and waits for a Broadcast message on a predetermined port (13122).
         udp_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -74,26 +166,31 @@ class Player:
                     print(f"TYPE is unfamiliar")
                     continue
 
-                print(f"{TEAM_NAME} Received offer from {server_ip}, attempting to connect on TCP port {server_tcp_port}...")
+                print(f"{self.team_name} Received offer from {server_ip}, attempting to connect on TCP port {server_tcp_port}...")
                 self.server_ip = server_ip
                 self.server_tcp_port = server_tcp_port
                 break
 
         except Exception as e:
-            print(f"{TEAM_NAME} has error receiving UDP packet: {e}")
+            print(f"{self.team_name} has error receiving UDP packet: {e}")
 
         finally:
             # Always close the UDP socket when done (or if an error crashed the outer logic)
             udp_sock.close()
-            print(f"{TEAM_NAME}'s UDP socket closed.")
+            print(f"{self.team_name}'s UDP socket closed.")
 
     # step 3:
-    def initiate_game(self, rounds):  # request - also broadcast
+    def initiate_game(self, rounds, pacing_ms=None, resumable=False, grace=30.0):  # request - also broadcast
         """
                 Establishes a TCP connection with the Dealer and sends a Join Request.
 
                 Args:
                     rounds (int): The number of rounds the player wants to play (1-255).
+                    pacing_ms (int): Pause the player wants between rounds (0 = wire speed).
+                                     If None, a plain request is sent and the dealer decides.
+                    resumable (bool): Ask for a session that survives a dropped connection - the player reconnects
+                                      and resumes where it was (see Resume.py).
+                    grace (float): Seconds to keep trying to reconnect a resumable session.
 
                 Returns:
                     socket.socket: The active TCP socket if connection succeeded.
@@ -101,58 +198,127 @@ class Player:
         """
         #  The client accepts the Offer and want to initiate a TCP connection.
         if not self.server_ip or not self.server_tcp_port:
-            print(f"{TEAM_NAME} has error: No server info found.")
+            print(f"{self.team_name} has error: No server info found.")
             return None
 
         try:
+            if resumable:
+                self.tcp_socket = ResumableConnection(self.server_ip, self.server_tcp_port, self.timeout, grace)
+                self.tcp_socket.connect(self.build_request(rounds, pacing_ms or 0, MSG_TYPE_RESUMABLE_REQUEST))
+                self.inbox = RecvBuffer(self.tcp_socket)
+                self.say(f"{self.team_name} connected successfully via TCP (resumable session)!")
+                return self.tcp_socket
+
             # create TCP socket
             self.tcp_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.tcp_socket.settimeout(self.timeout)
 
             # Connect:
             self.tcp_socket.connect((self.server_ip, self.server_tcp_port))
-            print(f"{TEAM_NAME} connected successfully via TCP!")
+            self.inbox = RecvBuffer(self.tcp_socket)
+            self.say(f"{self.team_name} connected successfully via TCP!")
 
-            # Sending a request to join
+            self.send_request(rounds, pacing_ms)
+            return self.tcp_socket
 
-            team_name_bytes = TEAM_NAME.encode('utf-8')
-            padded_team_name = team_name_bytes.ljust(32, b'\x00')[:32]
+        except Exception as e:
 
-            requested_rounds = rounds
+            self.say(f"{self.team_name} failed to connect via TCP: {e}")
+            self.last_error = "timeout" if isinstance(e, socket.timeout) else "connect"
+            if self.discovery is not None:
+                self.discovery.forget(self.server_ip, self.server_tcp_port)  # Try another dealer next time
+            if self.tcp_socket is not None:
+                self.tcp_socket.close()
+            self.tcp_socket = None
+            return None
 
-            # !  = Network Order (Big Endian)
-            # I  = Cookie (4 bytes)
-            # B  = Type (1 byte)
-            # B  = Rounds (1 byte)
-            # 32s= Team Name (32 bytes)
-            request_packet = struct.pack('!I B B 32s', MAGIC_COOKIE, MSG_TYPE_REQUEST, requested_rounds,
-                                         padded_team_name)
+    def initiate_game_over(self, session, rounds, pacing_ms=None):
+        """
+                Starts a game on a session of a multiplexed connection instead of a connection of its own.
 
-            # Sending
-            self.tcp_socket.sendall(request_packet)
+                Args:
+                    session (MuxSession): A session opened with MuxConnection.open_session.
+                    rounds (int): The number of rounds the player wants to play (1-255).
+                    pacing_ms (int): Pause the player wants between rounds (see initiate_game).
 
-            return self.tcp_socket
+                Returns:
+                    MuxSession: The session, to be closed when the game is over.
+        """
+        self.tcp_socket = session
+        self.inbox = RecvBuffer(session)
+        self.send_request(rounds, pacing_ms)
+        return session
 
-        except Exception as e:
+    def send_request(self, rounds, pacing_ms=None):
+        """
+                Sends the Join Request on the open connection.
 
-            print(f"{TEAM_NAME} failed to connect via TCP: {e}")
-            self.tcp_socket = None
-            return None
+                Args:
+                    rounds (int): The number of rounds the player wants to play (1-255).
+                    pacing_ms (int): Pause the player wants between rounds (None = plain request).
+        """
+        self.tcp_socket.sendall(self.build_request(rounds, pacing_ms))
+
+    def build_request(self, rounds, pacing_ms=None, msg_type=None):
+        """
+                Builds the Join Request message.
+
+                Args:
+                    rounds (int): The number of rounds the player wants to play (1-255).
+                    pacing_ms (int): Pause the player wants between rounds (None = plain request).
+                    msg_type (int): The request type of a paced request (MSG_TYPE_PACED_REQUEST by default,
+                                    or MSG_TYPE_RESUMABLE_REQUEST).
+
+                Returns:
+                    bytes: The request packet.
+        """
+        # Building a request to join
+
+        team_name_bytes = self.team_name.encode('utf-8')
+        padded_team_name = team_name_bytes.ljust(32, b'\x00')[:32]
+
+        requested_rounds = rounds
+
+        # !  = Network Order (Big Endian)
+        # I  = Cookie (4 bytes)
+        # B  = Type (1 byte)
+        # B  = Rounds (1 byte)
+        # 32s= Team Name (32 bytes)
+        if pacing_ms is None:
+            request_packet = struct.pack('!I B B 32s', MAGIC_COOKIE, MSG_TYPE_REQUEST, requested_rounds,
+                                         padded_team_name)
+        else:
+            # H = Pacing in ms (2 bytes)
+            request_packet = struct.pack('!I B B 32s H', MAGIC_COOKIE, msg_type or MSG_TYPE_PACED_REQUEST,
+                                         requested_rounds, padded_team_name, pacing_ms)
+
+        return request_packet
 
     def all_recv(self, n):
-        data = b''
+        """
+                Reads exactly n bytes into the reusable receive buffer.
+
+                Returns:
+                    bytearray: The buffer holding the data at its start (valid until the next read),
+                               or None if the connection was lost.
+        """
         try:
-            while len(data) < n:
-                more = self.tcp_socket.recv(n - len(data))
-                if not more:
-                    print(f"{TEAM_NAME} connection closed before receiving full data")
-                    return
-                data += more
+            data = self.inbox.recv_exact(n)
+            if data is None:
+                self.last_error = "closed"
+                self.say(f"{self.team_name} connection closed before receiving full data")
             return data
         except ConnectionResetError:
-            print(f"\n{TEAM_NAME} connection was forcibly closed by the dealer (Error 10054).")
+            self.last_error = "reset"
+            self.say(f"\n{self.team_name} connection was forcibly closed by the dealer (Error 10054).")
+            return None
+        except socket.timeout:
+            self.last_error = "timeout"
+            self.say(f"\n{self.team_name} timed out waiting for the dealer.")
             return None
         except Exception as e:
-            print(f"\n[{TEAM_NAME}] Unexpected error during receive: {e}")
+            self.last_error = "closed"
+            self.say(f"\n[{self.team_name}] Unexpected error during receive: {e}")
             return None
 
     def send_decision(self, decision):
@@ -163,135 +329,151 @@ class Player:
 
     def receive_payload(self):
         # Receive payload from server (card or round result)
-        header = self.all_recv(6)  # 4 + 1 + 1
-        if not header or len(header) < 6:
-            print("The dealer kick you out!")
+        # Every payload is 4 + 1 + 1 + 3 bytes, read in one go
+        data = self.all_recv(PAYLOAD_STRUCT.size)
+        if not data:
+            self.say("The dealer kick you out!")
             return None
 
-        cookie, msg_type, result = struct.unpack('!I B B', header)
+        cookie, msg_type, result, rank, suit = PAYLOAD_STRUCT.unpack_from(data)
 
         if cookie != MAGIC_COOKIE:
-            print("Error: Invalid magic cookie in payload")
+            self.last_error = "protocol"
+            self.say("Error: Invalid magic cookie in payload")
             return None
 
-        card = None
         if msg_type != 0x4:  # not payload
-            print("Move is unfamiliar")
+            self.last_error = "protocol"
+            self.say("Move is unfamiliar")
             return None
 
-        # Round not over → card is included
-        card_data = self.all_recv(3)
-        rank, suit = struct.unpack('!H B', card_data)
-        card = Card(suit, rank)
-        return result, card
+        # Shared Card views, nothing allocated per payload
+        return result, Card.lookup(suit, rank)
 
 
     def play_game(self, rounds):
+        """
+                Plays the requested rounds on the open connection.
+
+                Args:
+                    rounds (int): Number of rounds that were requested.
+
+                Returns:
+                    dict: wins / losses / ties of the rounds played.
+        """
+        statistics = {"wins": 0, "losses": 0, "ties": 0}
         try:
-            statistics = {"wins": 0, "losses": 0, "ties": 0}
             for round_num in range(1, rounds + 1):
-                print(f"\n=== {TEAM_NAME} starting round {round_num} ===")
-                player_total = 0
-                dealer_total = 0
+                self.say(f"\n=== {self.team_name} starting round {round_num} ===")
+                round_started = time.perf_counter()
+                player_hand = Hand()
+                dealer_hand = Hand()
                 # receive initial cards
                 for i in range(0, 2):
                     payload = self.receive_payload()
                     if not payload:
-                        print(f"For {TEAM_NAME} game aborted.")
-                        return
+                        self.say(f"For {self.team_name} game aborted.")
+                        return statistics
                     result, card = payload
                     if card:
-                        print(f"You received card: {card.print_card()}")
-                        player_total += card.get_value()
-                        print(f"Your total: {player_total}")
+                        self.say(f"You received card: {card.print_card()}")
+                        player_hand.add(card)
+                        self.say(f"Your total: {player_hand.total}")
 
                 # dealer initial card
                 payload = self.receive_payload()
                 if not payload:
-                    print(f"For {TEAM_NAME} Connection closed or invalid data")
-                    return
+                    self.say(f"For {self.team_name} Connection closed or invalid data")
+                    return statistics
                 result, card = payload
                 if card:
-                    print(f"Dealer received card: {card.print_card()}")
-                    dealer_total += card.get_value()
-                    print(f"Dealer total: {dealer_total}")
+                    self.say(f"Dealer received card: {card.print_card()}")
+                    dealer_hand.add(card)
+                    self.say(f"Dealer total: {dealer_hand.total}")
+                dealer_up_value = dealer_hand.hard  # The strategies index the up card with the ace as 1
 
                 flag = True
                 # Ask player decision
                 while flag:
-                    move = input("Hit or Stand? ").strip().lower()
+                    move = self.choose_move(player_hand.total, dealer_up_value, player_hand.soft)
                     if move.lower() == "hit":
+                        sent_at = time.perf_counter()
                         self.send_decision("Hittt")
                         # wait for card
                         payload = self.receive_payload()
                         if not payload:
-                            return  # failed
+                            return statistics  # failed
+                        self.decision_latencies.append(time.perf_counter() - sent_at)
                         result, card = payload
                         if card:
-                            print(f"Received card: {card.print_card()}")
-                            player_total += card.get_value()
-                            print(f"Your total: {player_total}")
+                            self.say(f"Received card: {card.print_card()}")
+                            player_hand.add(card)
+                            self.say(f"Your total: {player_hand.total}")
 
-                        if player_total > 21:
-                            print("You went over 21! Bust!")
+                        if player_hand.is_bust():
+                            self.say("You went over 21! Bust!")
                             payload = self.receive_payload()
                             if not payload:
-                                return
+                                return statistics
                             result, card = payload
                             if result != 0x0:
                                 if result == 0x3:
-                                    print("You win this round!")
+                                    self.say("You win this round!")
                                     statistics["wins"] += 1
                                 elif result == 0x2:
-                                    print("You lose this round!")
+                                    self.say("You lose this round!")
                                     statistics["losses"] += 1
                                 elif result == 0x1:
-                                    print("You ties this round!")
+                                    self.say("You ties this round!")
                                     statistics["ties"] += 1
                                 flag = False
                             break
                     elif move.lower() == "stand":
+                        sent_at = time.perf_counter()
                         self.send_decision("Stand")
                         while True:
                             payload = self.receive_payload()
                             if not payload:
-                                print(f"For {TEAM_NAME} connection closed or invalid data")
-                                return
+                                self.say(f"For {self.team_name} connection closed or invalid data")
+                                return statistics
+                            if sent_at is not None:
+                                self.decision_latencies.append(time.perf_counter() - sent_at)
+                                sent_at = None
                             result, card = payload
                             if card.suit != 0:
-                                print(f"Dealer received: {card.print_card()}")
-                                dealer_total += card.get_value()
-                                print(f"Dealer total: {dealer_total}")
+                                self.say(f"Dealer received: {card.print_card()}")
+                                dealer_hand.add(card)
+                                self.say(f"Dealer total: {dealer_hand.total}")
                             if result != 0x0:
                                 # round over
                                 if result == 0x3:
-                                    print("You win this round!")
+                                    self.say("You win this round!")
                                     statistics["wins"] += 1
                                 elif result == 0x2:
-                                    print("You lose this round!")
+                                    self.say("You lose this round!")
                                     statistics["losses"] += 1
                                 elif result == 0x1:
-                                    print("You ties this round!")
+                                    self.say("You ties this round!")
                                     statistics["ties"] += 1
                                 flag = False
                                 break
                         break
                     else:
-                        print(f"{TEAM_NAME} please enter 'Hit' or 'Stand'.")
+                        self.say(f"{self.team_name} please enter 'Hit' or 'Stand'.")
                         continue
 
-                print(f"End of round {round_num}")
+                self.round_latencies.append(time.perf_counter() - round_started)
+                self.say(f"End of round {round_num}")
 
             # final Statistics
-            total_played = statistics["wins"] + statistics["losses"] + statistics["ties"]
-            print(f"\n{TEAM_NAME} - Game Over: {total_played} rounds played")
-            print(f"Wins: {statistics['wins']}, Losses: {statistics['losses']}, Ties: {statistics['ties']}")
-            if total_played > 0:
-                print(f"Win rate: {statistics['wins'] / total_played:.2f}")
+            if self.verbose:
+                self.print_summary(statistics)
 
         except KeyboardInterrupt:
             print("\nKeyboard interrupt detected. Exiting.")
 
+        return statistics
+
 
 def main():
     """
@@ -317,7 +499,8 @@ def main():
                 print("\nExiting.")
                 return
 
-        player = Player()
+        # The offers heard stay cached between games, so the next game starts right away
+        player = Player(discovery=shared_discovery())
 
         # --- Step 1 ---
         player.listen_for_offers()
@@ -347,5 +530,50 @@ def main():
                 print(f"{TEAM_NAME} please enter 'y' or 'n'.")
 
 
+def run_bot(strategy, rounds, pacing_ms=0, verbose=False, resumable=False, compare_for=None):
+    """
+        Plays one headless session: finds a dealer, connects and lets the strategy decide.
+
+        Args:
+            strategy (Strategy): Decides every move.
+            rounds (int): Number of rounds to play (1-255).
+            pacing_ms (int): Pause asked from the dealer between rounds (0 = wire speed).
+            verbose (bool): Print every card and total.
+            resumable (bool): Play a session that survives a dropped connection.
+            compare_for (float): If set, listen this many seconds after the first offer and join the least loaded
+                                 dealer (None = the first offer heard).
+
+        Returns:
+            dict: wins / losses / ties, or None if no game could be started.
+    """
+    player = Player(strategy, verbose, discovery=shared_discovery() if compare_for is not None else None)
+    player.listen_for_offers(compare_for or 0.0)
+    sock = player.initiate_game(rounds, pacing_ms, resumable)
+    if not sock:
+        print(f"{TEAM_NAME} - Failed to start game.")
+        return None
+    with sock:
+        statistics = player.play_game(rounds)
+    if not verbose:
+        player.print_summary(statistics)
+    return statistics
+
+
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Blackjack player. Interactive unless a strategy is given.")
+    parser.add_argument("--strategy", choices=sorted(STRATEGIES), help="play headless with this strategy")
+    parser.add_argument("--rounds", type=int, default=10, help="rounds to play headless (1-255)")
+    parser.add_argument("--pacing-ms", type=int, default=0, help="pause asked from the dealer between rounds")
+    parser.add_argument("--decks", type=int, default=1, help="decks the dealer plays with (for --strategy optimal)")
+    parser.add_argument("--hit-soft-17", action="store_true", help="the dealer hits a soft 17 (for --strategy optimal)")
+    parser.add_argument("--verbose", action="store_true", help="print every card when playing headless")
+    parser.add_argument("--resumable", action="store_true", help="reconnect and resume if the connection drops")
+    parser.add_argument("--compare-dealers", type=float, default=None, metavar="SECONDS",
+                        help="listen this long for other dealers and join the least loaded one")
+    args = parser.parse_args()
+
+    if args.strategy:
+        run_bot(make_strategy(args.strategy, args.decks, args.hit_soft_17), args.rounds, args.pacing_ms, args.verbose,
+                args.resumable, args.compare_dealers)
+    else:
+        main()
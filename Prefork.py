@@ -0,0 +1,307 @@
+import argparse
+import multiprocessing
+import os
+import queue
+import signal
+import socket
+import threading
+import time
+
+from Admission import AdmissionController
+from AsyncDealer import AsyncAdmissionController, AsyncDealer
+from Cards import RNG_KINDS
+from Dealer import Dealer
+from EventLog import EventLog
+from History import HistoryWriter
+from Pacing import Pacing
+from Timers import Deadlines
+
+"""
+The pre-fork Dealer:
+The main process picks a TCP port, broadcasts the offers and collects statistics.
+N worker processes each open their own listening socket on that same port with SO_REUSEPORT, so the kernel
+spreads incoming players between them and every worker runs handle_player on its own core (its own GIL).
+"""
+
+ENGINES = {
+    "thread": Dealer,
+    "async": AsyncDealer,
+}
+ADMISSION = {
+    "thread": AdmissionController,
+    "async": AsyncAdmissionController,
+}
+
+
+def reuseport_socket(port):
+    """
+        Creates a TCP socket with SO_REUSEPORT set and binds it to the given port.
+
+        Args:
+            port (int): The port to bind (0 = let the OS choose).
+
+        Returns:
+            socket.socket: The bound (not yet listening) socket.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind(('0.0.0.0', port))
+    return sock
+
+
+def stop_worker(signum, frame):
+    raise KeyboardInterrupt
+
+
+def run_worker(port, engine, pacing, stats_queue, decks, penetration, log=None, metrics_port=None,
+               history_path=None, max_sessions=0, backlog=0, active_sessions=None, pool_size=0, hit_soft_17=False,
+               table_seats=0, seed=None, rng_kind="mt", deadlines=None, shared_slots=0):
+    """
+        Entry point of a worker process: accepts players on the shared port forever.
+
+        Args:
+            port (int): The shared TCP port.
+            engine (str): "thread" or "async".
+            pacing (Pacing): The pacing policy for the worker's dealer.
+            stats_queue (multiprocessing.Queue): Where finished sessions are reported.
+            decks (int): Number of decks in every session's shoe.
+            penetration (float): Part of the shoe dealt before it is reshuffled.
+            log (EventLog): The worker's event log settings (every worker writes its own events).
+            metrics_port (int): Port of the worker's own metrics endpoint (None = no endpoint).
+            history_path (str): The worker's own history log (None = no history).
+            max_sessions (int): The worker's own slots (0 = no limit).
+            backlog (int): Sessions that may wait for a slot in the worker.
+            active_sessions (multiprocessing.Value): The active session count of all the workers, for the offers
+                                                     and the admission.
+            pool_size (int): With the thread engine, handle the players on this many threads (0 = one each).
+            hit_soft_17 (bool): The dealer hits a soft 17.
+            table_seats (int): With the thread engine, seat the players at tables of this many seats (0 = no tables).
+            seed (int): The seed of the worker's shoe seeds (None = fresh seeds from the OS).
+            rng_kind (str): The shoes' random generator, one of Cards.RNG_KINDS.
+            deadlines (Deadlines): How long the worker's dealer waits for its players (None = the defaults).
+            shared_slots (int): The slots of all the workers: the worker's sessions take any of them that is free,
+                                so a slot freed in another worker admits a session waiting here.
+    """
+    # terminate() sends SIGTERM: leave through the cleanup below, so the history log gets flushed
+    signal.signal(signal.SIGTERM, stop_worker)
+    history = HistoryWriter(history_path) if history_path else None
+    admission = ADMISSION[engine](max_sessions, backlog, shared=active_sessions, shared_capacity=shared_slots)
+    # Coroutines need no pool, and the tables are played by threads
+    options = {"pool_size": pool_size, "table_seats": table_seats} if engine == "thread" else {}
+    dealer = ENGINES[engine](pacing, stats_queue, decks, penetration, log=log, history=history, admission=admission,
+                             hit_soft_17=hit_soft_17, seed=seed, rng_kind=rng_kind, deadlines=deadlines, **options)
+    if metrics_port is not None:
+        dealer.start_metrics_server(metrics_port)
+    server_socket = reuseport_socket(port)
+    server_socket.listen(1024)
+    print(f"Worker {os.getpid()} accepting players on PORT {port}")
+    try:
+        if engine == "async":
+            import asyncio
+            server_socket.setblocking(False)
+            asyncio.run(dealer.serve(server_socket))
+        else:
+            dealer.accept_players(server_socket)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server_socket.close()
+        if history is not None:
+            history.close()
+
+
+class PreforkDealer:
+    """
+        Runs several dealer worker processes behind one TCP port (SO_REUSEPORT).
+    """
+
+    def __init__(self, workers=None, engine="thread", pacing=None, stats_interval=10.0, decks=1, penetration=0.75,
+                 log=None, metrics_port=None, history_path=None, max_sessions=0, backlog=0, pool_size=0,
+                 hit_soft_17=False, table_seats=0, seed=None, rng_kind="mt", deadlines=None):
+        """
+                Initializes the PreforkDealer.
+
+                Args:
+                    workers (int): Number of worker processes. Defaults to the number of cores.
+                    engine (str): "thread" (Dealer) or "async" (AsyncDealer) in every worker.
+                    pacing (Pacing): The pacing policy of the workers' dealers.
+                    stats_interval (float): Seconds between two aggregated statistics reports.
+                    decks (int): Number of decks in every session's shoe.
+                    penetration (float): Part of the shoe dealt before it is reshuffled.
+                    log (EventLog): The event log of the workers' dealers. Defaults to EventLog().
+                    metrics_port (int): If set, worker i serves its metrics on metrics_port + i.
+                    history_path (str): If set, worker i appends its rounds to the history log history_path.i
+                                        (read them together with History.py).
+                    max_sessions (int): Slots of every worker (0 = no limit). The workers share their slots: a
+                                        busy worker takes the free slots of the others, max_sessions * workers
+                                        sessions are played at once in all.
+                    backlog (int): Sessions that may wait for a slot in every worker.
+                    pool_size (int): With the thread engine, every worker handles its players on a pool of this
+                                     many threads (0 = a new thread for every player).
+                    hit_soft_17 (bool): The workers' dealers hit a soft 17.
+                    table_seats (int): With the thread engine, every worker seats its players at tables of this
+                                       many seats (0 = a private game for every player).
+                    seed (int): If set, worker i derives its shoes' seeds from seed + i, so a run deals the same
+                                cards again (None = fresh seeds from the OS).
+                    rng_kind (str): The shoes' random generator, one of Cards.RNG_KINDS.
+                    deadlines (Deadlines): How long the workers' dealers wait for their players (None = the
+                                           defaults).
+        """
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine: {engine}")
+        if engine == "async" and (pool_size or table_seats):
+            raise ValueError("The async engine has no worker pool and no tables")
+        self.workers = workers or os.cpu_count() or 1
+        self.engine = engine
+        self.pacing = pacing
+        self.stats_interval = stats_interval
+        self.decks = decks
+        self.penetration = penetration
+        self.log = log if log is not None else EventLog()
+        self.metrics_port = metrics_port
+        self.history_path = history_path
+        self.max_sessions = max_sessions
+        self.backlog = backlog
+        self.pool_size = pool_size
+        self.hit_soft_17 = hit_soft_17
+        self.table_seats = table_seats
+        self.seed = seed
+        self.rng_kind = rng_kind
+        self.deadlines = deadlines
+        # Sessions played by all the workers together, announced in the offers
+        self.active_sessions = multiprocessing.Value('i', 0)
+        self.stats_queue = multiprocessing.Queue()
+        self.processes = []
+        # pid -> {"sessions", "rounds", "wins", "losses", "ties"}
+        self.worker_stats = {}
+
+    def record(self, pid, statistics):
+        """
+                Adds a finished session to the statistics of its worker.
+
+                Args:
+                    pid (int): The worker process that served the session.
+                    statistics (dict): wins / losses / ties of the session.
+        """
+        stats = self.worker_stats.setdefault(pid, {"sessions": 0, "rounds": 0, "wins": 0, "losses": 0, "ties": 0})
+        stats["sessions"] += 1
+        for key in ("wins", "losses", "ties"):
+            stats[key] += statistics[key]
+            stats["rounds"] += statistics[key]
+
+    def print_statistics(self):
+        """
+                Prints the statistics of every worker and the total over all of them.
+        """
+        total = {"sessions": 0, "rounds": 0, "wins": 0, "losses": 0, "ties": 0}
+        print("\n=== Dealer statistics ===")
+        for pid, stats in sorted(self.worker_stats.items()):
+            print(f"Worker {pid}: {stats['sessions']} sessions, {stats['rounds']} rounds "
+                  f"(W {stats['wins']} / L {stats['losses']} / T {stats['ties']})")
+            for key in total:
+                total[key] += stats[key]
+        win_rate = total["wins"] / total["rounds"] if total["rounds"] > 0 else 0
+        print(f"All workers: {total['sessions']} sessions, {total['rounds']} rounds, player win rate: {win_rate:.2f}")
+
+    def start_dealer(self):
+        """
+            Forks the workers, broadcasts the offers and collects statistics until interrupted.
+            Falls back to a single process dealer where SO_REUSEPORT is not available.
+        """
+        if not hasattr(socket, "SO_REUSEPORT"):
+            print("SO_REUSEPORT is not supported here, running a single process dealer.")
+            history = HistoryWriter(self.history_path) if self.history_path else None
+            options = {"pool_size": self.pool_size, "table_seats": self.table_seats} if self.engine == "thread" else {}
+            dealer = ENGINES[self.engine](self.pacing, None, self.decks, self.penetration, log=self.log,
+                                          history=history,
+                                          admission=ADMISSION[self.engine](self.max_sessions, self.backlog),
+                                          hit_soft_17=self.hit_soft_17, seed=self.seed, rng_kind=self.rng_kind,
+                                          deadlines=self.deadlines, **options)
+            if self.metrics_port is not None:
+                dealer.start_metrics_server(self.metrics_port)
+            try:
+                dealer.start_dealer()
+            finally:
+                if history is not None:
+                    history.close()
+            return
+
+        # Holding a bound (not listening) socket keeps the port ours, the workers do the listening
+        port_holder = reuseport_socket(0)
+        server_port = port_holder.getsockname()[1]
+        print(f"Dealer is listening on TCP PORT {server_port} with {self.workers} {self.engine} workers")
+
+        for index in range(self.workers):
+            metrics_port = self.metrics_port + index if self.metrics_port is not None else None
+            history_path = f"{self.history_path}.{index}" if self.history_path else None
+            seed = self.seed + index if self.seed is not None else None
+            process = multiprocessing.Process(target=run_worker,
+                                              args=(server_port, self.engine, self.pacing, self.stats_queue,
+                                                    self.decks, self.penetration, self.log, metrics_port,
+                                                    history_path, self.max_sessions, self.backlog,
+                                                    self.active_sessions, self.pool_size, self.hit_soft_17,
+                                                    self.table_seats, seed, self.rng_kind, self.deadlines,
+                                                    self.max_sessions * self.workers))
+            process.daemon = True
+            process.start()
+            self.processes.append(process)
+
+        # A single announcer for all the workers, with their load together
+        announcer = Dealer(self.pacing, log=self.log,
+                           admission=AdmissionController(self.max_sessions * self.workers, shared=self.active_sessions))
+        broadcast_thread = threading.Thread(target=announcer.broadcast_offers, args=(server_port,))
+        broadcast_thread.daemon = True
+        broadcast_thread.start()
+
+        next_report = time.monotonic() + self.stats_interval
+        try:
+            while True:
+                try:
+                    pid, team, statistics = self.stats_queue.get(timeout=1.0)
+                    self.record(pid, statistics)
+                except queue.Empty:
+                    pass
+
+                if time.monotonic() >= next_report:
+                    self.print_statistics()
+                    next_report = time.monotonic() + self.stats_interval
+        except KeyboardInterrupt:
+            print("\nStopping the workers.")
+        finally:
+            for process in self.processes:
+                process.terminate()
+            for process in self.processes:
+                process.join()
+            port_holder.close()
+            self.print_statistics()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="The pre-fork Blackjack dealer.")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="thread", help="dealer engine of the workers")
+    parser.add_argument("--metrics-port", type=int, default=None, help="first worker's metrics port (one per worker)")
+    parser.add_argument("--history", metavar="FILE", help="append every round to FILE.<worker> history logs")
+    parser.add_argument("--max-sessions", type=int, default=0,
+                        help="slots of every worker, shared by all the workers (0 = no limit)")
+    parser.add_argument("--backlog", type=int, default=0, help="sessions that may wait for a slot in every worker")
+    parser.add_argument("--pool", type=int, default=0, help="thread engine: player threads per worker (0 = one each)")
+    parser.add_argument("--hit-soft-17", action="store_true", help="the dealers hit a soft 17")
+    parser.add_argument("--seed", type=int, default=None, help="worker i seeds its shoes from seed + i")
+    parser.add_argument("--rng", choices=RNG_KINDS, default="mt", help="random generator of the shoes")
+    parser.add_argument("--table-seats", type=int, default=0,
+                        help="thread engine: seat the players at tables of this many seats (0 = a private game each)")
+    Pacing.add_arguments(parser)
+    Deadlines.add_arguments(parser)
+    EventLog.add_arguments(parser)
+    args = parser.parse_args()
+    if args.engine == "async" and (args.pool or args.table_seats):
+        parser.error("--pool and --table-seats need the thread engine")
+
+    dealer = PreforkDealer(args.workers, args.engine, Pacing.from_args(args), log=EventLog.from_args(args),
+                           metrics_port=args.metrics_port, history_path=args.history, max_sessions=args.max_sessions,
+                           backlog=args.backlog, pool_size=args.pool, hit_soft_17=args.hit_soft_17,
+                           table_seats=args.table_seats, seed=args.seed, rng_kind=args.rng,
+                           deadlines=Deadlines.from_args(args))
+    dealer.start_dealer()
@@ -0,0 +1,152 @@
+import socket
+import struct
+
+"""
+The wire protocol shared by the dealers and the player:
+Message constants, precompiled struct formats, the outgoing frame buffer and the receive buffer.
+"""
+
+MAGIC_COOKIE = 0xabcddcba
+MSG_TYPE_OFFER = 0x2  # Offer
+MSG_TYPE_REQUEST = 0x3
+MSG_TYPE_PAYLOAD = 0x4
+MSG_TYPE_PACED_REQUEST = 0x5  # Request + the pause (ms) the player wants between rounds
+MSG_TYPE_MUX = 0x6  # A message of one of many sessions sharing a connection
+MSG_TYPE_RESUMABLE_REQUEST = 0x7  # Paced request for a session that survives a dropped connection
+MSG_TYPE_SESSION = 0x8  # Dealer -> player: the session token (answers a resumable request or a resume)
+MSG_TYPE_RESUME = 0x9  # Player -> dealer: reconnect to a session by its token
+
+OFFER_PORT = 13122  # The UDP port the offers are broadcast to
+
+# Precompiled formats
+# I = Cookie (4 bytes), B = Type (1 byte)
+HEADER_STRUCT = struct.Struct('!I B')
+# Cookie, Type, Server TCP Port (2 bytes), Server Name (32 bytes)
+OFFER_STRUCT = struct.Struct('!I B H 32s')
+# Optional offer extension (players that only read the port ignore it):
+# Active Sessions (2 bytes), Max Sessions (2 bytes, 0 = no limit)
+OFFER_LOAD_STRUCT = struct.Struct('!H H')
+# Cookie, Type, Result (1 byte), Rank (2 bytes), Suit (1 byte)
+PAYLOAD_STRUCT = struct.Struct('!I B B H B')
+# Rounds (1 byte), Team Name (32 bytes)
+REQUEST_STRUCT = struct.Struct('!B 32s')
+# Rounds (1 byte), Team Name (32 bytes), Pacing in ms (2 bytes)
+PACED_REQUEST_STRUCT = struct.Struct('!B 32s H')
+DECISION_SIZE = 5  # "Hittt" / "Stand"
+# Multiplexed message: Cookie, MSG_TYPE_MUX, Session Id (2 bytes), then the session's own message without its cookie
+MUX_HEADER_STRUCT = struct.Struct('!I B H')
+# Session / resume message: Cookie, Type, Token (16 bytes), game bytes received so far from the other side (8 bytes)
+SESSION_STRUCT = struct.Struct('!I B 16s Q')
+SESSION_BODY_STRUCT = struct.Struct('!16s Q')  # The same after the cookie and type
+TOKEN_SIZE = 16
+
+
+def set_nodelay(conn, enabled=True):
+    """
+        Turns Nagle's algorithm off (or back on) for a TCP socket.
+        With frames coalesced by FrameBuffer every send is a complete step, so there is nothing to wait for.
+
+        Args:
+            conn (socket.socket): The TCP socket.
+            enabled (bool): True to send every write immediately (TCP_NODELAY).
+    """
+    conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1 if enabled else 0)
+
+
+class FrameBuffer:
+    """
+        Collects the payload messages of one step (initial deal, dealer's turn + result)
+        in a reusable buffer, so the whole step goes out in a single send.
+    """
+
+    def __init__(self, conn=None, capacity=32):
+        """
+                Initializes the buffer.
+
+                Args:
+                    conn (socket.socket): The socket `flush` sends to (None if only `take` is used).
+                    capacity (int): Number of payload messages to preallocate room for.
+        """
+        self.conn = conn
+        self.buffer = bytearray(capacity * PAYLOAD_STRUCT.size)
+        self.length = 0
+
+    def add_card(self, result, card):
+        """
+                Appends a payload message.
+
+                Args:
+                    result (int): 0x0 / 0x1 / 0x2 / 0x3
+                    card (Card): The card to send (NO_CARD with results).
+        """
+        end = self.length + PAYLOAD_STRUCT.size
+        if end > len(self.buffer):
+            self.buffer.extend(bytes(len(self.buffer)))
+        PAYLOAD_STRUCT.pack_into(self.buffer, self.length, MAGIC_COOKIE, MSG_TYPE_PAYLOAD, result, card.rank,
+                                 card.suit)
+        self.length = end
+
+    def flush(self):
+        """
+                Sends everything collected so far in one sendall and empties the buffer.
+
+                Returns:
+                    int: Number of bytes sent.
+        """
+        sent = self.length
+        if sent:
+            with memoryview(self.buffer) as view:
+                self.conn.sendall(view[:sent])
+            self.length = 0
+        return sent
+
+    def take(self):
+        """
+                Empties the buffer and returns its content (for writers that keep a reference, like asyncio).
+
+                Returns:
+                    bytes: The collected messages.
+        """
+        data = bytes(self.buffer[:self.length])
+        self.length = 0
+        return data
+
+
+class RecvBuffer:
+    """
+        A reusable receive buffer for one connection.
+        Messages are read straight into a preallocated bytearray with recv_into and parsed in place with the
+        precompiled structs' unpack_from, so no bytes object is built per message.
+    """
+
+    def __init__(self, sock, capacity=64):
+        """
+                Initializes the buffer.
+
+                Args:
+                    sock (socket.socket): The connection to read from.
+                    capacity (int): Size of the largest message that will be read.
+        """
+        self.sock = sock
+        self.buffer = bytearray(capacity)
+        self.view = memoryview(self.buffer)
+
+    def recv_exact(self, n):
+        """
+                Reads exactly n bytes into the start of the buffer.
+
+                Args:
+                    n (int): Number of bytes to read.
+
+                Returns:
+                    bytearray: The buffer (valid until the next call), or None if the connection was closed first.
+        """
+        got = self.sock.recv_into(self.view, n)
+        while got < n:
+            if got == 0:
+                return None
+            more = self.sock.recv_into(self.view[got:], n - got)
+            if not more:
+                return None
+            got += more
+        return self.buffer
@@ -0,0 +1,286 @@
+import argparse
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from Capture import FROM_DEALER, FROM_PLAYER, describe_message, read_capture
+from Dealer import Dealer
+from EventLog import OFF, EventLog
+from Pacing import NoPacing
+from Player import Player
+from Protocol import (HEADER_STRUCT, MAGIC_COOKIE, MSG_TYPE_PACED_REQUEST, MSG_TYPE_REQUEST,
+                      MSG_TYPE_RESUMABLE_REQUEST, PACED_REQUEST_STRUCT, REQUEST_STRUCT, RecvBuffer)
+from Strategies import STRATEGIES, make_strategy
+
+"""
+Capture replay:
+Drives a Dealer or a Player through the sessions of a capture (see Capture.py), without a live peer.
+- Against a dealer, the replayer plays the captured player: it sends the recorded requests and decisions to an
+  in-process Dealer that deals from the session's recorded shoe seed, and checks that the dealer answers with
+  exactly the recorded bytes. Run over a whole capture, it is also a benchmark of the dealer on real traffic.
+- Against a player, the replayer plays the captured dealer: it feeds the recorded payloads to a Player with a
+  strategy and checks that it sends the recorded decisions - e.g. to reproduce what a misbehaving client did.
+Both run at full speed, or with the player's (or the dealer's) messages sent at their original times.
+
+    python Replay.py traffic.cap --dealer --parallel 8
+    python Replay.py traffic.cap --player basic
+"""
+
+REPLAY_TIMEOUT = 5.0  # Seconds to wait for a message the capture says should come
+
+
+def parse_request(message):
+    """
+        Parses a captured request.
+
+        Args:
+            message (bytes): The first message of a session's player (None if it sent nothing).
+
+        Returns:
+            tuple: (type, rounds, team, pacing ms or None), or None if it is not a request a replay can play
+                   (multiplexed and resumed connections are not replayed).
+    """
+    if message is None or len(message) < HEADER_STRUCT.size:
+        return None
+    cookie, msg_type = HEADER_STRUCT.unpack_from(message)
+    if cookie != MAGIC_COOKIE:
+        return None
+    if msg_type == MSG_TYPE_REQUEST and len(message) == HEADER_STRUCT.size + REQUEST_STRUCT.size:
+        rounds, team = REQUEST_STRUCT.unpack_from(message, HEADER_STRUCT.size)
+        pacing_ms = None
+    elif msg_type in (MSG_TYPE_PACED_REQUEST, MSG_TYPE_RESUMABLE_REQUEST) and \
+            len(message) == HEADER_STRUCT.size + PACED_REQUEST_STRUCT.size:
+        rounds, team, pacing_ms = PACED_REQUEST_STRUCT.unpack_from(message, HEADER_STRUCT.size)
+    else:
+        return None
+    return msg_type, rounds, team.decode('utf-8', 'replace').strip('\x00'), pacing_ms
+
+
+def receive_until(sock, received, size):
+    """
+        Reads from a socket into a buffer until it holds `size` bytes (None = until the peer closes).
+
+        Returns:
+            bool: False if the peer closed first.
+    """
+    while size is None or len(received) < size:
+        data = sock.recv(4096)
+        if not data:
+            return False
+        received += data
+    return True
+
+
+def first_difference(expected, received):
+    """
+        Returns:
+            int: Offset of the first byte where two byte strings differ, or None if they are equal.
+    """
+    for offset, (a, b) in enumerate(zip(expected, received)):
+        if a != b:
+            return offset
+    return None if len(expected) == len(received) else min(len(expected), len(received))
+
+
+def replay_dealer(shoe):
+    """
+        Builds an in-process dealer with the rules of a captured shoe, no pacing and no event log.
+    """
+    return Dealer(NoPacing(), None, shoe["decks"], shoe["penetration"], log=EventLog(OFF),
+                  hit_soft_17=shoe["hit_soft_17"], rng_kind=shoe["rng"])
+
+
+def replay_into_dealer(captured, dealer=None, original_timing=False):
+    """
+        Plays the captured player of a session against a dealer dealing from the session's shoe.
+
+        Args:
+            captured (CapturedSession): The session to replay.
+            dealer (Dealer): The dealer to drive (None = a new one with the captured rules, see replay_dealer).
+            original_timing (bool): Send every player message at its captured time instead of at once.
+
+        Returns:
+            dict: "identical" (the dealer sent exactly the captured bytes), "difference" (a description of the
+                  first difference, or None), "messages" sent and "seconds" - or None if the session cannot be
+                  replayed (no shoe recorded, or not a plain request).
+    """
+    request = parse_request(captured.request())
+    if captured.shoe is None or request is None or request[0] == MSG_TYPE_RESUMABLE_REQUEST:
+        return None
+    if dealer is None:
+        dealer = replay_dealer(captured.shoe)
+    _, rounds, team, _ = request
+
+    # Every player message after the request, with the dealer bytes captured before it
+    expected = bytearray()
+    decisions = []
+    request_at = None
+    for at, direction, message in captured.messages:
+        if direction == FROM_DEALER:
+            expected += message
+        elif request_at is None:
+            request_at = at
+        else:
+            decisions.append((at - request_at, len(expected), message))
+
+    player_end, dealer_end = socket.socketpair()
+
+    def serve():
+        with dealer_end:
+            dealer.play(dealer_end, rounds, team, 0, RecvBuffer(dealer_end), captured.shoe["seed"])
+
+    thread = threading.Thread(target=serve, name=f"Replay dealer {captured.session}")
+    received = bytearray()
+    sent = 0
+    start = time.perf_counter()
+    thread.start()
+    with player_end:
+        player_end.settimeout(REPLAY_TIMEOUT)
+        try:
+            for at, dealer_bytes, message in decisions:
+                if not receive_until(player_end, received, dealer_bytes):
+                    break
+                if original_timing:
+                    time.sleep(max(0.0, start + at - time.perf_counter()))
+                player_end.sendall(message)
+                sent += 1
+            receive_until(player_end, received, None)
+        except OSError:
+            pass  # A timeout or a reset: the comparison below tells where the dealer went another way
+    thread.join()
+    seconds = time.perf_counter() - start
+
+    offset = first_difference(expected, received)
+    difference = None
+    if offset is not None:
+        difference = f"dealer bytes differ from byte {offset} (captured {len(expected)}, got {len(received)})"
+    return {"identical": offset is None, "difference": difference, "messages": sent + 1, "seconds": seconds}
+
+
+def replay_into_player(captured, strategy, original_timing=False):
+    """
+        Plays the captured dealer of a session against a Player.
+
+        Args:
+            captured (CapturedSession): The session to replay.
+            strategy (Strategy): The strategy of the player.
+            original_timing (bool): Send every dealer message at its captured time instead of at once.
+
+        Returns:
+            dict: "identical" (the player sent exactly the captured messages), "difference" (a description of the
+                  first difference, or None), "messages" compared and "seconds" - or None if the session cannot
+                  be replayed (not a plain request).
+    """
+    request = parse_request(captured.request())
+    if request is None or request[0] == MSG_TYPE_RESUMABLE_REQUEST:
+        return None
+    _, rounds, team, pacing_ms = request
+    player_end, dealer_end = socket.socketpair()
+    player = Player(strategy, verbose=False, team_name=team)
+
+    def play():
+        with player_end:
+            try:
+                player.initiate_game_over(player_end, rounds, pacing_ms)
+                player.play_game(rounds)
+            except OSError:
+                pass  # The replay hung up on a difference
+
+    thread = threading.Thread(target=play, name=f"Replay player {captured.session}")
+    difference = None
+    compared = 0
+    start = time.perf_counter()
+    thread.start()
+    with dealer_end:
+        dealer_end.settimeout(REPLAY_TIMEOUT)
+        first_at = captured.messages[0][0] if captured.messages else 0.0
+        for index, (at, direction, message) in enumerate(captured.messages):
+            try:
+                if direction == FROM_DEALER:
+                    if original_timing:
+                        time.sleep(max(0.0, start + at - first_at - time.perf_counter()))
+                    dealer_end.sendall(message)
+                    continue
+                received = bytearray()
+                receive_until(dealer_end, received, len(message))
+            except OSError as e:
+                difference = f"message {index}: {e}"
+                break
+            compared += 1
+            if bytes(received) != message:
+                got = describe_message(FROM_PLAYER, bytes(received)) if received else "nothing"
+                difference = f"message {index}: captured {describe_message(FROM_PLAYER, message)}, got {got}"
+                break
+    thread.join()
+    return {"identical": difference is None, "difference": difference, "messages": compared,
+            "seconds": time.perf_counter() - start}
+
+
+def replay_capture(sessions, replay, parallel=1):
+    """
+        Replays many sessions, `parallel` at a time.
+
+        Args:
+            sessions (list): CapturedSession objects.
+            replay (callable): replay_into_dealer or replay_into_player with its other arguments bound -
+                               called with a session.
+            parallel (int): Sessions replayed at once.
+
+        Returns:
+            tuple: (list of (session, result or None), wall seconds).
+    """
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=parallel) as pool:
+        results = list(zip(sessions, pool.map(replay, sessions)))
+    return results, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay captured Blackjack traffic against a dealer or a player.")
+    parser.add_argument("path", help="the capture file (see Dealer.py --capture)")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--dealer", action="store_true", help="replay the captured players against a dealer")
+    target.add_argument("--player", choices=sorted(STRATEGIES), help="replay the captured dealer against a player "
+                                                                     "with this strategy")
+    parser.add_argument("--original-timing", action="store_true", help="send the messages at their captured times")
+    parser.add_argument("--parallel", type=int, default=1, help="sessions replayed at once")
+    parser.add_argument("--quiet", action="store_true", help="only print the summary")
+    args = parser.parse_args()
+
+    captured_sessions, _ = read_capture(args.path)
+    if args.dealer:
+        dealers = {}  # One dealer per ruleset, so its metrics add up over the sessions
+
+        def replay_session(captured):
+            if captured.shoe is None:
+                return None
+            rules = (captured.shoe["decks"], captured.shoe["penetration"], captured.shoe["hit_soft_17"],
+                     captured.shoe["rng"])
+            dealer = dealers.get(rules)
+            if dealer is None:
+                dealer = dealers.setdefault(rules, replay_dealer(captured.shoe))
+            return replay_into_dealer(captured, dealer, args.original_timing)
+    else:
+        def replay_session(captured):
+            rules = (captured.shoe["decks"], captured.shoe["hit_soft_17"]) if captured.shoe else ()
+            return replay_into_player(captured, make_strategy(args.player, *rules), args.original_timing)
+
+    replayed, wall = replay_capture(captured_sessions, replay_session, args.parallel)
+    done = [(captured, result) for captured, result in replayed if result is not None]
+    identical = sum(result["identical"] for _, result in done)
+    messages = sum(result["messages"] for _, result in done)
+    if not args.quiet:
+        for captured, result in replayed:
+            if result is None:
+                print(f"{captured!r}: skipped (no shoe recorded or not a plain request)")
+            else:
+                print(f"{captured!r}: {'identical' if result['identical'] else result['difference']}")
+    print(f"{len(done)} sessions replayed ({len(replayed) - len(done)} skipped), {identical} identical, "
+          f"{len(done) - identical} differ, {messages} player messages in {wall:.3f}s "
+          f"({messages / wall if wall else 0:.0f}/s)")
+    if args.dealer:
+        rounds = sum(dealer.metrics.rounds.value for dealer in dealers.values())
+        compute = sum(dealer.metrics.dealer_compute.total for dealer in dealers.values())
+        print(f"Dealer: {rounds} rounds ({rounds / wall if wall else 0:.0f}/s), "
+              f"{compute / rounds * 1e6 if rounds else 0:.1f} us of dealer work per round")
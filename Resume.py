@@ -0,0 +1,420 @@
+import collections
+import secrets
+import socket
+import threading
+import time
+
+from Protocol import (MAGIC_COOKIE, MSG_TYPE_RESUME, MSG_TYPE_SESSION, RecvBuffer, SESSION_STRUCT, TOKEN_SIZE,
+                      set_nodelay)
+
+"""
+Resumable sessions:
+A player that sends a resumable request (0x7) gets a session token back (0x8). If the connection drops, the player
+reconnects and sends a resume message (0x9) with the token and the number of game bytes it has received. The dealer
+answers with the number of game bytes it has received, and each side resends what the other one missed:
+
+    Player                                   Dealer
+    0x7 request           ------------->
+                          <-------------     0x8 token, 0
+    ... payloads / decisions ...
+    (connection drops)                       play() waits up to the grace window
+    0x9 token, got N      ------------->     (new connection)
+                          <-------------     0x8 token, got M  + payload bytes from N on
+    decision bytes from M on ----------->
+    ... the round goes on ...
+
+A finished session stays resumable for the grace window too, so a player that lost the last result can still get
+it. Both ends wrap their connection in a socket-like object that does this underneath, so Dealer.play and Player
+keep reading and writing plain messages and never see the drop.
+"""
+
+
+def session_message(msg_type, token, received):
+    return SESSION_STRUCT.pack(MAGIC_COOKIE, msg_type, token, received)
+
+
+class SessionRegistry:
+    """
+        The resumable sessions of a dealer, by token.
+    """
+
+    def __init__(self, grace=30.0):
+        """
+                Args:
+                    grace (float): Seconds a session waits for its player to reconnect after a drop.
+        """
+        self.grace = grace
+        self.sessions = {}
+        self.finished = collections.deque()  # (expiry, token) of finished sessions, oldest first
+        self.lock = threading.Lock()
+
+    def register(self, session):
+        """
+                Gives a session a fresh token.
+
+                Returns:
+                    bytes: The token.
+        """
+        token = secrets.token_bytes(TOKEN_SIZE)
+        with self.lock:
+            self.purge()
+            self.sessions[token] = session
+        return token
+
+    def get(self, token):
+        with self.lock:
+            self.purge()
+            return self.sessions.get(token)
+
+    def finish(self, token):
+        """
+                Keeps a finished session for the grace window (it only replays what the player missed), then drops it.
+        """
+        with self.lock:
+            self.finished.append((time.monotonic() + self.grace, token))
+
+    def purge(self):
+        # Called with the lock held
+        now = time.monotonic()
+        while self.finished and self.finished[0][0] <= now:
+            self.sessions.pop(self.finished.popleft()[1], None)
+
+    def open(self, sock, team):
+        """
+                Starts a resumable session on a new connection and sends its token.
+
+                Returns:
+                    ResumableSession: The socket-like session to play on.
+        """
+        session = ResumableSession(self, sock, team)
+        sock.sendall(session_message(MSG_TYPE_SESSION, session.token, 0))
+        return session
+
+    def resume(self, token, sock, received):
+        """
+                Moves a session to the player's new connection.
+
+                Args:
+                    token (bytes): The session token sent by the player.
+                    sock (socket.socket): The new connection (owned by the session from now on).
+                    received (int): Game bytes the player has received.
+
+                Returns:
+                    The resumed session, or None if the token is unknown or the session cannot be resumed.
+        """
+        session = self.get(token)
+        if session is None or not session.resume(sock, received):
+            return None
+        return session
+
+
+class ResumableSession:
+    """
+        The dealer side of a resumable session: a socket-like object whose connection can be replaced.
+        Every game byte sent is kept (a session is at most 255 rounds), so whatever the player missed can be
+        sent again.
+    """
+
+    def __init__(self, registry, sock, team):
+        self.registry = registry
+        self.sock = sock
+        self.team = team
+        self.token = registry.register(self)
+        self.generation = 0  # Bumped every time the connection is replaced
+        self.sent = bytearray()
+        self.received = 0
+        self.timeout = None
+        self.closed = False
+        self.reads_shut = False  # The dealer gave up on the player's input (see shutdown)
+        self.resumes = 0
+        self.changed = threading.Condition()
+
+    def recv_into(self, view, n):
+        """
+                Reads like socket.recv_into. A dropped connection waits for the player to resume.
+
+                Returns:
+                    int: Number of bytes read (0 if the player did not come back within the grace window).
+        """
+        while True:
+            sock, generation = self.sock, self.generation
+            try:
+                got = sock.recv_into(view, n)
+            except socket.timeout:
+                raise
+            except OSError:
+                got = 0
+            if got:
+                with self.changed:
+                    if self.generation == generation:
+                        self.received += got
+                        return got
+                continue  # Read from a replaced connection after the resume counted - the player sends it again
+            if self.reads_shut:
+                return 0
+            if not self.wait_for_resume(generation):
+                return 0
+
+    def sendall(self, data):
+        """
+                Sends like socket.sendall. If the connection dropped, waits for the resume (which sends the data).
+
+                Raises:
+                    ConnectionResetError: If the player did not come back within the grace window.
+        """
+        with self.changed:
+            self.sent += data
+            sock, generation = self.sock, self.generation
+        try:
+            sock.sendall(data)
+        except OSError:
+            if not self.wait_for_resume(generation):
+                raise ConnectionResetError("The player did not resume the session")
+
+    def wait_for_resume(self, generation):
+        """
+                Waits up to the grace window for the connection to be replaced (not at all once the dealer has
+                shut the session's input, see shutdown).
+
+                Args:
+                    generation (int): The generation of the connection that failed.
+
+                Returns:
+                    bool: True if a new connection is in place.
+        """
+        with self.changed:
+            if self.generation == generation and not self.closed and not self.reads_shut:
+                self.changed.wait_for(lambda: self.generation != generation or self.closed or self.reads_shut,
+                                      self.registry.grace)
+            return self.generation != generation and not self.closed and not self.reads_shut
+
+    def resume(self, sock, received):
+        """
+                Replaces the connection: answers the resume with the bytes received so far and sends the player
+                everything after the `received` bytes it already has. A finished session sends that and closes.
+
+                Returns:
+                    bool: True if the session moved to the new connection.
+        """
+        with self.changed:
+            if received > len(self.sent):
+                return False
+            if self.closed:
+                try:
+                    sock.sendall(session_message(MSG_TYPE_SESSION, self.token, self.received) + self.sent[received:])
+                finally:
+                    sock.close()
+                return True
+            old = self.sock
+            try:
+                old.shutdown(socket.SHUT_RDWR)  # Wakes a read blocked on a half-dead connection
+            except OSError:
+                pass
+            sock.settimeout(self.timeout)
+            sock.sendall(session_message(MSG_TYPE_SESSION, self.token, self.received) + self.sent[received:])
+            self.sock = sock
+            self.generation += 1
+            self.resumes += 1
+            self.changed.notify_all()
+        old.close()
+        return True
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+        self.sock.settimeout(timeout)
+
+    def setsockopt(self, *args):
+        self.sock.setsockopt(*args)
+
+    def shutdown(self, how):
+        """
+                Ends the session's input without waiting for a resume (a reader waiting for one wakes up at once);
+                writes still go out (and are kept).
+        """
+        with self.changed:
+            self.reads_shut = True
+            self.changed.notify_all()
+        self.sock.shutdown(how)
+
+    def close(self):
+        """
+                Ends the session: from now on a resume only gets the bytes the player missed.
+        """
+        with self.changed:
+            if self.closed:
+                return
+            self.closed = True
+            self.changed.notify_all()
+        self.registry.finish(self.token)
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ResumableConnection:
+    """
+        The player side of a resumable session: a socket-like object that reconnects and resumes by itself.
+    """
+
+    def __init__(self, server_ip, server_tcp_port, timeout=None, grace=30.0, retry_interval=0.5):
+        """
+                Args:
+                    server_ip (str): The dealer's IP.
+                    server_tcp_port (int): The dealer's TCP port.
+                    timeout (float): Read timeout (None = forever). A timeout is not a drop, it is raised.
+                    grace (float): Seconds to keep trying to reconnect after a drop.
+                    retry_interval (float): Seconds between two reconnect attempts.
+        """
+        self.server_ip = server_ip
+        self.server_tcp_port = server_tcp_port
+        self.timeout = timeout
+        self.grace = grace
+        self.retry_interval = retry_interval
+        self.sock = None
+        self.token = None
+        self.sent = bytearray()
+        self.received = 0
+        self.resumes = 0
+
+    def connect(self, request):
+        """
+                Opens the session.
+
+                Args:
+                    request (bytes): The resumable request message (0x7).
+
+                Raises:
+                    OSError: If the dealer cannot be reached or does not answer with a token.
+        """
+        sock = socket.create_connection((self.server_ip, self.server_tcp_port), self.timeout)
+        try:
+            set_nodelay(sock)
+            sock.settimeout(self.timeout)
+            sock.sendall(request)
+            answer = self.read_session_message(sock)
+            if answer is None:
+                raise ConnectionResetError("The dealer closed the connection")
+            self.token = answer[0]
+        except BaseException:
+            sock.close()
+            raise
+        self.sock = sock
+
+    def read_session_message(self, sock):
+        """
+                Reads the dealer's 0x8 message.
+
+                Returns:
+                    tuple: (token, game bytes the dealer has received), or None if the dealer closed the connection
+                           instead (it does not know the session any more).
+        """
+        data = RecvBuffer(sock, SESSION_STRUCT.size).recv_exact(SESSION_STRUCT.size)
+        if data is None:
+            return None
+        cookie, msg_type, token, received = SESSION_STRUCT.unpack_from(data)
+        if cookie != MAGIC_COOKIE or msg_type != MSG_TYPE_SESSION:
+            raise ConnectionError(f"Expected a session message, got type {hex(msg_type)}")
+        return token, received
+
+    def reconnect(self):
+        """
+                Reconnects and resumes the session, resending the game bytes the dealer missed.
+
+                Returns:
+                    bool: True once resumed, False if the grace window ran out or the dealer refused.
+        """
+        if self.sock is not None:
+            self.sock.close()
+        deadline = time.monotonic() + self.grace
+        while time.monotonic() < deadline:
+            try:
+                sock = socket.create_connection((self.server_ip, self.server_tcp_port),
+                                                max(0.1, deadline - time.monotonic()))
+            except OSError:
+                time.sleep(self.retry_interval)
+                continue
+            try:
+                set_nodelay(sock)
+                sock.settimeout(max(0.1, deadline - time.monotonic()))
+                sock.sendall(session_message(MSG_TYPE_RESUME, self.token, self.received))
+                answer = self.read_session_message(sock)
+                if answer is None:
+                    sock.close()
+                    break  # The session is over on the dealer's side
+                token, dealer_received = answer
+                if token != self.token or dealer_received > len(self.sent):
+                    raise ConnectionError("The dealer answered for another session")
+                sock.sendall(self.sent[dealer_received:])
+                sock.settimeout(self.timeout)
+            except OSError:
+                sock.close()
+                time.sleep(self.retry_interval)
+                continue
+            self.sock = sock
+            self.resumes += 1
+            return True
+        self.sock = None
+        return False
+
+    def recv_into(self, view, n):
+        """
+                Reads like socket.recv_into, resuming the session if the connection dropped.
+
+                Returns:
+                    int: Number of bytes read (0 if the session could not be resumed).
+        """
+        while self.sock is not None:
+            try:
+                got = self.sock.recv_into(view, n)
+            except socket.timeout:
+                raise
+            except OSError:
+                got = 0
+            if got:
+                self.received += got
+                return got
+            if not self.reconnect():
+                return 0
+        return 0
+
+    def sendall(self, data):
+        """
+                Sends like socket.sendall, resuming the session if the connection dropped.
+
+                Raises:
+                    ConnectionResetError: If the session could not be resumed.
+        """
+        if self.sock is None:
+            raise ConnectionResetError("The session is over")
+        self.sent += data
+        try:
+            self.sock.sendall(data)
+        except socket.timeout:
+            raise
+        except OSError:
+            if not self.reconnect():  # The resume resends data
+                raise ConnectionResetError("The session could not be resumed")
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+        if self.sock is not None:
+            self.sock.settimeout(timeout)
+
+    def setsockopt(self, *args):
+        if self.sock is not None:
+            self.sock.setsockopt(*args)
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,189 @@
+import argparse
+
+import numpy as np
+
+from Cards import BLACKJACK, CARD_VALUES, DEALER_STAND_ON, SOFT_ACE_BONUS
+
+"""
+The Monte Carlo Simulator:
+Plays the exact rules of Dealer.play offline - deal player / dealer / player / dealer, the player hits until it
+stands or busts, the dealer hits below DEALER_STAND_ON (and on a soft 17 with hit_soft_17), an ace counts 11 while
+that does not bust the hand (like Cards.Hand), busts lose and equal totals tie.
+Instead of one round at a time over TCP, a whole batch of hands is played at once on NumPy arrays: every row is
+one hand dealt from its own freshly shuffled shoe.
+"""
+
+
+def threshold_strategy(stand_on=17):
+    """
+        Builds a strategy that hits below a fixed total, like the dealer does.
+
+        Args:
+            stand_on (int): The total on which the player stands.
+
+        Returns:
+            callable: A strategy for Simulator.
+    """
+    def strategy(player_totals, dealer_up_values, soft):
+        return player_totals < stand_on
+    return strategy
+
+
+def best_totals(hard, aces):
+    """
+        The Hand.total of many hands at once.
+
+        Args:
+            hard (np.ndarray): The hard totals (every ace as 1).
+            aces (np.ndarray): True where the hand holds an ace.
+
+        Returns:
+            np.ndarray: The totals, with an ace as 11 where that does not bust the hand.
+    """
+    return np.where(aces & (hard + SOFT_ACE_BONUS <= BLACKJACK), hard + SOFT_ACE_BONUS, hard)
+
+
+class Simulator:
+    """
+        Simulates millions of Blackjack rounds in batches of NumPy arrays.
+    """
+
+    def __init__(self, strategy=None, decks=1, seed=None, batch_size=100_000, hit_soft_17=False):
+        """
+                Initializes the Simulator.
+
+                Args:
+                    strategy (callable): The player's strategy hook. It gets two int arrays - the player totals
+                                         and the dealer's visible card values of the hands still playing - and a
+                                         bool array, True where the total is soft (like Strategy.decide), and
+                                         returns a bool array, True where the player hits.
+                                         Defaults to standing on 17 like the dealer.
+                    decks (int): Number of decks in the shoe every hand is dealt from.
+                    seed (int): Seed of the random generator (None = random).
+                    batch_size (int): Number of hands played together in one batch.
+                    hit_soft_17 (bool): The dealer hits a soft 17 (see Dealer).
+        """
+        self.strategy = strategy if strategy is not None else threshold_strategy(DEALER_STAND_ON)
+        self.batch_size = batch_size
+        self.hit_soft_17 = hit_soft_17
+        self.rng = np.random.default_rng(seed)
+        # The card values of one full shoe, shuffled per hand in every batch
+        self.shoe_values = np.tile(np.frombuffer(CARD_VALUES, dtype=np.uint8), decks).astype(np.int16)
+
+    def play_batch(self, hands):
+        """
+                Plays one batch of hands.
+
+                Args:
+                    hands (int): Number of hands in the batch.
+
+                Returns:
+                    dict: wins / losses / ties / player_busts / dealer_busts counts of the batch.
+        """
+        shoes = self.rng.permuted(np.broadcast_to(self.shoe_values, (hands, self.shoe_values.size)), axis=1)
+        rows = np.arange(hands)
+
+        # Initial deal: player, dealer (visible), player, dealer (hidden)
+        player_hard = shoes[:, 0] + shoes[:, 2]
+        player_aces = (shoes[:, 0] == 1) | (shoes[:, 2] == 1)
+        dealer_up = shoes[:, 1]
+        dealer_hard = dealer_up + shoes[:, 3]
+        dealer_aces = (dealer_up == 1) | (shoes[:, 3] == 1)
+        next_card = np.full(hands, 4)
+
+        # Player's turn: every hand still playing asks the strategy
+        playing = np.ones(hands, dtype=bool)
+        while playing.any():
+            idx = rows[playing]
+            totals = best_totals(player_hard[idx], player_aces[idx])
+            hits = np.asarray(self.strategy(totals, dealer_up[idx], totals != player_hard[idx]), dtype=bool)
+            idx = idx[hits]
+            cards = shoes[idx, next_card[idx]]
+            player_hard[idx] += cards
+            player_aces[idx] |= cards == 1
+            next_card[idx] += 1
+            playing[:] = False
+            playing[idx] = player_hard[idx] <= BLACKJACK
+
+        # Dealer's turn, only against players that did not bust
+        player_bust = player_hard > BLACKJACK
+        drawing = ~player_bust & self.dealer_hits(dealer_hard, dealer_aces)
+        while drawing.any():
+            idx = rows[drawing]
+            cards = shoes[idx, next_card[idx]]
+            dealer_hard[idx] += cards
+            dealer_aces[idx] |= cards == 1
+            next_card[idx] += 1
+            drawing[idx] = self.dealer_hits(dealer_hard[idx], dealer_aces[idx])
+
+        player_totals = best_totals(player_hard, player_aces)
+        dealer_totals = best_totals(dealer_hard, dealer_aces)
+
+        # Deciding winner (same order as Dealer.settle_round)
+        dealer_bust = ~player_bust & (dealer_hard > BLACKJACK)
+        standing = ~player_bust & ~dealer_bust
+        wins = dealer_bust | (standing & (player_totals > dealer_totals))
+        ties = standing & (player_totals == dealer_totals)
+
+        return {
+            "wins": int(wins.sum()),
+            "losses": int(hands - wins.sum() - ties.sum()),
+            "ties": int(ties.sum()),
+            "player_busts": int(player_bust.sum()),
+            "dealer_busts": int(dealer_bust.sum()),
+        }
+
+    def dealer_hits(self, hard, aces):
+        """
+                Dealer.dealer_hits for many hands at once.
+
+                Returns:
+                    np.ndarray: True where the dealer takes another card.
+        """
+        totals = best_totals(hard, aces)
+        hits = totals < DEALER_STAND_ON
+        if self.hit_soft_17:
+            hits |= (totals == DEALER_STAND_ON) & (totals != hard)  # Soft: an ace counts 11
+        return hits
+
+    def simulate(self, hands):
+        """
+                Plays the given number of hands in batches and sums the results.
+
+                Args:
+                    hands (int): Total number of hands to play.
+
+                Returns:
+                    dict: The counts of play_batch plus "hands", "win_rate" and "house_edge"
+                          (the dealer's expected gain per unit bet, with wins paying 1:1).
+        """
+        totals = {"wins": 0, "losses": 0, "ties": 0, "player_busts": 0, "dealer_busts": 0}
+        remaining = hands
+        while remaining > 0:
+            batch = min(remaining, self.batch_size)
+            for key, value in self.play_batch(batch).items():
+                totals[key] += value
+            remaining -= batch
+
+        totals["hands"] = hands
+        totals["win_rate"] = totals["wins"] / hands if hands > 0 else 0
+        totals["house_edge"] = (totals["losses"] - totals["wins"]) / hands if hands > 0 else 0
+        return totals
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Monte Carlo simulation of the dealer's Blackjack rules.")
+    parser.add_argument("--hands", type=int, default=1_000_000, help="number of hands to simulate")
+    parser.add_argument("--stand-on", type=int, default=DEALER_STAND_ON, help="player stands on this total")
+    parser.add_argument("--decks", type=int, default=1, help="decks in the shoe")
+    parser.add_argument("--seed", type=int, default=None, help="random seed")
+    parser.add_argument("--hit-soft-17", action="store_true", help="the dealer hits a soft 17")
+    args = parser.parse_args()
+
+    simulator = Simulator(threshold_strategy(args.stand_on), args.decks, args.seed, hit_soft_17=args.hit_soft_17)
+    results = simulator.simulate(args.hands)
+    print(f"Hands: {results['hands']}")
+    print(f"Wins: {results['wins']}, Losses: {results['losses']}, Ties: {results['ties']}")
+    print(f"Player busts: {results['player_busts']}, Dealer busts: {results['dealer_busts']}")
+    print(f"Win rate: {results['win_rate']:.4f}")
+    print(f"House edge: {results['house_edge']:.4f}")
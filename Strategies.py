@@ -0,0 +1,173 @@
+import random
+
+"""
+Player strategies:
+Decide Hit or Stand without a human at the keyboard, so Player can run headless at full speed.
+Every strategy gets the player's current total (an ace counts 11 while that does not bust the hand, see Cards.Hand),
+the value of the dealer's visible card (an ace as 1) and whether the total is soft, and returns True to hit.
+"""
+
+
+class Strategy:
+    """
+        Base class of the player strategies - always stands.
+    """
+
+    name = "stand"
+
+    def decide(self, player_total, dealer_up_value, soft=False):
+        """
+                Decides the next move.
+
+                Args:
+                    player_total (int): The player's current total.
+                    dealer_up_value (int): The value of the dealer's visible card (1-10).
+                    soft (bool): True if an ace counts 11 in the total.
+
+                Returns:
+                    bool: True to hit, False to stand.
+        """
+        return False
+
+
+class ThresholdStrategy(Strategy):
+    """
+        Hits below a fixed total, like the dealer does.
+    """
+
+    name = "threshold"
+
+    def __init__(self, stand_on=17):
+        """
+                Args:
+                    stand_on (int): The total on which the player stands.
+        """
+        self.stand_on = stand_on
+
+    def decide(self, player_total, dealer_up_value, soft=False):
+        return player_total < self.stand_on
+
+
+class RandomStrategy(Strategy):
+    """
+        Hits with a fixed probability (until 21).
+    """
+
+    name = "random"
+
+    def __init__(self, hit_probability=0.5, seed=None):
+        """
+                Args:
+                    hit_probability (float): Chance to hit on every decision.
+                    seed (int): Seed of the strategy's own random generator (None = random).
+        """
+        self.hit_probability = hit_probability
+        self.rng = random.Random(seed)
+
+    def decide(self, player_total, dealer_up_value, soft=False):
+        return player_total < 21 and self.rng.random() < self.hit_probability
+
+
+class BasicStrategy(Strategy):
+    """
+        The classic hard-total basic strategy table:
+        - 11 or less: hit
+        - 12: stand against 4-6, otherwise hit
+        - 13-16: stand against 2-6, otherwise hit
+        - 17 or more: stand
+        The dealer's ace counts 1 here and is played like a strong card.
+    """
+
+    name = "basic"
+
+    def __init__(self):
+        # HIT_TABLE[player_total][dealer_up_value] - built once, O(1) per decision
+        self.hit_table = [[self.table_entry(total, up) for up in range(11)] for total in range(32)]
+
+    @staticmethod
+    def table_entry(player_total, dealer_up_value):
+        """
+                Computes one cell of the table.
+
+                Returns:
+                    bool: True to hit.
+        """
+        if player_total <= 11:
+            return True
+        if player_total == 12:
+            return not 4 <= dealer_up_value <= 6
+        if player_total <= 16:
+            return not 2 <= dealer_up_value <= 6
+        return False
+
+    def decide(self, player_total, dealer_up_value, soft=False):
+        return self.hit_table[player_total][dealer_up_value]
+
+
+class CallableStrategy(Strategy):
+    """
+        Wraps a user-supplied function f(player_total, dealer_up_value) -> bool.
+    """
+
+    name = "callable"
+
+    def __init__(self, func):
+        """
+                Args:
+                    func (callable): Returns True to hit.
+        """
+        self.func = func
+
+    def decide(self, player_total, dealer_up_value, soft=False):
+        return bool(self.func(player_total, dealer_up_value))
+
+
+class TableStrategy(Strategy):
+    """
+        Plays the EV-optimal move of the exact strategy tables (see StrategyTables), hard and soft totals apart.
+        The tables are computed on first use and cached on disk.
+    """
+
+    name = "optimal"
+
+    def __init__(self, decks=1, hit_soft_17=False, tables=None):
+        """
+                Args:
+                    decks (int): Number of decks the dealer plays with.
+                    hit_soft_17 (bool): The dealer hits a soft 17.
+                    tables (StrategyTables): Tables to play by (if None, they are loaded for the rules above).
+        """
+        if tables is None:
+            from StrategyTables import StrategyTables  # Only bots that play by the tables pay for loading them
+            tables = StrategyTables.load(decks, hit_soft_17)
+        self.hit_table = tables.hit  # [soft][player_total][dealer_up_value] - O(1) per decision
+
+    def decide(self, player_total, dealer_up_value, soft=False):
+        return self.hit_table[soft][player_total][dealer_up_value]
+
+
+# The strategies that can be picked by name (e.g. from the command line)
+STRATEGIES = {
+    "basic": BasicStrategy,
+    "optimal": TableStrategy,
+    "threshold": ThresholdStrategy,
+    "random": RandomStrategy,
+    "stand": Strategy,
+}
+
+
+def make_strategy(name, decks=1, hit_soft_17=False):
+    """
+        Builds a strategy by name for the dealer's rules (only "optimal" depends on them).
+
+        Args:
+            name (str): A key of STRATEGIES.
+            decks (int): Number of decks the dealer plays with.
+            hit_soft_17 (bool): The dealer hits a soft 17.
+
+        Returns:
+            Strategy: The strategy.
+    """
+    if STRATEGIES[name] is TableStrategy:
+        return TableStrategy(decks, hit_soft_17)
+    return STRATEGIES[name]()
@@ -0,0 +1,340 @@
+import argparse
+import json
+import math
+import os
+import threading
+
+from Cards import BLACKJACK, DEALER_STAND_ON, SOFT_ACE_BONUS
+
+"""
+Exact strategy tables:
+For the rules Dealer.play implements (hit or stand only, the dealer hits below 17 - and a soft 17 with
+hit_soft_17 - busts lose, equal totals tie, wins pay 1:1) this computes, by exact recursion over the composition
+of the shoe:
+- the distribution of the dealer's final total for every up card, and
+- the expected value of standing and of hitting (and playing on optimally) for every player hand.
+The player's hands are then folded into tables by total (hard / soft) and up card, every hand weighted by how
+likely its cards are to be dealt, so a bot gets the EV-optimal decision with one lookup. Computing takes
+seconds to a minute, so the tables are cached on disk per ruleset.
+"""
+
+CACHE_VERSION = 1
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "blackjack")
+# Dealer final totals in the distribution: 17, 18, 19, 20, 21 and bust
+OUTCOMES = (17, 18, 19, 20, 21, "bust")
+BUST = len(OUTCOMES) - 1
+MAX_TOTAL = 32  # Table rows, like BasicStrategy
+
+_loaded = {}  # (decks, hit_soft_17) -> StrategyTables already loaded by this process
+_loading = threading.Lock()  # One thread loads (or computes) a ruleset, the others wait for it
+
+
+def shoe_counts(decks):
+    """
+        Args:
+            decks (int): Number of decks in the shoe.
+
+        Returns:
+            list: Number of cards of every value in a full shoe (index 1 = aces, 10 = tens and faces).
+    """
+    return [0] + [4 * decks] * 9 + [16 * decks]
+
+
+def best_total(hard, aces):
+    # Cards.Hand.total from a hard total and whether there is an ace
+    return hard + SOFT_ACE_BONUS if aces and hard + SOFT_ACE_BONUS <= BLACKJACK else hard
+
+
+class StrategyTables:
+    """
+        The dealer's outcome distributions and the EV-optimal hit / stand tables of one ruleset.
+    """
+
+    def __init__(self, decks=1, hit_soft_17=False):
+        """
+                Initializes empty tables - call `compute` (or use `load`).
+
+                Args:
+                    decks (int): Number of decks in the shoe.
+                    hit_soft_17 (bool): The dealer hits a soft 17.
+        """
+        self.decks = decks
+        self.hit_soft_17 = hit_soft_17
+        # up card value -> probabilities of OUTCOMES
+        self.dealer = {}
+        # [soft][total][up card value] - True to hit / EV of standing / EV of hitting (None where never reached)
+        self.hit = [[[False] * 11 for _ in range(MAX_TOTAL)] for _ in range(2)]
+        self.ev_stand = [[[None] * 11 for _ in range(MAX_TOTAL)] for _ in range(2)]
+        self.ev_hit = [[[None] * 11 for _ in range(MAX_TOTAL)] for _ in range(2)]
+
+    @classmethod
+    def load(cls, decks=1, hit_soft_17=False, cache_dir=DEFAULT_CACHE_DIR):
+        """
+                Returns the tables of a ruleset: once loaded they are kept for the whole process, otherwise they
+                come from the disk cache, or are computed (and cached) if needed.
+
+                Args:
+                    decks (int): Number of decks in the shoe.
+                    hit_soft_17 (bool): The dealer hits a soft 17.
+                    cache_dir (str): Where the tables are cached (None = do not cache).
+
+                Returns:
+                    StrategyTables: The tables.
+        """
+        with _loading:
+            tables = _loaded.get((decks, hit_soft_17))
+            if tables is None:
+                tables = cls.load_uncached(decks, hit_soft_17, cache_dir)
+                _loaded[decks, hit_soft_17] = tables
+            return tables
+
+    @classmethod
+    def load_uncached(cls, decks, hit_soft_17, cache_dir):
+        tables = cls(decks, hit_soft_17)
+        path = tables.cache_path(cache_dir) if cache_dir else None
+        if path and os.path.exists(path):
+            try:
+                with open(path) as cache_file:
+                    if tables.from_dict(json.load(cache_file)):
+                        return tables
+            except (OSError, ValueError, KeyError, TypeError):
+                pass  # A broken or old cache is computed again
+        tables.compute()
+        if path:
+            tables.save(path)
+        return tables
+
+    def cache_path(self, cache_dir):
+        rule = "h17" if self.hit_soft_17 else "s17"
+        return os.path.join(cache_dir, f"strategy-{self.decks}d-{rule}-v{CACHE_VERSION}.json")
+
+    def save(self, path):
+        """
+                Writes the tables to a JSON file (atomically, so readers never see half a file).
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, 'w') as cache_file:
+            json.dump(self.to_dict(), cache_file)
+        os.replace(temporary, path)
+
+    def to_dict(self):
+        return {
+            "version": CACHE_VERSION,
+            "decks": self.decks,
+            "hit_soft_17": self.hit_soft_17,
+            "dealer": {str(up): list(probabilities) for up, probabilities in self.dealer.items()},
+            "hit": self.hit,
+            "ev_stand": self.ev_stand,
+            "ev_hit": self.ev_hit,
+        }
+
+    def from_dict(self, data):
+        """
+                Loads tables written by `to_dict`.
+
+                Returns:
+                    bool: False if they are of another version or ruleset.
+        """
+        if (data["version"], data["decks"], data["hit_soft_17"]) != (CACHE_VERSION, self.decks, self.hit_soft_17):
+            return False
+        self.dealer = {int(up): tuple(probabilities) for up, probabilities in data["dealer"].items()}
+        self.hit = data["hit"]
+        self.ev_stand = data["ev_stand"]
+        self.ev_hit = data["ev_hit"]
+        return True
+
+    def dealer_hits(self, hard, aces):
+        # Dealer.dealer_hits from a hard total and whether there is an ace
+        total = best_total(hard, aces)
+        return total < DEALER_STAND_ON or (self.hit_soft_17 and total == DEALER_STAND_ON and total != hard)
+
+    def dealer_outcomes(self, counts, left, hard, aces, memo):
+        """
+                The distribution of the dealer's final total from a hand, drawing from the shoe.
+
+                Args:
+                    counts (list): Cards left by value (changed during the recursion, restored on return).
+                    left (int): Cards left in all.
+                    hard (int): The dealer's hard total.
+                    aces (bool): True if the dealer holds an ace.
+                    memo (dict): Results by dealer hand and shoe composition - shared by every dealer hand drawn
+                                 from the same shoe (the same cards left can follow different hands).
+
+                Returns:
+                    tuple: Probabilities of OUTCOMES.
+        """
+        if hard > BLACKJACK:
+            return 0.0, 0.0, 0.0, 0.0, 0.0, 1.0
+        if not self.dealer_hits(hard, aces):
+            outcome = [0.0] * len(OUTCOMES)
+            outcome[best_total(hard, aces) - DEALER_STAND_ON] = 1.0
+            return tuple(outcome)
+        key = (hard, aces, *counts)
+        cached = memo.get(key)
+        if cached is not None:
+            return cached
+        distribution = [0.0] * len(OUTCOMES)
+        for value in range(1, 11):
+            count = counts[value]
+            if not count:
+                continue
+            chance = count / left
+            counts[value] -= 1
+            sub = self.dealer_outcomes(counts, left - 1, hard + value, aces or value == 1, memo)
+            counts[value] += 1
+            for index in range(len(OUTCOMES)):
+                distribution[index] += chance * sub[index]
+        result = tuple(distribution)
+        memo[key] = result
+        return result
+
+    def stand_ev(self, counts, left, player_total, up, dealer_memo):
+        """
+                Expected value of standing on a total, the dealer drawing (hole card included) from the shoe.
+                dealer_memo is the memo of dealer_outcomes, kept over every call for the same up card.
+        """
+        distribution = self.dealer_outcomes(counts, left, up, up == 1, dealer_memo)
+        ev = distribution[BUST]
+        for index, dealer_total in enumerate(OUTCOMES[:BUST]):
+            if player_total > dealer_total:
+                ev += distribution[index]
+            elif player_total < dealer_total:
+                ev -= distribution[index]
+        return ev
+
+    def player_ev(self, counts, left, hand, hard, up, memo, dealer_memo):
+        """
+                EVs of a player hand, playing on optimally after a hit.
+
+                Args:
+                    counts (list): Cards left by value (changed during the recursion, restored on return).
+                    left (int): Cards left in all.
+                    hand (tuple): The player's cards, as counts by value.
+                    hard (int): The player's hard total.
+                    up (int): The dealer's up card value.
+                    memo (dict): Results by hand.
+                    dealer_memo (dict): The memo of dealer_outcomes for the up card.
+
+                Returns:
+                    tuple: (EV of standing, EV of hitting).
+        """
+        cached = memo.get(hand)
+        if cached is not None:
+            return cached
+        aces = hand[1] > 0
+        stand = self.stand_ev(counts, left, best_total(hard, aces), up, dealer_memo)
+        hit = 0.0
+        for value in range(1, 11):
+            count = counts[value]
+            if not count:
+                continue
+            chance = count / left
+            if hard + value > BLACKJACK:
+                hit -= chance
+                continue
+            counts[value] -= 1
+            bigger = hand[:value] + (hand[value] + 1,) + hand[value + 1:]
+            hit += chance * max(self.player_ev(counts, left - 1, bigger, hard + value, up, memo, dealer_memo))
+            counts[value] += 1
+        memo[hand] = stand, hit
+        return stand, hit
+
+    def compute(self):
+        """
+                Computes the dealer distributions and the player tables.
+        """
+        counts = shoe_counts(self.decks)
+        for up in range(1, 11):
+            counts[up] -= 1
+            left = sum(counts)
+            dealer_memo = {}  # Dropped with the up card, it only grows while one is computed
+            self.dealer[up] = self.dealer_outcomes(counts, left, up, up == 1, dealer_memo)
+
+            # Every player hand of two or more cards that has not busted, folded into its (soft, total) cell
+            memo = {}
+            for first in range(1, 11):
+                for second in range(first, 11):
+                    hand = tuple(2 if value == first == second else int(value in (first, second))
+                                 for value in range(11))
+                    if all(hand[value] <= counts[value] for value in range(1, 11)):
+                        for value in range(1, 11):
+                            counts[value] -= hand[value]
+                        self.player_ev(counts, left - 2, hand, first + second, up, memo, dealer_memo)
+                        for value in range(1, 11):
+                            counts[value] += hand[value]
+            self.fold(memo, counts, left, up)
+            counts[up] += 1
+
+    def fold(self, memo, counts, left, up):
+        """
+                Turns the EVs of every hand into the table cells of the up card, each hand weighted by the
+                chance of being dealt its cards.
+        """
+        weights = {}
+        for hand, (stand, hit) in memo.items():
+            drawn = sum(hand)
+            weight = math.prod(math.comb(counts[value], hand[value]) for value in range(1, 11))
+            weight /= math.comb(left, drawn)
+            hard = sum(value * hand[value] for value in range(1, 11))
+            total = best_total(hard, hand[1] > 0)
+            cell = int(total != hard), total
+            sums = weights.setdefault(cell, [0.0, 0.0, 0.0])
+            sums[0] += weight
+            sums[1] += weight * stand
+            sums[2] += weight * hit
+        for (soft, total), (weight, stand, hit) in weights.items():
+            self.ev_stand[soft][total][up] = stand / weight
+            self.ev_hit[soft][total][up] = hit / weight
+            self.hit[soft][total][up] = hit > stand
+
+    def should_hit(self, total, soft, up):
+        """
+                The EV-optimal move - one lookup.
+
+                Args:
+                    total (int): The player's total.
+                    soft (bool): True if an ace counts 11 in it.
+                    up (int): The dealer's up card value (1-10, ace = 1).
+
+                Returns:
+                    bool: True to hit.
+        """
+        return self.hit[soft][total][up]
+
+    def dealer_distribution(self, up):
+        """
+                Args:
+                    up (int): The dealer's up card value (1-10, ace = 1).
+
+                Returns:
+                    dict: Probability of every final dealer total (17-21) and of "bust".
+        """
+        return dict(zip(OUTCOMES, self.dealer[up]))
+
+    def print_tables(self):
+        """
+                Prints the dealer distributions and the decision tables (H = hit, S = stand).
+        """
+        ups = list(range(2, 11)) + [1]
+        header = "".join(f"{'A' if up == 1 else up:>6}" for up in ups)
+        print(f"Dealer final totals ({self.decks} deck(s), {'H17' if self.hit_soft_17 else 'S17'})")
+        print(f"{'up':>6}" + "".join(f"{str(outcome):>8}" for outcome in OUTCOMES))
+        for up in ups:
+            print(f"{'A' if up == 1 else up:>6}" + "".join(f"{p:8.4f}" for p in self.dealer[up]))
+        for soft, name, totals in ((0, "Hard", range(4, 22)), (1, "Soft", range(12, 22))):
+            print(f"\n{name} totals{header}")
+            for total in totals:
+                row = ("-" if self.ev_stand[soft][total][up] is None else "H" if self.hit[soft][total][up] else "S"
+                       for up in ups)
+                print(f"{total:>11}" + "".join(f"{cell:>6}" for cell in row))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compute (or load) the exact strategy tables of a ruleset.")
+    parser.add_argument("--decks", type=int, default=1, help="decks in the shoe")
+    parser.add_argument("--hit-soft-17", action="store_true", help="the dealer hits a soft 17")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="where the tables are cached")
+    args = parser.parse_args()
+
+    StrategyTables.load(args.decks, args.hit_soft_17, args.cache_dir).print_tables()
@@ -0,0 +1,325 @@
+import threading
+import time
+from functools import partial
+
+from Cards import Hand, NO_CARD
+from Protocol import FrameBuffer
+from Timers import shutdown_reads
+
+"""
+Multi-seat tables:
+Instead of a private dealer hand and shoe for every connection, the players are seated at tables of up to N seats
+(players of the same pace together). A table deals every round from one shoe to all its seats, plays their turns
+one after the other like a real table - every seat with its own decision deadline, a seat that does not answer in
+time stands and leaves after the round without holding up the others - and then plays a single dealer hand for all
+of them. Players join and leave between rounds; a table closes when its last seat leaves.
+The wire protocol does not change: every player still gets its own cards, the dealer's up card, and then the
+dealer's turn and its result, exactly as in Dealer.play.
+"""
+
+
+class Seat:
+    """
+        One player at a table, for the rounds it asked for.
+    """
+
+    def __init__(self, conn, inbox, team, rounds, history_session=None):
+        """
+                Args:
+                    conn (socket.socket): The player's connection (or a socket-like session).
+                    inbox (RecvBuffer): The connection's receive buffer.
+                    team (str): The team name.
+                    rounds (int): Number of rounds requested.
+                    history_session (tuple): The session handle of the history log (None = no history).
+        """
+        self.conn = conn
+        self.inbox = inbox
+        self.team = team
+        self.rounds = rounds
+        self.history_session = history_session
+        self.out = FrameBuffer(conn)
+        self.wake = partial(shutdown_reads, conn)  # Cuts a decision short at its deadline
+        self.session_end = None
+        self.timed_out = False  # It stood for running out of time, it leaves after this round
+        self.statistics = {"wins": 0, "losses": 0, "ties": 0}
+        self.played = 0
+        self.hand = None
+        self.done = threading.Event()  # Set when the seat leaves the table (finished or evicted)
+
+
+class Table:
+    """
+        A table with up to `seats` players sharing one shoe and one dealer hand per round, run by its own thread.
+    """
+
+    def __init__(self, dealer, lobby, seats, delay=1.0, seat_timeout=10.0):
+        """
+                Args:
+                    dealer (Dealer): The dealer whose rules, logging, metrics and history the table uses.
+                    lobby (TableLobby): The lobby that seats the players (and owns the lock).
+                    seats (int): The most players at the table.
+                    delay (float): Seconds to pause before each round and before the dealer's turn.
+                    seat_timeout (float): Seconds a seat has for every decision before it stands and leaves.
+        """
+        self.dealer = dealer
+        self.lobby = lobby
+        self.seats = seats
+        self.delay = delay
+        self.seat_timeout = seat_timeout
+        self.seated = []  # Playing, in turn order
+        self.joining = []  # Seated from the next round on
+        self.shoe, self.seed = dealer.new_shoe()
+        self.thread = None
+
+    def free_seats(self):
+        # Called with the lobby's lock held
+        return self.seats - len(self.seated) - len(self.joining)
+
+    def join(self, seat):
+        """
+                Takes a seat for the next round, starting the table if it is not running. Called with the lobby's
+                lock held.
+        """
+        self.joining.append(seat)
+        if self.thread is None:
+            self.dealer.log.debug("table_open", "Table {table:x} opened with a shoe with seed {seed}", table=id(self),
+                                  seed=self.seed)
+            self.thread = threading.Thread(target=self.run, name=f"Table {id(self):x}")
+            self.thread.daemon = True
+            self.thread.start()
+
+    def run(self):
+        """
+                The table's thread: plays rounds while anyone is seated, then closes the table.
+        """
+        while True:
+            if self.delay:
+                time.sleep(self.delay)
+            with self.lobby.lock:
+                self.seated = [seat for seat in self.seated if not seat.done.is_set()] + self.joining
+                self.joining = []
+                if not self.seated:
+                    self.lobby.close(self)
+                    return
+                seats = list(self.seated)
+            try:
+                self.play_round(seats)
+            except Exception as e:
+                self.dealer.log.error("table_error", "Error at a table: {error}", error=str(e))
+                for seat in seats:
+                    self.leave(seat)
+
+    def leave(self, seat):
+        """
+                Frees a seat and wakes its player's handler (the handler closes the connection).
+        """
+        seat.done.set()
+
+    def send(self, seat):
+        """
+                Sends the seat's collected payloads.
+
+                Returns:
+                    bool: False if the connection is gone (the seat is freed).
+        """
+        try:
+            self.dealer.metrics.bytes_sent.inc(seat.out.flush())
+            return True
+        except OSError as e:
+            self.dealer.log.info("connection_lost", "Connection lost with {team}: {error}. Freeing the seat.",
+                                 team=seat.team, error=str(e))
+            self.leave(seat)
+            return False
+
+    def play_turn(self, seat):
+        """
+                Plays one seat's turn: reads its moves, dealing a card on every hit, until it stands or busts.
+
+                Returns:
+                    bool: False if the seat was evicted (connection lost or protocol violation). A seat that does not
+                          answer in time stands (and leaves after the round).
+        """
+        dealer = self.dealer
+        metrics = dealer.metrics
+        perf_counter = time.perf_counter
+        while True:
+            wait_start = perf_counter()
+            try:
+                move = dealer.read_timed_decision(seat.inbox, seat.team, seat.wake, seat.session_end,
+                                                  self.seat_timeout)
+            except Exception as e:
+                dealer.log.error("turn_error", "Error during {team}'s turn: {error}", team=seat.team, error=str(e))
+                move = None
+            if move is None:
+                self.leave(seat)
+                return False
+            metrics.decision_wait.observe(perf_counter() - wait_start)
+            if move == "Timeout":
+                seat.timed_out = True
+                return True
+            if move == "Stand":
+                dealer.log.debug("decision", "{team} decision: Stand", team=seat.team, move="Stand")
+                return True
+            new_card = self.shoe.deal_one()
+            total = seat.hand.add(new_card)
+            seat.out.add_card(0x0, new_card)
+            dealer.log.debug("decision", "{team} decision: Hittt\n{team} received: {card}\n{team} total: {total}",
+                             team=seat.team, move="Hittt", card=new_card, total=total)
+            if not self.send(seat):
+                return False
+            if seat.hand.is_bust():
+                return True
+
+    def play_round(self, seats):
+        """
+                Plays one round for every seat: the deal, the seats' turns in order, one dealer turn and the results.
+
+                Args:
+                    seats (list): The seats of the round, in turn order.
+        """
+        dealer = self.dealer
+        perf_counter = time.perf_counter
+        round_start = perf_counter()
+        if self.shoe.discards_shuffled:  # Reset by start_round
+            dealer.log.debug("shuffle", "The shoe of the table ran out during the last round, its discards were "
+                                        "reshuffled")
+        if self.shoe.start_round():
+            dealer.log.debug("shuffle", "Cut card reached, shuffling the shoe of the table")
+
+        # Deal like a real table: one card to every seat, the up card, a second card to every seat, the hole card
+        dealer_hand = Hand()
+        for seat in seats:
+            seat.hand = Hand()
+            seat.hand.add(self.shoe.deal_one())
+        dealer_hand.add(self.shoe.deal_one())  # The players will see it
+        for seat in seats:
+            seat.hand.add(self.shoe.deal_one())
+        dealer_hand.add(self.shoe.deal_one())  # The players cannot see it
+
+        playing = []
+        for seat in seats:
+            seat.out.add_card(0x0, seat.hand[0])
+            seat.out.add_card(0x0, seat.hand[1])
+            seat.out.add_card(0x0, dealer_hand[0])
+            if self.send(seat):
+                playing.append(seat)
+        compute = perf_counter() - round_start
+
+        # The seats' turns; the time spent waiting for their decisions is not the dealer's work
+        turns_start = perf_counter()
+        playing = [seat for seat in playing if self.play_turn(seat)]
+        turns_time = perf_counter() - turns_start
+        if not playing:
+            return
+
+        if self.delay:
+            time.sleep(self.delay)
+        turn_start = perf_counter()
+        # One dealer turn for the whole table - the dealer does not draw when every seat busted
+        if any(not seat.hand.is_bust() for seat in playing):
+            while dealer.dealer_hits(dealer_hand):
+                new_card = self.shoe.deal_one()
+                dealer_hand.add(new_card)
+                dealer.log.debug("dealer_card", "Dealer of the table received: {card}\nDealer total: {total}",
+                                 card=new_card, total=dealer_hand.total)
+        dealer_total = dealer_hand.total
+
+        for seat in playing:
+            self.settle(seat, dealer_hand, dealer_total)
+        turn_time = perf_counter() - turn_start
+
+        # Every seat's round, with its share of the dealer's work
+        share = (compute + turn_time) / len(playing)
+        for _ in playing:
+            dealer.record_round(compute + turns_time + turn_time, share)
+
+    def settle(self, seat, dealer_hand, dealer_total):
+        """
+                Sends a seat the dealer's turn (unless it busted) and its result, and frees the seat after its last
+                round.
+        """
+        dealer = self.dealer
+        player_total = seat.hand.total
+        seat.played += 1
+        if seat.hand.is_bust():
+            dealer.log.info("round_result", "{team} busts! Dealer wins this round", team=seat.team, result="loss",
+                            reason="player_bust", player_total=player_total)
+            seat.statistics["losses"] += 1
+            result = 0x2
+        else:
+            for card in dealer_hand[1:]:
+                seat.out.add_card(0x0, card)
+            result = dealer.settle_round(seat.team, player_total, dealer_total, seat.statistics)
+        seat.out.add_card(result, NO_CARD)
+        if not self.send(seat):
+            return
+        dealer.record_history(seat.history_session, seat.played, seat.hand, dealer_hand, player_total, dealer_total,
+                              result)
+        if seat.timed_out:
+            self.leave(seat)
+        elif seat.played >= seat.rounds:
+            statistics = seat.statistics
+            total_played = statistics["wins"] + statistics["losses"] + statistics["ties"]
+            win_rate = statistics["wins"] / total_played if total_played > 0 else 0
+            dealer.log.info("session_end", "\n{team} - All rounds finished\n{team} finished {rounds} rounds, "
+                                           "win rate: {win_rate:.2f}", team=seat.team, rounds=total_played,
+                            win_rate=win_rate, **statistics)
+            self.leave(seat)
+
+
+class TableLobby:
+    """
+        Seats the dealer's players at tables, opening a table when every table of their pace is full.
+    """
+
+    def __init__(self, dealer, seats=7, seat_timeout=10.0):
+        """
+                Args:
+                    dealer (Dealer): The dealer the tables play for.
+                    seats (int): Seats at every table.
+                    seat_timeout (float): Seconds a seat has for every decision before it stands and leaves.
+        """
+        self.dealer = dealer
+        self.seats = seats
+        self.seat_timeout = seat_timeout
+        self.tables = []
+        self.lock = threading.Lock()
+
+    def play(self, conn, inbox, rounds, team, delay=1.0):
+        """
+                Seats a player and waits until it leaves its table.
+                Takes the place of Dealer.play for a session.
+
+                Args:
+                    conn (socket.socket): The player's connection.
+                    inbox (RecvBuffer): The connection's receive buffer.
+                    rounds (int): Number of rounds requested.
+                    team (str): The team name.
+                    delay (float): The player's pace - it is seated with players of the same pace.
+
+                Returns:
+                    dict: The statistics of the rounds that were completed.
+        """
+        history_session = self.dealer.start_history(team)  # The shoe is the table's, not the session's
+        seat = Seat(conn, inbox, team, rounds, history_session)
+        seat.session_end = self.dealer.deadlines.session_end()
+        if rounds <= 0:
+            return seat.statistics
+        with self.lock:
+            table = next((table for table in self.tables if table.delay == delay and table.free_seats() > 0), None)
+            if table is None:
+                table = Table(self.dealer, self, self.seats, delay, self.seat_timeout)
+                self.tables.append(table)
+                self.dealer.metrics.tables_open.set(len(self.tables))
+            table.join(seat)
+        self.dealer.log.debug("seated", "{team} seated at table {table:x}", team=team, table=id(table))
+        # The handler thread idles here while the table plays: it still owns the connection and reports the stats
+        seat.done.wait()
+        return seat.statistics
+
+    def close(self, table):
+        """
+                Drops a table whose last seat left. Called with the lock held.
+        """
+        self.tables.remove(table)
+        self.dealer.metrics.tables_open.set(len(self.tables))
@@ -0,0 +1,194 @@
+import heapq
+import itertools
+import socket
+import threading
+import time
+
+"""
+Timers:
+Every deadline of a dealer - a new connection's request, every decision of a turn, a whole session - is kept in one
+heap run by a single thread, instead of a timeout on every blocked socket. When a deadline passes, the thread shuts
+the player's connection for reading: the session's reader wakes up at once with nothing read, settles what it must
+and lets the thread (and the shoe) go. A decision that comes in time cancels its deadline, which costs a heap entry
+and no system call.
+"""
+
+
+class Timer:
+    """
+        One deadline in a TimerHeap.
+    """
+
+    __slots__ = ("heap", "when", "callback", "cancelled", "fired")
+
+    def __init__(self, heap, when, callback):
+        self.heap = heap
+        self.when = when
+        self.callback = callback
+        self.cancelled = False
+        self.fired = False  # Set before the callback runs, so a woken reader can tell a deadline from a lost player
+
+    def cancel(self):
+        self.heap.cancel(self)
+
+
+class TimerHeap:
+    """
+        Runs callbacks at their deadlines (time.monotonic) on one thread, started with the first timer.
+        Cancelled timers stay in the heap until they come up, or until they are most of it.
+    """
+
+    def __init__(self, name="Timers"):
+        self.name = name
+        self.heap = []  # (when, sequence, Timer)
+        self.sequence = itertools.count()
+        self.cancelled = 0
+        self.changed = threading.Condition()
+        self.thread = None
+
+    def call_at(self, when, callback):
+        """
+                Schedules a callback.
+
+                Args:
+                    when (float): The deadline, in time.monotonic() seconds.
+                    callback (callable): Called with no arguments on the timer thread - it must not block.
+
+                Returns:
+                    Timer: The timer, to cancel it.
+        """
+        timer = Timer(self, when, callback)
+        with self.changed:
+            heapq.heappush(self.heap, (when, next(self.sequence), timer))
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name=self.name)
+                self.thread.daemon = True
+                self.thread.start()
+            elif self.heap[0][2] is timer:
+                self.changed.notify()  # A new earliest deadline
+        return timer
+
+    def call_later(self, delay, callback):
+        return self.call_at(time.monotonic() + delay, callback)
+
+    def cancel(self, timer):
+        """
+                Cancels a timer (nothing happens if it already fired).
+        """
+        with self.changed:
+            if timer.cancelled or timer.fired:
+                return
+            timer.cancelled = True
+            self.cancelled += 1
+            if self.cancelled > 64 and self.cancelled * 2 > len(self.heap):
+                self.heap = [entry for entry in self.heap if not entry[2].cancelled]
+                heapq.heapify(self.heap)
+                self.cancelled = 0
+
+    def pending(self):
+        """
+                Returns:
+                    int: Timers waiting to fire.
+        """
+        with self.changed:
+            return len(self.heap) - self.cancelled
+
+    def run(self):
+        """
+                The timer thread: fires every timer at its deadline.
+        """
+        while True:
+            with self.changed:
+                heap = self.heap  # Replaced when cancelled timers are dropped
+                while heap and heap[0][2].cancelled:
+                    heapq.heappop(heap)
+                    self.cancelled -= 1
+                if not heap:
+                    self.changed.wait()
+                    continue
+                delay = heap[0][0] - time.monotonic()
+                if delay > 0:
+                    self.changed.wait(delay)
+                    continue
+                timer = heapq.heappop(heap)[2]
+                timer.fired = True
+            try:
+                timer.callback()
+            except Exception:
+                pass  # One failing callback must not stop every other deadline
+
+
+def shutdown_reads(conn):
+    """
+        Wakes the reader of a connection for good: its reads return nothing from now on, its writes still work
+        (so a player that timed out still gets the result of its last round).
+
+        Args:
+            conn: A socket, or a socket-like session (Mux.MuxSession, Resume.ResumableSession,
+                  Capture.CapturedConnection).
+    """
+    try:
+        conn.shutdown(socket.SHUT_RD)
+    except OSError:
+        pass  # Already closed
+
+
+class Deadlines:
+    """
+        How long the dealer waits for its players.
+    """
+
+    def __init__(self, request=10.0, turn=60.0, session=None):
+        """
+                Args:
+                    request (float): Seconds a new connection has to send its request.
+                    turn (float): Seconds a player has for every decision. A player that does not decide in time
+                                  stands, gets the result of the round and is let go.
+                    session (float): Seconds a whole session may last; at its end the player is let go like on a
+                                     turn timeout (None = no limit).
+        """
+        self.request = request
+        self.turn = turn
+        self.session = session
+
+    def session_end(self):
+        """
+                Returns:
+                    float: The deadline of a session starting now (time.monotonic), or None.
+        """
+        return None if self.session is None else time.monotonic() + self.session
+
+    def decision_end(self, session_end, turn=None):
+        """
+                The deadline of a decision asked for now.
+
+                Args:
+                    session_end (float): The session's deadline (None = no limit).
+                    turn (float): Seconds for the decision (None = self.turn).
+
+                Returns:
+                    tuple: (deadline, bool: it is the session's deadline).
+        """
+        end = time.monotonic() + (self.turn if turn is None else turn)
+        if session_end is not None and session_end <= end:
+            return session_end, True
+        return end, False
+
+    @staticmethod
+    def add_arguments(parser):
+        """
+                Adds the --*-timeout options to an argparse parser.
+        """
+        parser.add_argument("--request-timeout", type=float, default=10.0,
+                            help="seconds a new connection has to send its request")
+        parser.add_argument("--turn-timeout", type=float, default=60.0,
+                            help="seconds a player has for every decision before it stands and is let go")
+        parser.add_argument("--session-timeout", type=float, default=None,
+                            help="seconds a whole session may last (default: no limit)")
+
+    @staticmethod
+    def from_args(args):
+        """
+                Builds Deadlines from the options added by `add_arguments`.
+        """
+        return Deadlines(args.request_timeout, args.turn_timeout, args.session_timeout)
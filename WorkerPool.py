@@ -0,0 +1,109 @@
+import queue
+import threading
+import time
+
+"""
+The worker pool:
+A fixed set of threads that run the dealer's handle_player for the accepted connections, fed through a bounded
+queue. A burst of connections costs queue slots instead of new threads, and once the queue is full too the extra
+connections are refused right away, so the thread count and memory stay the same whatever the load.
+"""
+
+
+class WorkerPool:
+    """
+        Runs a handler on a fixed number of threads, for jobs waiting in a bounded queue.
+    """
+
+    def __init__(self, handler, size, queue_size=128, metrics=None):
+        """
+                Args:
+                    handler (callable): Called with the arguments of every job (e.g. Dealer.handle_player).
+                    size (int): Number of worker threads.
+                    queue_size (int): Jobs that may wait for a free worker (0 = no limit).
+                    metrics (DealerMetrics): If set, the pool's size, busy workers, queue depth and queue wait
+                                             are reported there.
+        """
+        self.handler = handler
+        self.size = size
+        self.jobs = queue.Queue(queue_size)
+        self.metrics = metrics
+        self.threads = []
+        self.lock = threading.Lock()
+
+    def start(self):
+        """
+                Starts the worker threads (once).
+        """
+        with self.lock:
+            if self.threads:
+                return
+            for index in range(self.size):
+                thread = threading.Thread(target=self.work, name=f"Dealer worker {index}")
+                thread.daemon = True
+                thread.start()
+                self.threads.append(thread)
+        if self.metrics is not None:
+            self.metrics.pool_workers.set(self.size)
+
+    def submit(self, *args):
+        """
+                Queues a job for the next free worker.
+
+                Returns:
+                    bool: False if the queue is full (the job was not taken).
+        """
+        return self.submit_call(self.handler, *args)
+
+    def submit_call(self, function, *args):
+        """
+                Queues a job that runs another function than the pool's handler (e.g. a session that waited in the
+                admission backlog).
+
+                Returns:
+                    bool: False if the queue is full (the job was not taken).
+        """
+        if not self.threads:
+            self.start()
+        try:
+            self.jobs.put_nowait((time.perf_counter(), function, args))
+        except queue.Full:
+            if self.metrics is not None:
+                self.metrics.pool_rejected.inc()
+            return False
+        if self.metrics is not None:
+            self.metrics.pool_queue_depth.set(self.jobs.qsize())
+        return True
+
+    def work(self):
+        """
+                A worker thread: runs the queued jobs one after the other, until `stop`.
+        """
+        metrics = self.metrics
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            queued_at, function, args = job
+            if metrics is not None:
+                metrics.pool_queue_depth.set(self.jobs.qsize())
+                metrics.pool_queue_wait.observe(time.perf_counter() - queued_at)
+                metrics.pool_busy.inc()
+            try:
+                function(*args)
+            except Exception:
+                pass  # The handler reports its own errors, a worker must not die of one
+            finally:
+                if metrics is not None:
+                    metrics.pool_busy.dec()
+
+    def stop(self):
+        """
+                Lets the workers finish the queued jobs and exit.
+        """
+        with self.lock:
+            threads, self.threads = self.threads, []
+        for _ in threads:
+            self.jobs.put(None)
+        for thread in threads:
+            thread.join()
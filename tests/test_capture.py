@@ -0,0 +1,40 @@
+import socket
+import threading
+
+from Capture import CaptureWriter, read_capture
+from Dealer import Dealer
+from EventLog import OFF, EventLog
+from Pacing import NoPacing
+from Player import Player
+from Replay import replay_into_dealer
+from Strategies import BasicStrategy
+
+
+def play_captured_session(dealer, capture, index, rounds):
+    """Plays one session over a loopback TCP connection, the dealer end wrapped like an accepted one."""
+    with socket.create_server(("127.0.0.1", 0)) as server:
+        player_end = socket.create_connection(server.getsockname())
+        dealer_end, addr = server.accept()
+    dealer_thread = threading.Thread(target=dealer.handle_player, args=(capture.wrap(dealer_end, addr), addr))
+    dealer_thread.start()
+    player = Player(BasicStrategy(), verbose=False, team_name=f"team{index}")
+    with player.initiate_game_over(player_end, rounds):
+        player.play_game(rounds)
+    dealer_thread.join()
+
+
+def test_captured_sessions_replay_byte_identical(tmp_path):
+    path = str(tmp_path / "traffic.cap")
+    capture = CaptureWriter(path)
+    dealer = Dealer(NoPacing(), decks=2, penetration=0.6, log=EventLog(OFF), seed=11, capture=capture)
+    for index in range(3):
+        play_captured_session(dealer, capture, index, 25)
+    capture.close()
+
+    sessions, _ = read_capture(path)
+    assert len(sessions) == 3
+    for captured in sessions:
+        result = replay_into_dealer(captured)
+        assert result is not None
+        assert result["identical"], result["difference"]
+        assert result["messages"] > 25  # The request and at least one decision per round
@@ -0,0 +1,54 @@
+import random
+
+import pytest
+
+from Cards import DECK_SIZE, Card, Hand, Shoe
+
+
+def test_shoe_never_deals_a_card_of_the_round_twice():
+    """A shoe that runs out in the middle of a round goes on with its discards, not with the cards on the table."""
+    shoe = Shoe(decks=1, penetration=1.0, rng=random.Random(7))
+    shoe.start_round()
+    for _ in range(DECK_SIZE - 2):
+        shoe.deal_code()
+    shoe.start_round()  # Two cards left: the round starts without a reshuffle
+    dealt = [shoe.deal_code() for _ in range(20)]
+    assert shoe.discards_shuffled
+    assert len(set(dealt)) == len(dealt)
+
+
+def test_shoe_with_every_card_on_the_table_raises():
+    shoe = Shoe(decks=1, penetration=1.0, rng=random.Random(7))
+    shoe.start_round()
+    for _ in range(DECK_SIZE):
+        shoe.deal_one()
+    with pytest.raises(RuntimeError):
+        shoe.deal_one()
+
+
+def test_start_round_reshuffles_once_the_cut_card_is_out():
+    shoe = Shoe(decks=2, penetration=0.5, rng=random.Random(7))
+    for _ in range(DECK_SIZE):
+        shoe.deal_code()
+    assert shoe.start_round()
+    assert len(shoe.cards) == 2 * DECK_SIZE
+
+
+def hand(*ranks):
+    return Hand(Card.lookup(1, rank) for rank in ranks)
+
+
+@pytest.mark.parametrize("ranks, total, soft", [
+    ((1, 6), 17, True),  # A-6 is a soft 17
+    ((1, 6, 10), 17, False),  # The ace drops to 1 instead of busting
+    ((1, 1), 12, True),  # Only one ace counts 11
+    ((1, 1, 9), 21, True),
+    ((10, 6, 1), 17, False),
+    ((10, 13), 20, False),
+    ((10, 12, 2), 22, False),
+])
+def test_soft_ace_totals(ranks, total, soft):
+    h = hand(*ranks)
+    assert h.total == total
+    assert h.soft == soft
+    assert h.is_bust() == (total > 21)
@@ -0,0 +1,41 @@
+import socket
+
+import pytest
+
+from Mux import MuxConnection, MuxDemultiplexer
+
+
+@pytest.fixture
+def connection():
+    """A MuxConnection on one end of a socket pair, without its reader thread."""
+    ours, theirs = socket.socketpair()
+    conn = MuxConnection("127.0.0.1", 0)
+    conn.sock = ours
+    conn.demux = MuxDemultiplexer(ours, from_dealer=True)
+    yield conn
+    ours.close()
+    theirs.close()
+
+
+def test_session_ids_wrap_around(connection):
+    connection.next_session_id = 65535
+    assert connection.open_session().session_id == 65535
+    assert connection.open_session().session_id == 0
+
+
+def test_wrapped_ids_skip_open_sessions(connection):
+    connection.open_session()  # 0
+    held = connection.open_session()  # 1, still open when the ids come around again
+    connection.open_session().close()  # 2
+    connection.next_session_id = 65535
+    assert connection.open_session().session_id == 65535
+    assert [connection.open_session().session_id for _ in range(2)] == [2, 3]
+    held.close()
+    connection.next_session_id = 1
+    assert connection.open_session().session_id == 1
+
+
+def test_every_id_in_use_raises(connection):
+    connection.demux.sessions = dict.fromkeys(range(65536))
+    with pytest.raises(RuntimeError):
+        connection.open_session()
@@ -0,0 +1,66 @@
+import socket
+
+import pytest
+
+from Protocol import MSG_TYPE_SESSION, SESSION_STRUCT
+from Resume import SessionRegistry
+
+
+def read_exact(sock, n):
+    data = bytearray()
+    while len(data) < n:
+        chunk = sock.recv(n - len(data))
+        assert chunk, "connection closed"
+        data += chunk
+    return bytes(data)
+
+
+@pytest.fixture
+def session():
+    """A resumable session on one end of a socket pair, its token message already read by the player end."""
+    dealer_end, player_end = socket.socketpair()
+    player_end.settimeout(5)
+    registry = SessionRegistry(grace=1.0)
+    session = registry.open(dealer_end, "team")
+    read_exact(player_end, SESSION_STRUCT.size)
+    yield registry, session, player_end
+    session.close()
+    player_end.close()
+
+
+def resume(registry, session, received):
+    """Resumes the session on a new socket pair. Returns the resumed session and both ends."""
+    dealer_end, player_end = socket.socketpair()
+    player_end.settimeout(5)
+    return registry.resume(session.token, dealer_end, received), dealer_end, player_end
+
+
+def test_resume_sends_what_the_player_missed(session):
+    registry, session, player_end = session
+    session.sendall(b"0123456789")
+    player_end.sendall(b"abcd")
+    view = memoryview(bytearray(4))
+    assert session.recv_into(view, 4) == 4
+
+    resumed, dealer_end, new_end = resume(registry, session, 6)
+    with dealer_end, new_end:
+        assert resumed is session
+        _, msg_type, token, received = SESSION_STRUCT.unpack(read_exact(new_end, SESSION_STRUCT.size))
+        assert (msg_type, token, received) == (MSG_TYPE_SESSION, session.token, 4)
+        assert read_exact(new_end, 4) == b"6789"
+
+
+def test_resume_past_what_was_sent_is_refused(session):
+    registry, session, player_end = session
+    session.sendall(b"0123")
+    resumed, dealer_end, new_end = resume(registry, session, 5)
+    dealer_end.close()
+    new_end.close()
+    assert resumed is None
+
+
+def test_unknown_token_is_refused(session):
+    registry, _, _ = session
+    dealer_end, player_end = socket.socketpair()
+    with dealer_end, player_end:
+        assert registry.resume(b"\0" * 16, dealer_end, 0) is None